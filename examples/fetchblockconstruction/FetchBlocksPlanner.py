@@ -270,6 +270,34 @@ def get_planner_state(num_block, obs):
     return state, goal
 
 
+def compute_block_rewards(achieved_goals, desired_goals, num_blocks,
+                          distance_threshold=goal_threshold):
+    """
+    Batched version of the incremental reward of the FetchBlockConstruction
+    envs for goals made of `num_blocks` block positions followed by the arm
+    position, e.g. the (block, arm) goals of get_abstract_dict.
+
+    Each block farther than `distance_threshold` from its goal costs -1. If
+    every block is placed, the reward is 1 when the arm is more than twice
+    the threshold away from all block goals and 0 otherwise.
+
+    :param achieved_goals: (batch_size, 3 * (num_blocks + 1)) array
+    :param desired_goals: (batch_size, 3 * (num_blocks + 1)) array
+    :return: (batch_size, 1) array of rewards
+    """
+    achieved_xyz = achieved_goals.reshape((-1, num_blocks + 1, 3))
+    desired_xyz = desired_goals.reshape((-1, num_blocks + 1, 3))
+    block_distances = np.linalg.norm(
+        achieved_xyz[:, :-1] - desired_xyz[:, :-1], axis=-1)
+    rewards = -np.sum(block_distances > distance_threshold, axis=1)
+    arm_distances = np.linalg.norm(
+        achieved_xyz[:, -1:] - desired_xyz[:, :-1], axis=-1)
+    arm_far_from_goals = np.all(
+        arm_distances > 2 * distance_threshold, axis=1)
+    rewards = np.where(rewards == 0, arm_far_from_goals, rewards)
+    return rewards.astype(np.float32).reshape(-1, 1)
+
+
 class FetchBlocksPlanner:
 
     def __init__(self, env,
@@ -302,6 +330,17 @@ class FetchBlocksPlanner:
         self.wait = wait_steps
         self._counter = 0
         self.achieved_goal_key = achieved_goal_key
+        self.distance_threshold = getattr(
+            env.unwrapped, 'distance_threshold', goal_threshold)
+
+    def compute_rewards(self, actions, obs_dict):
+        '''Batched rewards of abstract (block + arm) goals, for relabeling'''
+        return compute_block_rewards(
+            obs_dict[self.achieved_goal_key],
+            obs_dict[self.desired_goal_key],
+            num_blocks=1,
+            distance_threshold=self.distance_threshold,
+        )
 
     def set_goal(self, _goal):
         self.goal = _goal
@@ -18,6 +18,8 @@ from rlkit.data_management.obs_dict_replay_buffer import ObsDictRelabelingBuffer
 from rlkit.launchers.launcher_util import run_experiment
 from rlkit.samplers.data_collector import RePReLGoalConditionedPathCollector
 from rlkit.torch.data_management.normalizer import CompositeNormalizer
+from rlkit.torch.distributed import launch_data_parallel
+from rlkit.torch.optim.distributed_adam import DistributedAdam
 from rlkit.torch.optim.mpi_adam import MpiAdam
 from rlkit.torch.relational.networks import *
 from rlkit.torch.reprel.reprel_her import RePReLHERTrainer
@@ -198,6 +200,7 @@ def experiment(variant):
             desired_goal_key=desired_goal_key,
             achieved_goal_key=achieved_goal_key,
             ob_spaces=ob_space,
+            compute_rewards_fn=expl_planner.compute_rewards,
             **variant['replay_buffer_kwargs']
         )
 
@@ -208,7 +211,7 @@ def experiment(variant):
         operator_target_qf1s=operator_target_qf1s,
         operator_target_qf2s=operator_target_qf2s,
         operator_policies=operator_policies,
-        optimizer_class=MpiAdam,
+        optimizer_class=variant['optimizer_class'],
         **variant['sac_trainer_kwargs']
     )
     expl_path_collector = RePReLGoalConditionedPathCollector(
@@ -247,6 +250,20 @@ def experiment(variant):
     algorithm.train()
 
 
+def run(exp_prefix, variant, gpu_mode):
+    if gpu_mode:
+        ptu.set_gpu_mode(gpu_mode)
+    run_experiment(experiment,
+                   exp_prefix=exp_prefix,
+                   variant=variant,
+                   use_gpu=gpu_mode,
+                   snapshot_mode='gap_and_last',
+                   snapshot_gap=100,
+                   exp_id=os.getpid(),
+                   base_log_dir=f"data/reprel_task1/",
+                   prepend_date_to_exp_prefix=True)
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
@@ -300,6 +317,12 @@ if __name__ == "__main__":
                         default=256,
                         help="Batch size")
 
+    parser.add_argument("--num-processes",
+                        type=int,
+                        default=1,
+                        help="Train data-parallel in this many local processes "
+                             "with DistributedAdam, without mpirun")
+
     args = parser.parse_args()
 
     action_dim = 4
@@ -349,19 +372,16 @@ if __name__ == "__main__":
         ),
         recurrent_graph=args.recurrent_graph,
         planner=FetchBlocksPlanner,
-        terminal_reward=1
+        terminal_reward=1,
+        optimizer_class=DistributedAdam if args.num_processes > 1 else MpiAdam,
     )
     exp_prefix = F"reprel_task1_stack{args.num_blocks}_numrelblocks{args.num_relational_blocks}_nqh{args.num_query_heads}_{args.stack_only}stackonly_recurrent{args.recurrent_graph}"
     gpu_mode=False
     if torch.cuda.is_available():
         ptu.set_gpu_mode('gpu')  # optionally set the GPU (default=False)
         gpu_mode = 'gpu'
-    run_experiment(experiment,
-                   exp_prefix=exp_prefix,
-                   variant=variant,
-                   use_gpu=gpu_mode,
-                   snapshot_mode='gap_and_last',
-                   snapshot_gap=100,
-                   exp_id=os.getpid(),
-                   base_log_dir=f"data/reprel_task1/",
-                   prepend_date_to_exp_prefix=True)
+    if args.num_processes > 1:
+        launch_data_parallel(run, args.num_processes,
+                             args=(exp_prefix, variant, gpu_mode))
+    else:
+        run(exp_prefix, variant, gpu_mode)
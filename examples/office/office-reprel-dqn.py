@@ -46,7 +46,8 @@ def experiment(variant):
             max_replay_buffer_size=variant['replay_buffer_size'],
             observation_dim=obs_dim,
             action_dim=action_dim,
-            env_info_sizes={})
+            env_info_sizes={},
+            dedup_observations=True)
     if variant['epsilon_decay']:
         exploration_strategy = EpsilonGreedyWithDecay(
             action_space=expl_env.action_space, num_epochs=variant['algorithm_kwargs']['num_epochs']
@@ -133,6 +134,9 @@ if __name__ == "__main__":
 
     parser.add_argument('--decay-epsilon', action='store_true', default=False,
                         help="enable the epsilon decay strategy for exploration")
+    parser.add_argument("--mixed-precision",
+                        action="store_true",
+                        help="Compute the losses under bfloat16 autocast")
 
     args = parser.parse_args()
 
@@ -156,6 +160,7 @@ if __name__ == "__main__":
         trainer_kwargs=dict(
             discount=0.99,
             learning_rate=args.learning_rate,
+            mixed_precision=args.mixed_precision,
         ),
         terminal_reward=30,
         planner=OfficePlanner
@@ -39,7 +39,8 @@ def experiment(variant):
             max_replay_buffer_size=variant['replay_buffer_size'],
             observation_dim=obs_dim,
             action_dim=action_dim,
-            env_info_sizes={})
+            env_info_sizes={},
+            dedup_observations=True)
     if variant['epsilon_decay']:
         exploration_strategy = EpsilonGreedyWithDecay(
             action_space=expl_env.action_space, num_epochs=variant['algorithm_kwargs']['num_epochs']
@@ -10,12 +10,15 @@ from rlkit.exploration_strategies.base import \
 from rlkit.exploration_strategies.epsilon_greedy import EpsilonGreedy, EpsilonGreedyWithDecay
 from rlkit.policies.argmax import ArgmaxDiscretePolicy
 from rlkit.torch.reprel.reprel_dqn import RePReLDQNTrainer
+from rlkit.torch.core import np_to_pytorch_batch
 from rlkit.torch.networks import Mlp
 import rlkit.torch.pytorch_util as ptu
 from rlkit.data_management.simple_replay_buffer import SimpleReplayBuffer, SimpleReplayBufferDiscreteAction
+from rlkit.data_management.prioritized_replay_buffer import PrioritizedReplayBufferDiscreteAction
 from rlkit.launchers.launcher_util import setup_logger
 from rlkit.samplers.data_collector.reprel_path_collector import RePReLPathCollector
 from rlkit.core.reprel_algorithm import RePReLAlgorithm
+from rlkit.core.update_scheduler import AdaptiveUpdateScheduler
 import taxi_domain
 import torch
 import argparse
@@ -31,6 +34,10 @@ def experiment(variant):
     operators = expl_planner.get_operators()
     dims = expl_planner.dims
     operator_qfs, operator_target_qfs, replay_buffers = {}, {}, {}
+    if variant['prioritized_replay']:
+        replay_buffer_class = PrioritizedReplayBufferDiscreteAction
+    else:
+        replay_buffer_class = SimpleReplayBufferDiscreteAction
     for operator in operators:
         obs_dim, action_dim = dims[operator]
         operator_qfs[operator] = Mlp(
@@ -43,11 +50,12 @@ def experiment(variant):
             input_size=obs_dim,
             output_size=action_dim,
         )
-        replay_buffers[operator] = SimpleReplayBufferDiscreteAction(
+        replay_buffers[operator] = replay_buffer_class(
             max_replay_buffer_size=variant['replay_buffer_size'],
             observation_dim=obs_dim,
             action_dim=action_dim,
-            env_info_sizes={})
+            env_info_sizes={},
+            pack_observations=True)
 
     exploration_strategy = EpsilonGreedy(
         action_space=expl_env.action_space,
@@ -67,9 +75,15 @@ def experiment(variant):
     trainer = RePReLDQNTrainer(
         operator_qfs,
         operator_target_qfs,
+        replay_buffers=replay_buffers,
         **variant['trainer_kwargs']
     )
 
+    if variant['adaptive_updates']:
+        update_scheduler = AdaptiveUpdateScheduler(
+            **variant['update_scheduler_kwargs'])
+    else:
+        update_scheduler = None
     algorithm = RePReLAlgorithm(
         trainer=trainer,
         exploration_env=expl_env,
@@ -77,6 +91,7 @@ def experiment(variant):
         exploration_data_collector=expl_path_collector,
         evaluation_data_collector=eval_path_collector,
         replay_buffers=replay_buffers,
+        update_scheduler=update_scheduler,
         **variant['algorithm_kwargs']
     )
     algorithm.to(ptu.device)
@@ -125,6 +140,26 @@ if __name__ == "__main__":
                         type=int,
                         default=128,
                         help="Batch size")
+    parser.add_argument("--prioritized-replay",
+                        action="store_true",
+                        help="Use prioritized replay buffers")
+    parser.add_argument("--prefetch-batches",
+                        type=int,
+                        default=0,
+                        help="Number of batches to sample ahead on a background thread")
+    parser.add_argument("--stack-operator-qfs",
+                        action="store_true",
+                        help="Train all operator Q-networks as one stacked network")
+    parser.add_argument("--adaptive-updates",
+                        action="store_true",
+                        help="Allocate gradient steps per operator from its new data and TD errors")
+    parser.add_argument("--update-to-data-ratio",
+                        type=float,
+                        default=None,
+                        help="Gradient steps per new transition of an operator with --adaptive-updates")
+    parser.add_argument("--mixed-precision",
+                        action="store_true",
+                        help="Compute the losses under bfloat16 autocast")
 
     args = parser.parse_args()
 
@@ -135,6 +170,11 @@ if __name__ == "__main__":
         env=args.env,
         net_arch=[args.num_hidden_units for _ in range(args.num_hidden_layers)],
         replay_buffer_size=int(args.buffer_size),
+        prioritized_replay=args.prioritized_replay,
+        adaptive_updates=args.adaptive_updates,
+        update_scheduler_kwargs=dict(
+            update_to_data_ratio=args.update_to_data_ratio,
+        ),
         algorithm_kwargs=dict(
             num_epochs=args.total_epochs,
             num_eval_steps_per_epoch=1000,
@@ -143,11 +183,15 @@ if __name__ == "__main__":
             min_num_steps_before_training=1000,
             max_path_length=args.max_episode_length,
             batch_size=args.batch_size,
+            num_prefetch_batches=args.prefetch_batches,
+            prefetch_transform=np_to_pytorch_batch,
         ),
         terminal_reward=30,
         trainer_kwargs=dict(
             discount=0.99,
             learning_rate=args.learning_rate,
+            stack_operator_qfs=args.stack_operator_qfs,
+            mixed_precision=args.mixed_precision,
         ),
         planner=TaxiPlanner
     )
@@ -40,7 +40,8 @@ def experiment(variant):
             max_replay_buffer_size=variant['replay_buffer_size'],
             observation_dim=obs_dim,
             action_dim=action_dim,
-            env_info_sizes={})
+            env_info_sizes={},
+            pack_observations=True)
     exploration_strategy = EpsilonGreedy(
         action_space=expl_env.action_space,
     )
@@ -106,6 +106,10 @@ def experiment(variant):
             observation_dim=obs_dim,
             action_dim=action_dim,
             env_info_sizes={})
+    if variant['compile_networks']:
+        for operator in operators:
+            compile_relational_network(operator_qfs[operator])
+            compile_relational_network(operator_target_qfs[operator])
     if variant['epsilon_decay']:
         exploration_strategy = EpsilonGreedyWithDecay(
             action_space=expl_env.action_space, explore_ratio=variant['exploration_ratio'],
@@ -204,6 +208,9 @@ if __name__ == "__main__":
     parser.add_argument('--decay-epsilon', action='store_true', default=False,
                         help="Use epsilon decay")
 
+    parser.add_argument('--compile', action='store_true', default=False,
+                        help="Compile the Q-networks with torch.compile")
+
     args = parser.parse_args()
 
     # noinspection PyTypeChecker
@@ -234,7 +241,8 @@ if __name__ == "__main__":
         terminal_reward=30,
         num_relational_blocks=2,
         epsilon_decay=args.decay_epsilon,
-        exploration_ratio=args.exploration_ratio
+        exploration_ratio=args.exploration_ratio,
+        compile_networks=args.compile,
     )
     exp_id = os.getpid()
     setup_logger(variant['version'], variant=variant, snapshot_mode="gap_and_last", snapshot_gap=20, exp_id=exp_id)
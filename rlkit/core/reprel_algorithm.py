@@ -1,16 +1,15 @@
 import abc
+import os.path as osp
 from collections import OrderedDict
 import gtimer as gt
 from rlkit.core.rl_algorithm import BaseRLAlgorithm
+from rlkit.core.update_scheduler import spread_updates
+from rlkit.data_management.batch_prefetcher import BatchPrefetcher
 from rlkit.data_management.replay_buffer import ReplayBuffer
 from rlkit.samplers.data_collector import PathCollector
 
 from rlkit.core import logger, eval_util
-
-try:
-    from mpi4py import MPI
-except ImportError:
-    MPI = None
+from rlkit.torch import distributed
 
 def _get_epoch_timings():
     times_itrs = gt.get_times().stamps.itrs
@@ -43,7 +42,39 @@ class RePReLAlgorithm(BaseRLAlgorithm):
             num_trains_per_train_loop,
             num_train_loops_per_epoch=1,
             min_num_steps_before_training=0,
+            num_prefetch_batches=0,
+            prefetch_seed=None,
+            prefetch_transform=None,
+            replay_buffer_checkpoint_dir=None,
+            batch_sampler=None,
+            update_scheduler=None,
     ):
+        """
+        :param num_prefetch_batches: If positive, the minibatches of up to
+        this many upcoming gradient steps are sampled on a background thread
+        while the trainer runs. See BatchPrefetcher.
+        :param prefetch_seed: Seed of the background sampling.
+        :param prefetch_transform: Applied to every operator batch on the
+        background thread, e.g. rlkit.torch.core.np_to_pytorch_batch.
+        :param replay_buffer_checkpoint_dir: If set, every replay buffer is
+        checkpointed to a subdirectory of this directory at the end of each
+        epoch, and restored from it when training resumes with
+        `train(start_epoch)`. Relative paths are interpreted relative to the
+        logger's snapshot directory, so pass an absolute path to resume into
+        a new log directory.
+        :param batch_sampler: Optional object whose `random_batches(batch_size)`
+        returns the minibatches of all operators at once, e.g.
+        rlkit.torch.data_management.multi_operator_sampler.MultiOperatorBatchSampler.
+        :param update_scheduler: Optional UpdateScheduler that allocates the
+        gradient steps and batch sizes of every operator in each train loop,
+        instead of `num_trains_per_train_loop` steps for all operators with
+        data. The TD errors of trainers with a `td_error_tracker` are passed
+        to it before every allocation.
+
+        In a data-parallel run, see rlkit.torch.distributed, only the
+        operators that have data on every process are trained, and every
+        process follows the schedule of the first one.
+        """
         super().__init__(
             trainer,
             exploration_env,
@@ -62,17 +93,123 @@ class RePReLAlgorithm(BaseRLAlgorithm):
         self.num_train_loops_per_epoch = num_train_loops_per_epoch
         self.num_expl_steps_per_train_loop = num_expl_steps_per_train_loop
         self.min_num_steps_before_training = min_num_steps_before_training
+        if num_prefetch_batches > 0:
+            self.batch_prefetcher = BatchPrefetcher(
+                replay_buffers,
+                batch_size,
+                max_queue_size=num_prefetch_batches,
+                seed=prefetch_seed,
+                transform=prefetch_transform,
+                sampler=batch_sampler,
+            )
+        else:
+            self.batch_prefetcher = None
+        self.replay_buffer_checkpoint_dir = replay_buffer_checkpoint_dir
+        self.batch_sampler = batch_sampler
+        self.update_scheduler = update_scheduler
+        self._num_new_samples = {}
         gt.reset_root()
 
+    def _replay_buffer_checkpoint_dir(self, operator):
+        directory = osp.join(self.replay_buffer_checkpoint_dir, str(operator))
+        if distributed.get_world_size() > 1:
+            # Every worker has its own replay buffers.
+            directory = osp.join(
+                directory, 'rank{}'.format(distributed.get_rank()))
+        return directory
+
+    def _resume_replay_buffers(self):
+        """
+        :return: True if the replay buffers were restored from checkpoints.
+        """
+        if self.replay_buffer_checkpoint_dir is None or self._start_epoch == 0:
+            return False
+        for operator, replay_buffer in self.replay_buffers.items():
+            replay_buffer.load_checkpoint(
+                self._replay_buffer_checkpoint_dir(operator))
+        return True
+
+    def _add_paths(self, paths_all):
+        for operator, replay_buffer in self.replay_buffers.items():
+            replay_buffer.add_paths(paths_all[operator])
+            self._num_new_samples[operator] = (
+                self._num_new_samples.get(operator, 0)
+                + sum(len(path['rewards']) for path in paths_all[operator])
+            )
+
+    def _trainable_replay_buffers(self):
+        """
+        :return: Dict from operator to replay buffer of the operators that
+        have data on every process of a data-parallel run, which all
+        processes have to train together.
+        """
+        has_data = distributed.all_reduce_min([
+            replay_buffer._size > 0
+            for replay_buffer in self.replay_buffers.values()
+        ])
+        return OrderedDict(
+            (operator, replay_buffer)
+            for (operator, replay_buffer), ready
+            in zip(self.replay_buffers.items(), has_data)
+            if ready
+        )
+
+    def _batch_schedule(self):
+        """
+        :return: List with the batch sizes of one trainer call per entry,
+        either None for `batch_size` for every operator with data or a dict
+        from operator to its batch size.
+        """
+        data_parallel = distributed.get_world_size() > 1
+        if self.update_scheduler is None:
+            if not data_parallel:
+                return [None] * self.num_trains_per_train_loop
+            batch_sizes = OrderedDict(
+                (operator, self.batch_size)
+                for operator in self._trainable_replay_buffers()
+            )
+            return [batch_sizes] * self.num_trains_per_train_loop
+        td_error_tracker = getattr(self.trainer, 'td_error_tracker', None)
+        if td_error_tracker is not None:
+            self.update_scheduler.observe_td_errors(td_error_tracker.pop())
+        allocation = self.update_scheduler.allocate(
+            self._trainable_replay_buffers() if data_parallel
+            else self.replay_buffers,
+            self._num_new_samples,
+            self.num_trains_per_train_loop,
+            self.batch_size,
+        )
+        self._num_new_samples = {}
+        if data_parallel:
+            # The schedules of the processes depend on their own data, so all
+            # of them follow the first one.
+            allocation = distributed.broadcast_object(allocation)
+        return spread_updates(allocation)
+
+    def _sample_train_data(self, batch_sizes):
+        if self.batch_sampler is not None:
+            return self.batch_sampler.random_batches(
+                self.batch_size if batch_sizes is None else batch_sizes)
+        train_data = {}
+        for operator, replay_buffer in self.replay_buffers.items():
+            if batch_sizes is None:
+                if replay_buffer._size > 0:
+                    train_data[operator] = replay_buffer.random_batch(
+                        self.batch_size)
+            elif operator in batch_sizes:
+                train_data[operator] = replay_buffer.random_batch(
+                    batch_sizes[operator])
+        return train_data
+
     def _train(self):
-        if self.min_num_steps_before_training > 0:
+        resumed = self._resume_replay_buffers()
+        if self.min_num_steps_before_training > 0 and not resumed:
             init_expl_paths_all = self.expl_data_collector.collect_new_paths(
                 self.max_path_length,
                 self.min_num_steps_before_training,
                 discard_incomplete_paths=False,
             )
-            for operator in self.replay_buffers.keys():
-                self.replay_buffers[operator].add_paths(init_expl_paths_all[operator])
+            self._add_paths(init_expl_paths_all)
 
             self.expl_data_collector.end_epoch(-1)
 
@@ -95,19 +232,23 @@ class RePReLAlgorithm(BaseRLAlgorithm):
                 )
                 gt.stamp('exploration sampling', unique=False)
 
-                for operator in self.replay_buffers.keys():
-                    self.replay_buffers[operator].add_paths(new_expl_paths_all[operator])
+                self._add_paths(new_expl_paths_all)
 
                 gt.stamp('data storing', unique=False)
 
                 self.training_mode(True)
-                for _ in range(self.num_trains_per_train_loop):
-                    train_data = {}
-                    for operator, replay_buffer in self.replay_buffers.items():
-                        if replay_buffer._size > 0:
-                            train_data[operator] = replay_buffer.random_batch(
-                                self.batch_size)
+                batch_schedule = self._batch_schedule()
+                if self.batch_prefetcher is not None:
+                    self.batch_prefetcher.start(
+                        len(batch_schedule), batch_schedule)
+                for batch_sizes in batch_schedule:
+                    if self.batch_prefetcher is not None:
+                        train_data = self.batch_prefetcher.get()
+                    else:
+                        train_data = self._sample_train_data(batch_sizes)
                     _ = self.trainer.train(train_data)
+                if self.batch_prefetcher is not None:
+                    self.batch_prefetcher.join()
                 gt.stamp('training', unique=False)
                 self.training_mode(False)
 
@@ -129,6 +270,18 @@ class RePReLAlgorithm(BaseRLAlgorithm):
                     prefix=f'replay_buffer/{key}/'
             )
 
+        if self.batch_prefetcher is not None:
+            logger.record_dict(
+                self.batch_prefetcher.get_diagnostics(),
+                prefix='batch_prefetcher/'
+            )
+
+        if self.update_scheduler is not None:
+            logger.record_dict(
+                self.update_scheduler.get_diagnostics(),
+                prefix='update_scheduler/'
+            )
+
         """
         Trainer
         """
@@ -184,12 +337,7 @@ class RePReLAlgorithm(BaseRLAlgorithm):
 
 
     def _end_epoch(self, epoch):
-        if MPI:
-            if MPI.COMM_WORLD.Get_rank() == 0:
-                snapshot = self._get_snapshot()
-                logger.save_itr_params(epoch, snapshot)
-                gt.stamp('saving')
-        else:
+        if distributed.is_main_process():
             snapshot = self._get_snapshot()
             logger.save_itr_params(epoch, snapshot)
             gt.stamp('saving')
@@ -199,6 +347,12 @@ class RePReLAlgorithm(BaseRLAlgorithm):
         self.eval_data_collector.end_epoch(epoch)
         for key, buffer in self.replay_buffers.items():
             buffer.end_epoch(epoch)
+            if self.replay_buffer_checkpoint_dir is not None:
+                buffer.save_checkpoint(self._replay_buffer_checkpoint_dir(key))
+        if self.batch_prefetcher is not None:
+            self.batch_prefetcher.end_epoch(epoch)
+        if self.update_scheduler is not None:
+            self.update_scheduler.end_epoch(epoch)
         self.trainer.end_epoch(epoch)
 
         for post_epoch_func in self.post_epoch_funcs:
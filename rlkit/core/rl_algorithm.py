@@ -6,11 +6,7 @@ import gtimer as gt
 from rlkit.core import logger, eval_util
 from rlkit.data_management.replay_buffer import ReplayBuffer
 from rlkit.samplers.data_collector import DataCollector
-
-try:
-    from mpi4py import MPI
-except ImportError:
-    MPI = None
+from rlkit.torch import distributed
 
 def _get_epoch_timings():
     times_itrs = gt.get_times().stamps.itrs
@@ -47,7 +43,10 @@ class BaseRLAlgorithm(object, metaclass=abc.ABCMeta):
 
     def train(self, start_epoch=0):
         self._start_epoch = start_epoch
-        self._train()
+        try:
+            self._train()
+        finally:
+            self.trainer.end_training()
 
     def _train(self):
         """
@@ -56,11 +55,7 @@ class BaseRLAlgorithm(object, metaclass=abc.ABCMeta):
         raise NotImplementedError('_train must implemented by inherited class')
 
     def _end_epoch(self, epoch):
-        if MPI:
-            if MPI.COMM_WORLD.Get_rank() == 0:
-                snapshot = self._get_snapshot()
-                logger.save_itr_params(epoch, snapshot)
-        else:
+        if distributed.is_main_process():
             snapshot = self._get_snapshot()
             logger.save_itr_params(epoch, snapshot)
         gt.stamp('saving')
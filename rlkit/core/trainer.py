@@ -9,6 +9,12 @@ class Trainer(object, metaclass=abc.ABCMeta):
     def end_epoch(self, epoch):
         pass
 
+    def end_training(self):
+        """
+        Called once training has finished, to release e.g. worker threads.
+        """
+        pass
+
     def get_snapshot(self):
         return {}
 
@@ -0,0 +1,231 @@
+import abc
+from collections import OrderedDict
+
+import numpy as np
+
+
+class TDErrorTracker(object):
+    """
+    Accumulates the critic loss (the mean squared TD error) of every operator
+    over the gradient steps of a train loop.
+
+    The losses may be tensors on the device. They are only summed there, and
+    converted to floats once per `pop`.
+    """
+
+    def __init__(self):
+        self._sums = {}
+        self._counts = {}
+
+    def add(self, operator, td_error):
+        self._sums[operator] = self._sums.get(operator, 0) + td_error
+        self._counts[operator] = self._counts.get(operator, 0) + 1
+
+    def pop(self):
+        """
+        :return: Dict from operator to its mean TD error since the last call.
+        """
+        td_errors = {
+            operator: float(total) / self._counts[operator]
+            for operator, total in self._sums.items()
+        }
+        self._sums = {}
+        self._counts = {}
+        return td_errors
+
+
+class UpdateScheduler(object, metaclass=abc.ABCMeta):
+    """
+    Decides how many gradient steps, and with which batch size, every
+    operator gets in a train loop of RePReLAlgorithm.
+    """
+
+    @abc.abstractmethod
+    def allocate(self, replay_buffers, num_new_samples, num_trains, batch_size):
+        """
+        :param replay_buffers: Dict from operator to replay buffer.
+        :param num_new_samples: Dict from operator to the number of
+        transitions added to its buffer since the last allocation.
+        :param num_trains: The train loop's num_trains_per_train_loop.
+        :param batch_size: The algorithm's batch size.
+        :return: OrderedDict from operator to (number of gradient steps,
+        batch size).
+        """
+        pass
+
+    def observe_td_errors(self, td_errors):
+        """
+        :param td_errors: Dict from operator to its mean TD error in the last
+        train loop, see TDErrorTracker.
+        """
+        pass
+
+    def get_diagnostics(self):
+        return OrderedDict()
+
+    def end_epoch(self, epoch):
+        pass
+
+
+def spread_updates(allocation):
+    """
+    Spread the allocated gradient steps of every operator evenly over the
+    train loop.
+
+    :param allocation: OrderedDict from operator to (number of gradient
+    steps, batch size), as returned by UpdateScheduler.allocate.
+    :return: List with one dict from operator to batch size per trainer
+    call. Every operator with steps is part of the first call.
+    """
+    num_calls = max([num_steps for num_steps, _ in allocation.values()] + [0])
+    schedule = [OrderedDict() for _ in range(num_calls)]
+    for operator, (num_steps, batch_size) in allocation.items():
+        if num_steps <= 0:
+            continue
+        calls = np.arange(num_calls)
+        is_step = (
+            np.ceil((calls + 1) * num_steps / num_calls)
+            > np.ceil(calls * num_steps / num_calls)
+        )
+        for call in np.flatnonzero(is_step):
+            schedule[call][operator] = batch_size
+    return schedule
+
+
+def _apportion(total, weights):
+    # Largest remainder method, so that the steps add up to `total`.
+    raw = total * weights / weights.sum()
+    steps = np.floor(raw).astype(int)
+    remainder = int(total - steps.sum())
+    if remainder > 0:
+        steps[np.argsort(steps - raw)[:remainder]] += 1
+    return steps
+
+
+class AdaptiveUpdateScheduler(UpdateScheduler):
+    """
+    Allocates gradient steps in proportion to the new data of every operator,
+    scaled up for operators whose TD error is rising and down for those whose
+    TD error is falling.
+
+    Without `update_to_data_ratio`, the train loop keeps the compute of the
+    fixed schedule, `num_trains` steps for every operator with data, and only
+    redistributes it between the operators.
+    """
+
+    def __init__(
+            self,
+            update_to_data_ratio=None,
+            min_steps=1,
+            max_steps=None,
+            max_batch_size=None,
+            td_error_smoothing=0.9,
+            td_trend_weight=1.0,
+            max_td_trend_factor=2.0,
+    ):
+        """
+        :param update_to_data_ratio: If set, every operator gets this many
+        gradient steps per new transition of its own.
+        :param min_steps: Steps of every operator with data, even without
+        new transitions.
+        :param max_steps: Optional limit on the steps of an operator.
+        :param max_batch_size: If set, an operator whose steps are cut by
+        `max_steps` gets proportionally larger batches, up to this size.
+        :param td_error_smoothing: Decay of the moving average that the TD
+        error of the last train loop is compared against.
+        :param td_trend_weight: Exponent of the ratio of the last TD error to
+        its moving average. 0 ignores the TD errors.
+        :param max_td_trend_factor: The TD trend scales the steps by at most
+        this factor, or its inverse.
+        """
+        self.update_to_data_ratio = update_to_data_ratio
+        self.min_steps = min_steps
+        self.max_steps = max_steps
+        self.max_batch_size = max_batch_size
+        self.td_error_smoothing = td_error_smoothing
+        self.td_trend_weight = td_trend_weight
+        self.max_td_trend_factor = max_td_trend_factor
+        self._td_error_averages = {}
+        self._td_trend_factors = {}
+        self._epoch_steps = OrderedDict()
+        self._epoch_new_samples = OrderedDict()
+        self._batch_sizes = OrderedDict()
+        self._num_allocations = 0
+
+    def observe_td_errors(self, td_errors):
+        for operator, td_error in td_errors.items():
+            average = self._td_error_averages.get(operator, td_error)
+            if average > 0:
+                trend = (td_error / average) ** self.td_trend_weight
+            else:
+                trend = 1.
+            self._td_trend_factors[operator] = float(np.clip(
+                trend,
+                1. / self.max_td_trend_factor,
+                self.max_td_trend_factor,
+            ))
+            self._td_error_averages[operator] = (
+                self.td_error_smoothing * average
+                + (1 - self.td_error_smoothing) * td_error
+            )
+
+    def allocate(self, replay_buffers, num_new_samples, num_trains, batch_size):
+        operators = [
+            operator for operator, replay_buffer in replay_buffers.items()
+            if replay_buffer._size > 0
+        ]
+        allocation = OrderedDict()
+        if not operators:
+            return allocation
+        new_samples = np.array([
+            num_new_samples.get(operator, 0) for operator in operators
+        ], dtype=np.float64)
+        trend_factors = np.array([
+            self._td_trend_factors.get(operator, 1.) for operator in operators
+        ])
+        weights = new_samples * trend_factors
+        if self.update_to_data_ratio is not None:
+            desired_steps = np.round(
+                self.update_to_data_ratio * weights).astype(int)
+        else:
+            if weights.sum() == 0:
+                weights = trend_factors
+            desired_steps = _apportion(num_trains * len(operators), weights)
+        desired_steps = np.maximum(desired_steps, self.min_steps)
+        if self.max_steps is not None:
+            steps = np.minimum(desired_steps, self.max_steps)
+        else:
+            steps = desired_steps
+
+        for i, operator in enumerate(operators):
+            operator_batch_size = batch_size
+            if self.max_batch_size is not None and 0 < steps[i] < desired_steps[i]:
+                operator_batch_size = min(
+                    self.max_batch_size,
+                    int(batch_size * desired_steps[i] / steps[i]),
+                )
+            allocation[operator] = (int(steps[i]), operator_batch_size)
+            self._epoch_steps[operator] = \
+                self._epoch_steps.get(operator, 0) + int(steps[i])
+            self._epoch_new_samples[operator] = \
+                self._epoch_new_samples.get(operator, 0) + int(new_samples[i])
+            self._batch_sizes[operator] = operator_batch_size
+        self._num_allocations += 1
+        return allocation
+
+    def get_diagnostics(self):
+        stats = OrderedDict()
+        for operator, num_steps in self._epoch_steps.items():
+            stats[f'{operator}/num steps'] = num_steps
+            stats[f'{operator}/num new samples'] = \
+                self._epoch_new_samples[operator]
+            stats[f'{operator}/batch size'] = self._batch_sizes[operator]
+            stats[f'{operator}/TD trend factor'] = \
+                self._td_trend_factors.get(operator, 1.)
+        stats['num allocations'] = self._num_allocations
+        return stats
+
+    def end_epoch(self, epoch):
+        self._epoch_steps = OrderedDict()
+        self._epoch_new_samples = OrderedDict()
+        self._num_allocations = 0
@@ -0,0 +1,145 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from rlkit.data_management.random_state import use_random_state
+
+
+class _Failure(object):
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class BatchPrefetcher(object):
+    """
+    Samples the per-operator minibatches of the next gradient steps on a
+    background thread while the learner trains on the current one.
+
+    Call `start(num_batches)` once the replay buffers are filled for a train
+    loop, then `get()` once per gradient step. At most `max_queue_size`
+    batches are prepared ahead, so the buffers must not be written to until
+    all `num_batches` batches have been taken.
+    """
+
+    def __init__(
+            self,
+            replay_buffers,
+            batch_size,
+            max_queue_size=2,
+            seed=None,
+            transform=None,
+            sampler=None,
+    ):
+        """
+        :param replay_buffers: Dict from operator to replay buffer.
+        :param max_queue_size: How many batches may be ready at once.
+        :param seed: The background thread samples with its own random
+        state, so it does not disturb the global one of the learner. If set,
+        that random state is seeded with (seed, train loop number) before
+        every train loop, so the sampled batches do not depend on how many
+        random numbers data collection used.
+        :param transform: Applied to every operator batch on the background
+        thread, e.g. rlkit.torch.core.np_to_pytorch_batch.
+        :param sampler: Optional object whose `random_batches(batch_size)`
+        samples all operators at once, used instead of calling random_batch
+        on every buffer.
+        """
+        self.replay_buffers = replay_buffers
+        self.batch_size = batch_size
+        self.max_queue_size = max_queue_size
+        self.seed = seed
+        self.transform = transform
+        self.sampler = sampler
+        self._queue = None
+        self._thread = None
+        self._num_loops = 0
+        self._wait_time = 0
+        self._num_batches = 0
+
+    def start(self, num_batches, batch_schedule=None):
+        """
+        :param batch_schedule: Optional list with the batch sizes of every
+        batch, each None for `batch_size` for all operators with data or a
+        dict from operator to its batch size. See
+        RePReLAlgorithm._batch_schedule.
+        """
+        if batch_schedule is None:
+            batch_schedule = [None] * num_batches
+        assert len(batch_schedule) == num_batches
+        assert self._thread is None, "Previous train loop is still running"
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        if self.seed is None:
+            seed = None
+        else:
+            seed = (self.seed, self._num_loops)
+        self._thread = threading.Thread(
+            target=self._produce,
+            args=(self._queue, batch_schedule, seed),
+            daemon=True,
+        )
+        self._thread.start()
+        self._num_loops += 1
+
+    def _produce(self, batch_queue, batch_schedule, seed):
+        try:
+            with use_random_state(np.random.RandomState(seed)):
+                for batch_sizes in batch_schedule:
+                    batch_queue.put(self._sample(batch_sizes))
+        except Exception as e:
+            batch_queue.put(_Failure(e))
+
+    def _sample(self, batch_sizes=None):
+        if self.sampler is not None:
+            train_data = self.sampler.random_batches(
+                self.batch_size if batch_sizes is None else batch_sizes)
+        elif batch_sizes is not None:
+            train_data = {
+                operator: replay_buffer.random_batch(batch_sizes[operator])
+                for operator, replay_buffer in self.replay_buffers.items()
+                if operator in batch_sizes
+            }
+        else:
+            train_data = {
+                operator: replay_buffer.random_batch(self.batch_size)
+                for operator, replay_buffer in self.replay_buffers.items()
+                if replay_buffer._size > 0
+            }
+        if self.transform is not None:
+            train_data = {
+                operator: self.transform(batch)
+                for operator, batch in train_data.items()
+            }
+        return train_data
+
+    def get(self):
+        start = time.perf_counter()
+        train_data = self._queue.get()
+        self._wait_time += time.perf_counter() - start
+        self._num_batches += 1
+        if isinstance(train_data, _Failure):
+            self._thread = None
+            raise train_data.exception
+        return train_data
+
+    def join(self):
+        """
+        Wait for the background thread after the last batch was taken.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get_diagnostics(self):
+        mean_wait = self._wait_time / max(self._num_batches, 1)
+        return OrderedDict([
+            ('learner wait time (s)', self._wait_time),
+            ('learner mean wait per batch (ms)', 1000 * mean_wait),
+            ('num batches', self._num_batches),
+        ])
+
+    def end_epoch(self, epoch):
+        self._wait_time = 0
+        self._num_batches = 0
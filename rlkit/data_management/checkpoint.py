@@ -0,0 +1,80 @@
+import json
+import os
+import os.path as osp
+
+import numpy as np
+
+from rlkit.core import logger
+
+
+def _resolve(directory):
+    snapshot_dir = logger.get_snapshot_dir()
+    if not osp.isabs(directory) and snapshot_dir is not None:
+        directory = osp.join(snapshot_dir, directory)
+    return directory
+
+
+def _file_name(directory, name):
+    return osp.join(directory, name.replace('/', '.') + '.npy')
+
+
+def ring_slices(start, length, size):
+    """
+    :return: The slices covering `length` slots of a ring buffer of `size`
+    slots, starting at `start`.
+    """
+    if length >= size:
+        return [slice(0, size)]
+    end = start + length
+    if end <= size:
+        return [slice(start, end)]
+    return [slice(start, size), slice(0, end - size)]
+
+
+def save_checkpoint(directory, arrays, state, dirty_slices=None):
+    """
+    Save replay buffer arrays as .npy files and the buffer pointers as JSON.
+
+    :param directory: Relative paths are interpreted relative to the
+    logger's snapshot directory.
+    :param arrays: Dict from name to array. The first axis indexes slots.
+    :param state: JSON-serializable dict, e.g. the top and size pointers. It
+    is written last and atomically.
+    :param dirty_slices: If set, only these slots are copied into files that
+    already exist with the right shape. Otherwise every array is written.
+    """
+    directory = _resolve(directory)
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        file_name = _file_name(directory, name)
+        saved = None
+        if dirty_slices is not None and osp.exists(file_name):
+            saved = np.load(file_name, mmap_mode='r+')
+            if saved.shape != array.shape or saved.dtype != array.dtype:
+                saved = None
+        if saved is None:
+            saved = np.lib.format.open_memmap(
+                file_name, mode='w+', dtype=array.dtype, shape=array.shape)
+            saved[:] = array
+        else:
+            for slc in dirty_slices:
+                saved[slc] = array[slc]
+        saved.flush()
+        del saved
+    state_file = osp.join(directory, 'state.json')
+    with open(state_file + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(state_file + '.tmp', state_file)
+
+
+def load_checkpoint(directory, arrays):
+    """
+    Copy the contents of a checkpoint into `arrays`.
+
+    :return: The `state` passed to save_checkpoint.
+    """
+    directory = _resolve(directory)
+    for name, array in arrays.items():
+        array[:] = np.load(_file_name(directory, name), mmap_mode='r')
+    with open(osp.join(directory, 'state.json')) as f:
+        return json.load(f)
@@ -10,11 +10,14 @@ class EnvReplayBuffer(SimpleReplayBuffer):
             self,
             max_replay_buffer_size,
             env,
-            env_info_sizes=None
+            env_info_sizes=None,
+            **kwargs
     ):
         """
         :param max_replay_buffer_size:
         :param env:
+        :param kwargs: Storage options passed to SimpleReplayBuffer, e.g.
+        `observation_dtype`.
         """
         self.env = env
         self._ob_space = env.observation_space
@@ -30,14 +33,17 @@ class EnvReplayBuffer(SimpleReplayBuffer):
             max_replay_buffer_size=max_replay_buffer_size,
             observation_dim=get_dim(self._ob_space),
             action_dim=get_dim(self._action_space),
-            env_info_sizes=env_info_sizes
+            env_info_sizes=env_info_sizes,
+            **kwargs
         )
+        if isinstance(self._action_space, Discrete):
+            self._one_hot_actions = np.eye(
+                self._action_dim, dtype=self._actions.dtype)
 
     def add_sample(self, observation, action, reward, terminal,
                    next_observation, **kwargs):
         if isinstance(self._action_space, Discrete):
-            new_action = np.zeros(self._action_dim)
-            new_action[action] = 1
+            new_action = self._one_hot_actions[action]
         else:
             new_action = action
         return super().add_sample(
@@ -48,3 +54,8 @@ class EnvReplayBuffer(SimpleReplayBuffer):
             terminal=terminal,
             **kwargs
         )
+
+    def _encode_actions(self, actions):
+        if isinstance(self._action_space, Discrete):
+            return self._one_hot_actions[np.asarray(actions).reshape(-1)]
+        return super()._encode_actions(actions)
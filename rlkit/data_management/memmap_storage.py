@@ -0,0 +1,130 @@
+import json
+import os
+import os.path as osp
+import pickle
+
+import numpy as np
+
+from rlkit.core import logger
+
+
+class MemmapStorage(object):
+    """
+    Backs replay buffer arrays with np.memmap files in a directory, so that
+    the buffer capacity is bounded by disk rather than RAM and the operating
+    system decides which pages stay cached.
+
+    A buffer calls `flush` with its pointers (top, size, ...) to make the
+    files on disk a consistent snapshot. Creating a storage on a directory
+    that already contains a snapshot reopens the files instead of wiping
+    them, so a run can resume with its replay buffer contents.
+
+    Array names are the instance variable names of the buffer, or
+    "<instance variable>/<key>" for arrays kept in a dictionary, e.g. the
+    observation dictionaries of ObsDictRelabelingBuffer.
+    """
+
+    def __init__(self, directory, resume=True):
+        """
+        :param directory: Where to put the files. Relative paths are
+        interpreted relative to the logger's snapshot directory.
+        :param resume: If False, existing files are overwritten.
+        """
+        snapshot_dir = logger.get_snapshot_dir()
+        if not osp.isabs(directory) and snapshot_dir is not None:
+            directory = osp.join(snapshot_dir, directory)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._state_file = osp.join(directory, 'state.json')
+        self.resumed = resume and osp.exists(self._state_file)
+        self._specs = {}
+        self._arrays = {}
+        self._state = {}
+        if self.resumed:
+            with open(self._state_file) as f:
+                saved = json.load(f)
+            self._saved_specs = saved['specs']
+            self._state = saved['state']
+
+    def zeros(self, name, shape, dtype=np.float64):
+        return self.full(name, shape, 0, dtype=dtype)
+
+    def full(self, name, shape, fill_value, dtype=np.float64):
+        shape = tuple(int(s) for s in shape)
+        dtype = np.dtype(dtype)
+        spec = dict(shape=list(shape), dtype=dtype.str)
+        if self.resumed:
+            if self._saved_specs.get(name) != spec:
+                raise ValueError(
+                    "Array {} in {} was saved as {}, but {} was "
+                    "requested.".format(
+                        name, self.directory, self._saved_specs.get(name),
+                        spec,
+                    )
+                )
+            array = self._open(name, shape, dtype, 'r+')
+        else:
+            array = self._open(name, shape, dtype, 'w+')
+            if fill_value != 0:
+                array[:] = fill_value
+        self._specs[name] = spec
+        self._arrays[name] = array
+        return array
+
+    def _open(self, name, shape, dtype, mode):
+        file_name = osp.join(self.directory, name.replace('/', '.') + '.dat')
+        return np.memmap(file_name, dtype=dtype, mode=mode, shape=shape)
+
+    def attach(self, buffer):
+        """
+        Reopen every array and set it on `buffer`. Use this after the buffer
+        was copied into another process.
+        """
+        for name, spec in self._specs.items():
+            array = self._open(
+                name, tuple(spec['shape']), np.dtype(spec['dtype']), 'r+')
+            self._arrays[name] = array
+            if '/' in name:
+                attr, key = name.split('/', 1)
+                getattr(buffer, attr)[key] = array
+            else:
+                setattr(buffer, name, array)
+
+    def load_state(self):
+        """
+        :return: The pointers passed to the last `flush` call, or an empty
+        dict if the storage was newly created.
+        """
+        return dict(self._state)
+
+    def flush(self, state):
+        """
+        Write all arrays to disk, then atomically record `state`, a dict of
+        JSON-serializable buffer pointers.
+        """
+        for array in self._arrays.values():
+            array.flush()
+        tmp_file = self._state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(dict(specs=self._specs, state=state), f)
+        os.replace(tmp_file, self._state_file)
+        self._state = dict(state)
+
+    def save_object(self, name, obj):
+        with open(osp.join(self.directory, name + '.pkl'), 'wb') as f:
+            pickle.dump(obj, f)
+
+    def load_object(self, name):
+        with open(osp.join(self.directory, name + '.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+
+def allocate(storage, name, shape, dtype=np.float64, fill_value=0):
+    """
+    Allocate a buffer array in RAM, or in `storage` if it is not None.
+    """
+    if storage is None:
+        if fill_value == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.full(shape, fill_value, dtype=dtype)
+    return storage.full(name, shape, fill_value, dtype=dtype)
@@ -1,6 +1,9 @@
 import numpy as np
 from gym.spaces import Dict, Discrete
 
+from rlkit.data_management import checkpoint
+from rlkit.data_management.memmap_storage import MemmapStorage, allocate
+from rlkit.data_management.random_state import get_random_state
 from rlkit.data_management.replay_buffer import ReplayBuffer
 
 
@@ -32,8 +35,20 @@ class ObsDictRelabelingBuffer(ReplayBuffer):
             observation_key='observation',
             desired_goal_key='desired_goal',
             achieved_goal_key='achieved_goal',
-            ob_spaces=None
+            ob_spaces=None,
+            storage_dir=None,
+            compute_rewards_fn=None,
     ):
+        """
+        :param compute_rewards_fn: Function (actions, next_obs_dict) -> rewards
+        used to recompute the rewards of relabeled batches, with the same
+        signature as the multiworld `env.compute_rewards`. Defaults to
+        `env.compute_rewards`, or to calling `env.compute_reward` once per
+        sample if the env has no batch version.
+        :param storage_dir: If set, the arrays are np.memmap files in this
+        directory (relative to the logger's snapshot directory) instead of
+        living in RAM. An existing buffer in the directory is reopened.
+        """
         if internal_keys is None:
             internal_keys = []
         self.internal_keys = internal_keys
@@ -59,14 +74,20 @@ class ObsDictRelabelingBuffer(ReplayBuffer):
         self.observation_key = observation_key
         self.desired_goal_key = desired_goal_key
         self.achieved_goal_key = achieved_goal_key
+        if compute_rewards_fn is None and hasattr(self.env, 'compute_rewards'):
+            compute_rewards_fn = self.env.compute_rewards
+        self.compute_rewards_fn = compute_rewards_fn
         if isinstance(self.env.action_space, Discrete):
             self._action_dim = env.action_space.n
         else:
             self._action_dim = env.action_space.low.size
 
-        self._actions = np.zeros((max_size, self._action_dim))
+        self._storage = self._create_storage(storage_dir)
+        self._actions = allocate(
+            self._storage, '_actions', (max_size, self._action_dim))
         # self._terminals[i] = a terminal was received at time i
-        self._terminals = np.zeros((max_size, 1), dtype='uint8')
+        self._terminals = allocate(
+            self._storage, '_terminals', (max_size, 1), dtype='uint8')
         # self._obs[key][i] is the value of observation[key] at time i
         self._obs = {}
         self._next_obs = {}
@@ -79,17 +100,90 @@ class ObsDictRelabelingBuffer(ReplayBuffer):
             type = np.float64
             if key.startswith('image'):
                 type = np.uint8
-            self._obs[key] = np.zeros(
+            self._obs[key] = allocate(
+                self._storage, '_obs/' + key,
                 (max_size, self.ob_spaces[key].low.size), dtype=type)
-            self._next_obs[key] = np.zeros(
+            self._next_obs[key] = allocate(
+                self._storage, '_next_obs/' + key,
                 (max_size, self.ob_spaces[key].low.size), dtype=type)
 
         self._top = 0
         self._size = 0
 
-        # Let j be any index in self._idx_to_future_obs_idx[i]
-        # Then self._next_obs[j] is a valid next observation for observation i
-        self._idx_to_future_obs_idx = [None] * max_size
+        # self._idx_to_episode_end[i] is the index of the last step of the
+        # path containing step i. Every j from i up to it (wrapping around the
+        # end of the buffer) has a valid future next observation self._next_obs[j].
+        self._idx_to_episode_end = allocate(
+            self._storage, '_idx_to_episode_end', (max_size,), dtype=np.int64)
+        if self._storage is not None and self._storage.resumed:
+            for key, value in self._storage.load_state().items():
+                setattr(self, key, value)
+        # Slots written since the last checkpoint in self._checkpoint_dir
+        # start at self._checkpoint_top.
+        self._checkpoint_dir = None
+        self._checkpoint_top = self._top
+        self._steps_since_checkpoint = 0
+
+    def _create_storage(self, storage_dir):
+        if storage_dir is None:
+            return None
+        return MemmapStorage(storage_dir)
+
+    def flush(self):
+        """
+        Write a consistent snapshot of a disk-backed buffer to its
+        storage_dir. This happens automatically at the end of every epoch.
+        """
+        if self._storage is not None:
+            self._storage.flush(self._storage_state())
+
+    def _storage_state(self):
+        return dict(_top=int(self._top), _size=int(self._size))
+
+    def end_epoch(self, epoch):
+        self.flush()
+
+    def _checkpoint_arrays(self):
+        arrays = dict(
+            _actions=self._actions,
+            _terminals=self._terminals,
+            _idx_to_episode_end=self._idx_to_episode_end,
+        )
+        for key in self.ob_keys_to_save + self.internal_keys:
+            arrays['_obs/' + key] = self._obs[key]
+            arrays['_next_obs/' + key] = self._next_obs[key]
+        return arrays
+
+    def save_checkpoint(self, directory):
+        """
+        Save the buffer to .npy files in `directory`. If the previous
+        checkpoint was saved to or loaded from the same directory, only the
+        slots written since then are copied.
+        """
+        dirty_slices = None
+        if directory == self._checkpoint_dir:
+            dirty_slices = checkpoint.ring_slices(
+                self._checkpoint_top,
+                self._steps_since_checkpoint,
+                self.max_size,
+            )
+        checkpoint.save_checkpoint(
+            directory, self._checkpoint_arrays(), self._storage_state(),
+            dirty_slices=dirty_slices,
+        )
+        self._mark_checkpoint(directory)
+
+    def load_checkpoint(self, directory):
+        state = checkpoint.load_checkpoint(
+            directory, self._checkpoint_arrays())
+        for key, value in state.items():
+            setattr(self, key, value)
+        self._mark_checkpoint(directory)
+
+    def _mark_checkpoint(self, directory):
+        self._checkpoint_dir = directory
+        self._checkpoint_top = self._top
+        self._steps_since_checkpoint = 0
 
     def add_sample(self, observation, action, reward, terminal,
                    next_observation, **kwargs):
@@ -101,25 +195,28 @@ class ObsDictRelabelingBuffer(ReplayBuffer):
     def num_steps_can_sample(self):
         return self._size
 
-    def add_path(self, path):
-        obs = path["observations"]
-        actions = path["actions"]
-        rewards = path["rewards"]
-        next_obs = path["next_observations"]
-        terminals = path["terminals"]
-        path_len = len(rewards)
-
-        actions = flatten_n(actions)
+    def _preprocess_path(self, path):
+        """
+        :return: The actions, terminals, observation dict and next
+        observation dict of `path`, as they are stored in the buffer.
+        """
+        actions = flatten_n(path["actions"])
         if isinstance(self.env.action_space, Discrete):
             actions = np.eye(self._action_dim)[actions]
             actions = actions.reshape((-1, self._action_dim))
-        obs = flatten_dict(obs, self.ob_keys_to_save + self.internal_keys)
+        obs = flatten_dict(
+            path["observations"], self.ob_keys_to_save + self.internal_keys)
         next_obs = flatten_dict(
-                next_obs,
+                path["next_observations"],
                 self.ob_keys_to_save + self.internal_keys,
         )
         obs = preprocess_obs_dict(obs)
         next_obs = preprocess_obs_dict(next_obs)
+        return actions, path["terminals"], obs, next_obs
+
+    def add_path(self, path):
+        path_len = len(path["rewards"])
+        actions, terminals, obs, next_obs = self._preprocess_path(path)
 
         if self._top + path_len >= self.max_size:
             """
@@ -147,20 +244,11 @@ class ObsDictRelabelingBuffer(ReplayBuffer):
                     self._next_obs[key][buffer_slice] = (
                             next_obs[key][path_slice]
                     )
-            # Pointers from before the wrap
-            for i in range(self._top, self.max_size):
-                self._idx_to_future_obs_idx[i] = np.hstack((
-                    # Pre-wrap indices
-                    np.arange(i, self.max_size),
-                    # Post-wrap indices
-                    np.arange(0, num_post_wrap_steps)
-                ))
-            # Pointers after the wrap
-            for i in range(0, num_post_wrap_steps):
-                self._idx_to_future_obs_idx[i] = np.arange(
-                    i,
-                    num_post_wrap_steps,
-                )
+            # If the path ends exactly at the end of the buffer, this is -1,
+            # which _sample_future_indices treats as max_size - 1.
+            episode_end = num_post_wrap_steps - 1
+            self._idx_to_episode_end[self._top:] = episode_end
+            self._idx_to_episode_end[post_wrap_buffer_slice] = episode_end
         else:
             slc = np.s_[self._top:self._top + path_len, :]
             self._actions[slc] = actions
@@ -168,23 +256,39 @@ class ObsDictRelabelingBuffer(ReplayBuffer):
             for key in self.ob_keys_to_save + self.internal_keys:
                 self._obs[key][slc] = obs[key]
                 self._next_obs[key][slc] = next_obs[key]
-            for i in range(self._top, self._top + path_len):
-                self._idx_to_future_obs_idx[i] = np.arange(
-                    i, self._top + path_len
-                )
+            self._idx_to_episode_end[self._top:self._top + path_len] = (
+                self._top + path_len - 1
+            )
         self._top = (self._top + path_len) % self.max_size
         self._size = min(self._size + path_len, self.max_size)
+        self._steps_since_checkpoint += path_len
 
     def _sample_indices(self, batch_size):
-        return np.random.randint(0, self._size, batch_size)
+        return get_random_state().randint(0, self._size, batch_size)
+
+    def _num_future_goals(self, batch_size):
+        num_env_goals = int(batch_size * self.fraction_goals_env_goals)
+        num_rollout_goals = int(batch_size * self.fraction_goals_rollout_goals)
+        return batch_size - (num_env_goals + num_rollout_goals)
 
     def random_batch(self, batch_size):
         indices = self._sample_indices(batch_size)
+        num_future_goals = self._num_future_goals(batch_size)
+        future_obs_idxs = self._sample_future_indices(
+            indices[batch_size - num_future_goals:])
+        return self._relabeled_batch(indices, future_obs_idxs)
+
+    def _relabeled_batch(self, indices, future_obs_idxs):
+        """
+        :param future_obs_idxs: The steps whose achieved goals relabel the
+        last len(future_obs_idxs) transitions, see _sample_future_indices.
+        """
+        batch_size = len(indices)
         resampled_goals = self._next_obs[self.desired_goal_key][indices]
 
         num_env_goals = int(batch_size * self.fraction_goals_env_goals)
         num_rollout_goals = int(batch_size * self.fraction_goals_rollout_goals)
-        num_future_goals = batch_size - (num_env_goals + num_rollout_goals)
+        num_future_goals = len(future_obs_idxs)
         new_obs_dict = self._batch_obs_dict(indices)
         new_next_obs_dict = self._batch_next_obs_dict(indices)
 
@@ -203,20 +307,6 @@ class ObsDictRelabelingBuffer(ReplayBuffer):
                     num_rollout_goals:last_env_goal_idx
                 ] = env_goals[goal_key]
         if num_future_goals > 0:
-            future_indices = indices[-num_future_goals:]
-            possible_future_obs_lens = np.array([
-                len(self._idx_to_future_obs_idx[i]) for i in future_indices
-            ])
-            # Faster than a naive for-loop.
-            # See https://github.com/vitchyr/rlkit/pull/112 for details.
-            next_obs_idxs = (
-                np.random.random(num_future_goals) * possible_future_obs_lens
-            ).astype(np.int)
-            future_obs_idxs = np.array([
-                self._idx_to_future_obs_idx[ids][next_obs_idxs[i]]
-                for i, ids in enumerate(future_indices)
-            ])
-
             resampled_goals[-num_future_goals:] = self._next_obs[
                 self.achieved_goal_key
             ][future_obs_idxs]
@@ -241,8 +331,8 @@ class ObsDictRelabelingBuffer(ReplayBuffer):
         https://github.com/vitchyr/multiworld
         """
 
-        if hasattr(self.env, 'compute_rewards'):
-            new_rewards = self.env.compute_rewards(
+        if self.compute_rewards_fn is not None:
+            new_rewards = self.compute_rewards_fn(
                 new_actions,
                 new_next_obs_dict,
             )
@@ -269,6 +359,19 @@ class ObsDictRelabelingBuffer(ReplayBuffer):
         }
         return batch
 
+    def _sample_future_indices(self, indices):
+        """
+        For every index, sample uniformly from the steps between it and the
+        end of its path, accounting for paths that wrap around.
+        """
+        possible_future_obs_lens = (
+            self._idx_to_episode_end[indices] - indices
+        ) % self.max_size + 1
+        offsets = (
+            get_random_state().random(len(indices)) * possible_future_obs_lens
+        ).astype(np.int64)
+        return (indices + offsets) % self.max_size
+
     def _batch_obs_dict(self, indices):
         return {
             key: self._obs[key][indices]
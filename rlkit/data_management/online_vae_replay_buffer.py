@@ -1,16 +1,18 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 import rlkit.torch.pytorch_util as ptu
 from multiworld.core.image_env import normalize_image
 from rlkit.core.eval_util import create_stats_ordered_dict
+from rlkit.data_management.memmap_storage import allocate
 from rlkit.data_management.obs_dict_replay_buffer import flatten_dict
 from rlkit.data_management.shared_obs_dict_replay_buffer import \
     SharedObsDictRelabelingBuffer
+from rlkit.data_management.sum_tree import SumTree
 from rlkit.envs.vae_wrapper import VAEWrappedEnv
-from rlkit.torch.vae.vae_trainer import (
-    compute_p_x_np_to_np,
-    relative_probs_from_log_probs,
-)
+from rlkit.torch.vae.vae_trainer import compute_p_x_np_to_np
 
 
 class OnlineVaeRelabelingBuffer(SharedObsDictRelabelingBuffer):
@@ -30,8 +32,18 @@ class OnlineVaeRelabelingBuffer(SharedObsDictRelabelingBuffer):
             internal_keys=None,
             priority_function_kwargs=None,
             relabeling_goal_sampling_mode='vae_prior',
+            refresh_batch_size=1024,
+            refresh_time_budget=None,
             **kwargs
     ):
+        """
+        :param refresh_batch_size: Number of entries re-encoded per VAE
+        forward pass in refresh_latents. Their four images are encoded in one
+        batch.
+        :param refresh_time_budget: If set, refresh_latents stops starting new
+        batches after this many seconds. Entries that were not re-encoded keep
+        their latents and priorities and are refreshed first next time.
+        """
         if internal_keys is None:
             internal_keys = []
 
@@ -59,13 +71,18 @@ class OnlineVaeRelabelingBuffer(SharedObsDictRelabelingBuffer):
                 exploration_rewards_type != 'None'
                 and exploration_rewards_scale != 0.
         )
-        self._exploration_rewards = np.zeros((self.max_size, 1))
+        self._exploration_rewards = allocate(
+            self._storage, '_exploration_rewards', (self.max_size, 1))
         self._prioritize_vae_samples = (
                 vae_priority_type != 'None'
                 and power != 0.
         )
-        self._vae_sample_priorities = np.zeros((self.max_size, 1))
-        self._vae_sample_probs = None
+        self._vae_sample_priorities = allocate(
+            self._storage, '_vae_sample_priorities', (self.max_size, 1))
+        # Unnormalized sampling weights of the entries. Weights of vae_prob
+        # priorities are exp(log prob - _log_prob_offset).
+        self._vae_sample_tree = SumTree(self.max_size)
+        self._log_prob_offset = None
 
         type_to_function = {
             'vae_prob': self.vae_prob,
@@ -84,13 +101,69 @@ class OnlineVaeRelabelingBuffer(SharedObsDictRelabelingBuffer):
         else:
             self.priority_function_kwargs = priority_function_kwargs
 
+        self.refresh_batch_size = refresh_batch_size
+        self.refresh_time_budget = refresh_time_budget
+        # Number of refresh_latents calls, i.e. VAE versions, and the version
+        # each entry was last encoded with. -1 marks entries added since.
+        self._vae_version = 0
+        self._vae_versions = allocate(
+            self._storage, '_vae_versions', (self.max_size,), dtype=np.int64)
+        latent_dim = self._obs[self.observation_key].shape[1]
+        self._latent_sum = allocate(
+            self._storage, '_latent_sum', (latent_dim,))
+        self._latent_square_sum = allocate(
+            self._storage, '_latent_square_sum', (latent_dim,))
+
         self.epoch = 0
         self._register_mp_array("_exploration_rewards")
         self._register_mp_array("_vae_sample_priorities")
+        self._register_mp_array("_vae_versions")
+        self._register_mp_array("_latent_sum")
+        self._register_mp_array("_latent_square_sum")
+        self._vae_versions[:] = -1
+        self._recompute_latent_statistics()
+
+    @property
+    def _vae_sample_probs(self):
+        total = self._vae_sample_tree.total
+        if not self._prioritize_vae_samples or total <= 0:
+            return None
+        return self._vae_sample_tree[np.arange(self._size)] / total
+
+    def _checkpoint_arrays(self):
+        arrays = super()._checkpoint_arrays()
+        arrays['_exploration_rewards'] = self._exploration_rewards
+        arrays['_vae_sample_priorities'] = self._vae_sample_priorities
+        return arrays
+
+    def load_checkpoint(self, directory):
+        super().load_checkpoint(directory)
+        self._vae_versions[:] = -1
+        self._recompute_latent_statistics()
+        self._rebuild_sample_tree()
 
     def add_path(self, path):
         self.add_decoded_vae_goals_to_path(path)
+        slots = (self._top + np.arange(len(path['rewards']))) % self.max_size
+        self._update_latent_statistics(slots[slots < self._size], -1)
         super().add_path(path)
+        self._update_latent_statistics(slots, 1)
+        self._vae_versions[slots] = -1
+        self._vae_sample_tree.update(slots, np.zeros(len(slots)))
+
+    def _recompute_latent_statistics(self):
+        self._latent_sum[:] = 0
+        self._latent_square_sum[:] = 0
+        self._update_latent_statistics(np.arange(self._size), 1)
+
+    def _update_latent_statistics(self, idxs, sign):
+        """
+        Keep the running sums of the observation latents of all entries, from
+        which refresh_latents sets the VAE's dist_mu and dist_std.
+        """
+        latents = self._obs[self.observation_key][idxs].astype(np.float64)
+        self._latent_sum += sign * latents.sum(axis=0)
+        self._latent_square_sum += sign * np.square(latents).sum(axis=0)
 
     def add_decoded_vae_goals_to_path(self, path):
         # decoding the self-sampled vae images should be done in batch (here)
@@ -134,116 +207,164 @@ class OnlineVaeRelabelingBuffer(SharedObsDictRelabelingBuffer):
         return stats
 
     def refresh_latents(self, epoch):
+        """
+        Re-encode the entries that were encoded with an older VAE.
+
+        Entries are refreshed in batches of `refresh_batch_size`, the oldest
+        latents and then the highest priorities first, until all are fresh or
+        `refresh_time_budget` is used up. The images of the next batch are
+        normalized on a worker thread while the current batch is encoded.
+        """
         self.epoch = epoch
         self.skew = (self.epoch > self.start_skew_epoch)
-        batch_size = 512
-        next_idx = min(batch_size, self._size)
-
-        if self.exploration_rewards_type == 'hash_count':
-            # you have to count everything then compute exploration rewards
-            cur_idx = 0
-            next_idx = min(batch_size, self._size)
-            while cur_idx < self._size:
-                idxs = np.arange(cur_idx, next_idx)
-                normalized_imgs = (
-                    normalize_image(self._next_obs[self.decoded_obs_key][idxs])
-                )
-                cur_idx = next_idx
-                next_idx += batch_size
-                next_idx = min(next_idx, self._size)
-
-        cur_idx = 0
-        obs_sum = np.zeros(self.vae.representation_size)
-        obs_square_sum = np.zeros(self.vae.representation_size)
-        while cur_idx < self._size:
-            idxs = np.arange(cur_idx, next_idx)
-            self._obs[self.observation_key][idxs] = \
-                self.env._encode(
-                    normalize_image(self._obs[self.decoded_obs_key][idxs])
-                )
-            self._next_obs[self.observation_key][idxs] = \
-                self.env._encode(
-                    normalize_image(self._next_obs[self.decoded_obs_key][idxs])
-                )
-            # WARNING: we only refresh the desired/achieved latents for
-            # "next_obs". This means that obs[desired/achieve] will be invalid,
-            # so make sure there's no code that references this.
-            # TODO: enforce this with code and not a comment
-            self._next_obs[self.desired_goal_key][idxs] = \
-                self.env._encode(
-                    normalize_image(self._next_obs[self.decoded_desired_goal_key][idxs])
-                )
-            self._next_obs[self.achieved_goal_key][idxs] = \
-                self.env._encode(
-                    normalize_image(self._next_obs[self.decoded_achieved_goal_key][idxs])
-                )
-            normalized_imgs = (
-                normalize_image(self._next_obs[self.decoded_obs_key][idxs])
-            )
-            if self._give_explr_reward_bonus:
-                rewards = self.exploration_reward_func(
-                    normalized_imgs,
-                    idxs,
-                    **self.priority_function_kwargs
+        self._vae_version += 1
+        start_time = time.time()
+
+        stale_idxs = np.flatnonzero(
+            self._vae_versions[:self._size] < self._vae_version
+        )
+        order = np.lexsort((
+            -self._vae_sample_priorities[stale_idxs, 0],
+            self._vae_versions[stale_idxs],
+        ))
+        stale_idxs = stale_idxs[order]
+        batches = [
+            np.sort(stale_idxs[i:i + self.refresh_batch_size])
+            for i in range(0, len(stale_idxs), self.refresh_batch_size)
+        ]
+        num_refreshed = 0
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_images = None
+            if batches:
+                next_images = executor.submit(
+                    self._normalized_images, batches[0])
+            for batch_num, idxs in enumerate(batches):
+                images = next_images.result()
+                next_images = None
+                out_of_time = (
+                    self.refresh_time_budget is not None
+                    and time.time() - start_time > self.refresh_time_budget
                 )
-                self._exploration_rewards[idxs] = rewards.reshape(-1, 1)
-            if self._prioritize_vae_samples:
-                if (
-                        self.exploration_rewards_type == self.vae_priority_type
-                        and self._give_explr_reward_bonus
-                ):
-                    self._vae_sample_priorities[idxs] = (
-                        self._exploration_rewards[idxs]
-                    )
-                else:
-                    self._vae_sample_priorities[idxs] = (
-                        self.vae_prioritization_func(
-                            normalized_imgs,
-                            idxs,
-                            **self.priority_function_kwargs
-                        ).reshape(-1, 1)
-                    )
-            obs_sum+= self._obs[self.observation_key][idxs].sum(axis=0)
-            obs_square_sum+= np.power(self._obs[self.observation_key][idxs], 2).sum(axis=0)
-
-            cur_idx = next_idx
-            next_idx += batch_size
-            next_idx = min(next_idx, self._size)
-        self.vae.dist_mu = obs_sum/self._size
-        self.vae.dist_std = np.sqrt(obs_square_sum/self._size - np.power(self.vae.dist_mu, 2))
+                if batch_num + 1 < len(batches) and not out_of_time:
+                    next_images = executor.submit(
+                        self._normalized_images, batches[batch_num + 1])
+                self._refresh_batch(idxs, images)
+                num_refreshed += 1
+                if next_images is None:
+                    break
+        if num_refreshed == len(batches):
+            # Everything was re-encoded, so drop any drift of the running sums.
+            self._recompute_latent_statistics()
+
+        self.vae.dist_mu = self._latent_sum / self._size
+        self.vae.dist_std = np.sqrt(np.maximum(
+            self._latent_square_sum / self._size
+            - np.power(self.vae.dist_mu, 2),
+            0,
+        ))
 
         if self._prioritize_vae_samples:
-            """
-            priority^power is calculated in the priority function
-            for image_bernoulli_prob or image_gaussian_inv_prob and
-            directly here if not.
-            """
+            p_sum = self._vae_sample_tree.total
+            assert p_sum > 0, "Unnormalized p sum is {}".format(p_sum)
+
+    def _sample_weights(self, idxs):
+        """
+        priority^power is calculated in the priority function
+        for image_bernoulli_prob or image_gaussian_inv_prob and
+        directly here if not.
+        """
+        priorities = self._vae_sample_priorities[idxs, 0]
+        if self.vae_priority_type == 'vae_prob':
+            # Like relative_probs_from_log_probs, but with a fixed offset so
+            # that entries can be updated one batch at a time.
+            weights = np.exp(priorities - self._log_prob_offset)
+            assert not np.any(weights <= 0), 'choose a smaller power'
+            return weights
+        return priorities ** self.power
+
+    def _rebuild_sample_tree(self):
+        idxs = np.arange(self._size)
+        idxs = idxs[self._vae_versions[idxs] >= 0]
+        weights = np.zeros(self.max_size)
+        if len(idxs) > 0:
             if self.vae_priority_type == 'vae_prob':
-                self._vae_sample_priorities[:self._size] = relative_probs_from_log_probs(
-                    self._vae_sample_priorities[:self._size]
+                self._log_prob_offset = \
+                    self._vae_sample_priorities[idxs, 0].mean()
+            weights[idxs] = self._sample_weights(idxs)
+        self._vae_sample_tree.update(np.arange(self.max_size), weights)
+
+    def _update_sample_tree(self, idxs):
+        if self.vae_priority_type == 'vae_prob':
+            log_probs = self._vae_sample_priorities[idxs, 0]
+            if (
+                    self._log_prob_offset is None
+                    or np.abs(log_probs - self._log_prob_offset).max() > 300
+            ):
+                # Re-center the weights before exp over- or underflows.
+                self._rebuild_sample_tree()
+                return
+        self._vae_sample_tree.update(idxs, self._sample_weights(idxs))
+
+    def _normalized_images(self, idxs):
+        return [
+            normalize_image(self._obs[self.decoded_obs_key][idxs]),
+            normalize_image(self._next_obs[self.decoded_obs_key][idxs]),
+            normalize_image(
+                self._next_obs[self.decoded_desired_goal_key][idxs]),
+            normalize_image(
+                self._next_obs[self.decoded_achieved_goal_key][idxs]),
+        ]
+
+    def _refresh_batch(self, idxs, images):
+        latents = self.env._encode(np.concatenate(images))
+        obs_latents, next_obs_latents, desired_goal_latents, \
+            achieved_goal_latents = np.split(latents, len(images))
+        self._update_latent_statistics(idxs, -1)
+        self._obs[self.observation_key][idxs] = obs_latents
+        self._update_latent_statistics(idxs, 1)
+        self._next_obs[self.observation_key][idxs] = next_obs_latents
+        # WARNING: we only refresh the desired/achieved latents for
+        # "next_obs". This means that obs[desired/achieve] will be invalid,
+        # so make sure there's no code that references this.
+        # TODO: enforce this with code and not a comment
+        self._next_obs[self.desired_goal_key][idxs] = desired_goal_latents
+        self._next_obs[self.achieved_goal_key][idxs] = achieved_goal_latents
+        self._vae_versions[idxs] = self._vae_version
+
+        normalized_imgs = images[1]
+        if self._give_explr_reward_bonus:
+            rewards = self.exploration_reward_func(
+                normalized_imgs,
+                idxs,
+                **self.priority_function_kwargs
+            )
+            self._exploration_rewards[idxs] = rewards.reshape(-1, 1)
+        if self._prioritize_vae_samples:
+            if (
+                    self.exploration_rewards_type == self.vae_priority_type
+                    and self._give_explr_reward_bonus
+            ):
+                self._vae_sample_priorities[idxs] = (
+                    self._exploration_rewards[idxs]
                 )
-                self._vae_sample_probs = self._vae_sample_priorities[:self._size]
             else:
-                self._vae_sample_probs = self._vae_sample_priorities[:self._size] ** self.power
-            p_sum = np.sum(self._vae_sample_probs)
-            assert p_sum > 0, "Unnormalized p sum is {}".format(p_sum)
-            self._vae_sample_probs /= np.sum(self._vae_sample_probs)
-            self._vae_sample_probs = self._vae_sample_probs.flatten()
+                self._vae_sample_priorities[idxs] = (
+                    self.vae_prioritization_func(
+                        normalized_imgs,
+                        idxs,
+                        **self.priority_function_kwargs
+                    ).reshape(-1, 1)
+                )
+            self._update_sample_tree(idxs)
 
     def sample_weighted_indices(self, batch_size):
         if (
             self._prioritize_vae_samples and
-            self._vae_sample_probs is not None and
+            self._vae_sample_tree.total > 0 and
             self.skew
         ):
-            indices = np.random.choice(
-                len(self._vae_sample_probs),
-                batch_size,
-                p=self._vae_sample_probs,
-            )
-            assert (
-                np.max(self._vae_sample_probs) <= 1 and
-                np.min(self._vae_sample_probs) >= 0
+            indices = self._vae_sample_tree.find(
+                np.random.random(batch_size) * self._vae_sample_tree.total
             )
         else:
             indices = self._sample_indices(batch_size)
@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from rlkit.data_management.simple_replay_buffer import (
+    SimpleReplayBuffer, SimpleReplayBufferDiscreteAction,
+)
+from rlkit.data_management.sum_tree import SumTree
+
+
+class PrioritizedReplayBuffer(SimpleReplayBuffer):
+    """
+    Proportional prioritized experience replay (Schaul et al., 2016).
+
+    Transition i is sampled with probability p_i / sum_k p_k, where
+    p_i = (|td_error_i| + epsilon) ** alpha is kept in a sum-tree, so sampling
+    and updating a batch of priorities take O(log N) vectorized steps. New
+    transitions get the largest priority seen so far.
+
+    Batches additionally contain
+     - `indices`: the sampled slots, to be passed back to `update_priorities`
+     - `weights`: the importance sampling weights (N * P(i)) ** -beta,
+       normalized by the largest weight in the batch.
+
+    The sum-tree is guarded by a lock, so a BatchPrefetcher may sample on a
+    background thread while the trainer updates the priorities.
+    """
+
+    def __init__(
+            self,
+            max_replay_buffer_size,
+            *args,
+            alpha=0.6,
+            beta=0.4,
+            epsilon=1e-6,
+            **kwargs
+    ):
+        """
+        :param alpha: How much prioritization is used (0 is uniform).
+        :param beta: Strength of the importance sampling correction (1 fully
+        compensates for the non-uniform sampling).
+        :param epsilon: Added to the absolute TD errors so that no transition
+        gets a zero priority.
+        """
+        # The trainers receive the indices as float32 tensors.
+        assert max_replay_buffer_size <= 2 ** 24
+        self._alpha = alpha
+        self.beta = beta
+        self._epsilon = epsilon
+        self._sum_tree_lock = threading.Lock()
+        super().__init__(max_replay_buffer_size, *args, **kwargs)
+        self._max_priority = 1.0
+        self._sum_tree = self._create_sum_tree(max_replay_buffer_size)
+        if self._size > 0:
+            self._reset_priorities()
+
+    def _create_sum_tree(self, size):
+        return SumTree(size)
+
+    def _reset_priorities(self):
+        # Priorities are not persisted, so a reopened buffer starts over.
+        slots = np.arange(self._max_replay_buffer_size)
+        priorities = self._initial_priorities(slots)
+        priorities[self._size:] = 0.
+        with self._sum_tree_lock:
+            self._sum_tree.update(slots, priorities)
+
+    def _initial_priorities(self, slots):
+        if self._dedup_observations:
+            # Slots that only hold a final next observation are never sampled.
+            return np.where(
+                self._next_obs_idx[slots] >= 0, self._max_priority, 0.
+            )
+        return np.full(len(slots), self._max_priority)
+
+    def load_checkpoint(self, directory):
+        super().load_checkpoint(directory)
+        self._reset_priorities()
+
+    def _advance(self, num_steps=1):
+        first = self._top
+        super()._advance(num_steps)
+        slots = (
+            first + np.arange(min(num_steps, self._max_replay_buffer_size))
+        ) % self._max_replay_buffer_size
+        if self._dedup_observations:
+            # The new top may have been invalidated to hold a next observation.
+            slots = np.append(slots, self._top)
+        with self._sum_tree_lock:
+            self._sum_tree.update(slots, self._initial_priorities(slots))
+
+    def _sample_indices(self, batch_size):
+        assert self._sum_tree.total > 0
+        return self._sum_tree.sample(batch_size)
+
+    def random_batch(self, batch_size):
+        with self._sum_tree_lock:
+            indices = self._sample_indices(batch_size)
+            probabilities = self._sum_tree[indices] / self._sum_tree.total
+        batch = self._get_batch(indices)
+        weights = (self.num_steps_can_sample() * probabilities) ** -self.beta
+        batch['indices'] = indices.reshape(-1, 1)
+        batch['weights'] = (weights / weights.max()).reshape(-1, 1)
+        return batch
+
+    def update_priorities(self, indices, td_errors):
+        """
+        :param indices: Slots returned in the `indices` entry of a batch.
+        :param td_errors: TD errors of these transitions, in the same order.
+        """
+        indices = np.asarray(indices).astype(np.int64).reshape(-1)
+        priorities = (
+            np.abs(np.asarray(td_errors).reshape(-1)) + self._epsilon
+        ) ** self._alpha
+        if self._dedup_observations:
+            # The slot may have been overwritten since it was sampled.
+            priorities[self._next_obs_idx[indices] < 0] = 0.
+        with self._sum_tree_lock:
+            self._sum_tree.update(indices, priorities)
+            self._max_priority = max(self._max_priority, priorities.max())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_sum_tree_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._sum_tree_lock = threading.Lock()
+
+    def get_diagnostics(self):
+        diagnostics = super().get_diagnostics()
+        diagnostics.update(OrderedDict([
+            ('priority sum', self._sum_tree.total),
+            ('priority max', self._max_priority),
+        ]))
+        return diagnostics
+
+
+class PrioritizedReplayBufferDiscreteAction(
+    PrioritizedReplayBuffer, SimpleReplayBufferDiscreteAction
+):
+    pass
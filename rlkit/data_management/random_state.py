@@ -0,0 +1,29 @@
+import contextlib
+import threading
+
+import numpy as np
+
+_local = threading.local()
+
+
+def get_random_state():
+    """
+    :return: The random state that the replay buffers sample with on this
+    thread: the one set with `use_random_state`, or else NumPy's global
+    random state.
+    """
+    return getattr(_local, 'random_state', np.random)
+
+
+@contextlib.contextmanager
+def use_random_state(random_state):
+    """
+    Make the replay buffers sample with `random_state`, e.g. a
+    np.random.RandomState, on this thread only.
+    """
+    previous = get_random_state()
+    _local.random_state = random_state
+    try:
+        yield random_state
+    finally:
+        _local.random_state = previous
@@ -0,0 +1,101 @@
+import copy
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedMemoryStorage(object):
+    """
+    Backs replay buffer arrays with multiprocessing.shared_memory blocks, so
+    that every process holding the buffer reads and writes the same memory.
+
+    It has the same interface as MemmapStorage and is used through
+    `allocate`. Pickling the storage only records the block names, and
+    unpickling it in another process attaches to the existing blocks. Use
+    `detach` and `attach` to do the same for the buffer owning the arrays.
+
+    The process that created the storage must call `unlink` once no process
+    needs the buffer anymore.
+    """
+
+    def __init__(self):
+        self.resumed = False
+        self._specs = {}
+        self._arrays = {}
+        self._blocks = {}
+        self._owner = True
+
+    def zeros(self, name, shape, dtype=np.float64):
+        return self.full(name, shape, 0, dtype=dtype)
+
+    def full(self, name, shape, fill_value, dtype=np.float64):
+        shape = tuple(int(s) for s in shape)
+        dtype = np.dtype(dtype)
+        block = shared_memory.SharedMemory(
+            create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array[...] = fill_value
+        self._specs[name] = dict(
+            shape=list(shape), dtype=dtype.str, block=block.name)
+        self._blocks[name] = block
+        self._arrays[name] = array
+        return array
+
+    def _open(self, name):
+        spec = self._specs[name]
+        block = shared_memory.SharedMemory(name=spec['block'])
+        self._blocks[name] = block
+        self._arrays[name] = np.ndarray(
+            tuple(spec['shape']), dtype=np.dtype(spec['dtype']),
+            buffer=block.buf,
+        )
+
+    def __getstate__(self):
+        return dict(_specs=self._specs)
+
+    def __setstate__(self, state):
+        self.resumed = False
+        self._specs = state['_specs']
+        self._arrays = {}
+        self._blocks = {}
+        self._owner = False
+        for name in self._specs:
+            self._open(name)
+
+    def detach(self, buffer_state):
+        """
+        :param buffer_state: The __dict__ of the buffer owning the arrays.
+        :return: A copy of it without the arrays, to be pickled.
+        """
+        buffer_state = dict(buffer_state)
+        for name in self._specs:
+            if '/' in name:
+                attr, key = name.split('/', 1)
+                container = copy.copy(buffer_state[attr])
+                container[key] = None
+                buffer_state[attr] = container
+            else:
+                buffer_state[name] = None
+        return buffer_state
+
+    def attach(self, buffer):
+        """
+        Set every array on `buffer`, e.g. after unpickling it.
+        """
+        for name, array in self._arrays.items():
+            if '/' in name:
+                attr, key = name.split('/', 1)
+                getattr(buffer, attr)[key] = array
+            else:
+                setattr(buffer, name, array)
+
+    def load_state(self):
+        return {}
+
+    def flush(self, state):
+        pass
+
+    def unlink(self):
+        assert self._owner, "Only the creating process may unlink the blocks"
+        for block in self._blocks.values():
+            block.unlink()
@@ -16,10 +16,15 @@ class SharedObsDictRelabelingBuffer(ObsDictRelabelingBuffer):
     synchronized access can be extremely slow, but it seems ok empirically.
 
     This code also breaks a lot of functionality for the subprocess. For example,
-    random_batch is incorrect as actions and _idx_to_future_obs_idx are not
+    random_batch is incorrect as actions and _idx_to_episode_end are not
     shared. If the subprocess needs all of the functionality, a mp.Array
-    must be used for all numpy arrays in the replay buffer.
+    must be used for all numpy arrays in the replay buffer, as
+    rlkit.data_management.shared_replay_buffer.SharedObsDictReplayBuffer
+    does with shared memory.
 
+    If the buffer is created with a `storage_dir`, its arrays are np.memmap
+    files which the operating system already shares between processes, so no
+    multiprocessing arrays are created and a subprocess sees every array.
     """
 
     def __init__(
@@ -33,6 +38,8 @@ class SharedObsDictRelabelingBuffer(ObsDictRelabelingBuffer):
         self._mp_array_info = {}
         self._shared_obs_info = {}
         self._shared_next_obs_info = {}
+        if self._storage is not None:
+            return
 
         for obs_key, obs_arr in self._obs.items():
             ctype = ctypes.c_double
@@ -60,6 +67,8 @@ class SharedObsDictRelabelingBuffer(ObsDictRelabelingBuffer):
         """
         Use this function to register an array to be shared. This will wipe arr.
         """
+        if self._storage is not None:
+            return
         assert hasattr(self, arr_instance_var_name), arr_instance_var_name
         arr = getattr(self, arr_instance_var_name)
 
@@ -88,6 +97,8 @@ class SharedObsDictRelabelingBuffer(ObsDictRelabelingBuffer):
         passed directly to the subprocess as an argument to the fork call.
         """
         shared_obs_info, shared_next_obs_info, mp_array_info, shared_size = mp_info
+        if self._storage is not None:
+            self._storage.attach(self)
 
         self._shared_obs_info = shared_obs_info
         self._shared_next_obs_info = shared_next_obs_info
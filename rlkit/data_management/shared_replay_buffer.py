@@ -0,0 +1,372 @@
+import multiprocessing as mp
+
+import numpy as np
+
+from rlkit.data_management.obs_dict_replay_buffer import (
+    ObsDictRelabelingBuffer,
+)
+from rlkit.data_management.prioritized_replay_buffer import (
+    PrioritizedReplayBuffer,
+)
+from rlkit.data_management.random_state import get_random_state
+from rlkit.data_management.shared_memory_storage import SharedMemoryStorage
+from rlkit.data_management.simple_replay_buffer import (
+    SimpleReplayBuffer, SimpleReplayBufferDiscreteAction,
+)
+from rlkit.data_management.sum_tree import SumTree
+
+# Indices into self._counters
+_NUM_RESERVED = 0
+
+
+class _SharedSlots(object):
+    """
+    The shared memory and slot reservation of the shared buffers below.
+
+    Every array, including the insertion counter that _top and _size are
+    derived from, is allocated from a SharedMemoryStorage. A writer holds the
+    lock only to reserve a range of slots and to mark them as being written,
+    then writes its path without it, and takes the lock again to mark them
+    as written. Every slot counts its active writers and has a version that
+    is bumped when a write starts and ends, so readers can tell whether a
+    slot was written while they read it, see `_changed`.
+    """
+
+    @property
+    def _capacity(self):
+        raise NotImplementedError
+
+    def _create_storage(self, storage_dir):
+        assert storage_dir is None
+        storage = SharedMemoryStorage()
+        self._counters = storage.zeros('_counters', (1,), dtype=np.int64)
+        return storage
+
+    def _allocate_slot_states(self):
+        self._versions = self._storage.zeros(
+            '_versions', (self._capacity,), dtype=np.int64)
+        self._writers = self._storage.zeros(
+            '_writers', (self._capacity,), dtype=np.int64)
+
+    def __getstate__(self):
+        return self._storage.detach(self.__dict__)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._storage.attach(self)
+
+    def unlink(self):
+        """
+        Free the shared memory. Only call this from the creating process.
+        """
+        self._storage.unlink()
+
+    @property
+    def _top(self):
+        return int(self._counters[_NUM_RESERVED]) % self._capacity
+
+    @_top.setter
+    def _top(self, top):
+        assert top == 0, "Only add_path may move the pointer"
+
+    @property
+    def _size(self):
+        return min(int(self._counters[_NUM_RESERVED]), self._capacity)
+
+    @_size.setter
+    def _size(self, size):
+        assert size == 0, "Only add_path may change the size"
+        self._counters[_NUM_RESERVED] = 0
+
+    def save_checkpoint(self, directory):
+        raise NotImplementedError(
+            "Collectors may be writing to a shared buffer")
+
+    def load_checkpoint(self, directory):
+        raise NotImplementedError(
+            "Collectors may be writing to a shared buffer")
+
+    def _reserve(self, num_slots):
+        """
+        :return: The next `num_slots` slots, marked as being written.
+        """
+        with self._lock:
+            first = int(self._counters[_NUM_RESERVED])
+            slots = (first + np.arange(num_slots)) % self._capacity
+            # Mark the slots before _size counts them.
+            self._writers[slots] += 1
+            self._versions[slots] += 1
+            self._counters[_NUM_RESERVED] = first + num_slots
+        return slots
+
+    def _release(self, slots):
+        """
+        Mark `slots` from `_reserve` as written.
+        """
+        with self._lock:
+            self._versions[slots] += 1
+            self._writers[slots] -= 1
+
+    def _changed(self, indices, versions, writers):
+        """
+        :return: Whether each transition was being written before or while
+        it was read.
+        """
+        return (writers != 0) | (self._writers[indices] != 0) \
+            | (versions != self._versions[indices])
+
+    def _sample_indices(self, batch_size):
+        return get_random_state().randint(0, self._size, batch_size)
+
+    def num_steps_can_sample(self):
+        return self._size
+
+
+class SharedReplayBuffer(_SharedSlots, SimpleReplayBuffer):
+    """
+    SimpleReplayBuffer whose entire state lives in shared memory, so that
+    several collector processes can add paths while a learner samples.
+
+    Pass the buffer to the collector processes as an argument of
+    multiprocessing.Process: the copy attaches to the same memory instead of
+    copying the arrays.
+
+    Insertion is lock-light, see _SharedSlots. random_batch resamples the
+    transitions that had a writer or whose version changed while they were
+    read, so a batch never contains a reserved but unwritten or partially
+    written transition, even when writers wrap around onto each other's
+    slots.
+
+    See SharedObsDictReplayBuffer and SharedPrioritizedReplayBuffer for the
+    other buffers. De-duplicated observations are not supported since
+    consecutive transitions of one writer are not stored next to each other.
+    """
+
+    def __init__(self, max_replay_buffer_size, *args, **kwargs):
+        assert not kwargs.get('dedup_observations', False)
+        assert kwargs.get('storage_dir') is None
+        self._lock = mp.Lock()
+        super().__init__(max_replay_buffer_size, *args, **kwargs)
+        self._allocate_slot_states()
+
+    @property
+    def _capacity(self):
+        return self._max_replay_buffer_size
+
+    def add_sample(self, observation, action, reward, next_observation,
+                   terminal, env_info, **kwargs):
+        self.add_path(dict(
+            observations=[observation],
+            actions=[action],
+            rewards=[reward],
+            next_observations=[next_observation],
+            terminals=[terminal],
+            env_infos=[env_info],
+        ))
+
+    def add_path(self, path):
+        path_len = len(path['rewards'])
+        if path_len == 0:
+            return
+        if path_len > self._max_replay_buffer_size:
+            path = {
+                key: value[-self._max_replay_buffer_size:]
+                for key, value in path.items()
+            }
+            path_len = self._max_replay_buffer_size
+        slots = self._reserve(path_len)
+
+        self._observations[slots] = self._pack_obs(
+            np.asarray(path['observations']).reshape(path_len, -1))
+        self._next_obs[slots] = self._pack_obs(
+            np.asarray(path['next_observations']).reshape(path_len, -1))
+        self._actions[slots] = self._encode_actions(path['actions'])
+        self._rewards[slots] = np.asarray(
+            path['rewards']).reshape(path_len, 1)
+        self._terminals[slots] = np.asarray(
+            path['terminals']).reshape(path_len, 1)
+        for key in self._env_info_keys:
+            self._env_infos[key][slots] = np.asarray(
+                [info[key] for info in path['env_infos']]
+            ).reshape(path_len, -1)
+        self._release(slots)
+
+    def add_paths(self, paths):
+        for path in paths:
+            self.add_path(path)
+
+    def random_batch(self, batch_size):
+        _, batch = self._sample_batch(batch_size)
+        return batch
+
+    def _sample_batch(self, batch_size):
+        """
+        :return: The sampled slots and the batch read from them.
+        """
+        assert self._size > 0
+        indices = self._sample_indices(batch_size)
+        versions = self._versions[indices]
+        writers = self._writers[indices]
+        batch = self._get_batch(indices)
+        retry = np.flatnonzero(self._changed(indices, versions, writers))
+        while len(retry) > 0:
+            indices[retry] = self._sample_indices(len(retry))
+            versions[retry] = self._versions[indices[retry]]
+            writers[retry] = self._writers[indices[retry]]
+            retry_batch = self._get_batch(indices[retry])
+            for key, values in retry_batch.items():
+                batch[key][retry] = values
+            retry = retry[self._changed(
+                indices[retry], versions[retry], writers[retry])]
+        return indices, batch
+
+
+class SharedReplayBufferDiscreteAction(
+    SharedReplayBuffer, SimpleReplayBufferDiscreteAction
+):
+    pass
+
+
+class SharedPrioritizedReplayBuffer(
+    SharedReplayBuffer, PrioritizedReplayBuffer
+):
+    """
+    PrioritizedReplayBuffer whose sum-tree and largest priority live in
+    shared memory too, like the rest of a SharedReplayBuffer.
+
+    The sum-tree is guarded by the lock of the buffer, so every process sees
+    the priorities that any of them set. A new transition gets the largest
+    priority once it is written, so slots that were never written are not
+    sampled.
+    """
+
+    def __init__(self, max_replay_buffer_size, *args, **kwargs):
+        super().__init__(max_replay_buffer_size, *args, **kwargs)
+        self._sum_tree_lock = self._lock
+
+    def _create_storage(self, storage_dir):
+        storage = super()._create_storage(storage_dir)
+        self._max_priorities = storage.zeros('_max_priorities', (1,))
+        return storage
+
+    def _create_sum_tree(self, size):
+        self._sum_tree_nodes = self._storage.zeros(
+            '_sum_tree_nodes', (SumTree.num_nodes(size),))
+        return SumTree(size, nodes=self._sum_tree_nodes)
+
+    @property
+    def _max_priority(self):
+        return float(self._max_priorities[0])
+
+    @_max_priority.setter
+    def _max_priority(self, max_priority):
+        self._max_priorities[0] = max_priority
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['_sum_tree'] = None
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._sum_tree = SumTree(
+            self._max_replay_buffer_size, nodes=self._sum_tree_nodes)
+
+    def _release(self, slots):
+        super()._release(slots)
+        with self._sum_tree_lock:
+            self._sum_tree.update(slots, self._initial_priorities(slots))
+
+    def _sample_indices(self, batch_size):
+        with self._sum_tree_lock:
+            return PrioritizedReplayBuffer._sample_indices(self, batch_size)
+
+    def random_batch(self, batch_size):
+        indices, batch = self._sample_batch(batch_size)
+        with self._sum_tree_lock:
+            probabilities = self._sum_tree[indices] / self._sum_tree.total
+        weights = (self.num_steps_can_sample() * probabilities) ** -self.beta
+        batch['indices'] = indices.reshape(-1, 1)
+        batch['weights'] = (weights / weights.max()).reshape(-1, 1)
+        return batch
+
+
+class SharedPrioritizedReplayBufferDiscreteAction(
+    SharedPrioritizedReplayBuffer, SimpleReplayBufferDiscreteAction
+):
+    pass
+
+
+class SharedObsDictReplayBuffer(_SharedSlots, ObsDictRelabelingBuffer):
+    """
+    ObsDictRelabelingBuffer whose entire state lives in shared memory, like
+    a SharedReplayBuffer: the actions, terminals, observation dicts,
+    self._idx_to_episode_end and the insertion counter.
+
+    Every path is written to the slots it reserved, see _SharedSlots, and
+    its steps point to its own last slot in self._idx_to_episode_end, so the
+    future goals of a step come from its own path. random_batch rereads the
+    batch until none of its steps, nor the steps whose achieved goals
+    relabel it, were written while it was read.
+
+    Unlike with SharedObsDictRelabelingBuffer, a process that gets the
+    buffer as an argument of multiprocessing.Process can also sample from
+    it.
+    """
+
+    def __init__(self, max_size, env, *args, **kwargs):
+        assert kwargs.get('storage_dir') is None
+        self._lock = mp.Lock()
+        super().__init__(max_size, env, *args, **kwargs)
+        self._allocate_slot_states()
+
+    @property
+    def _capacity(self):
+        return self.max_size
+
+    def add_path(self, path):
+        path_len = len(path['rewards'])
+        if path_len == 0:
+            return
+        actions, terminals, obs, next_obs = self._preprocess_path(path)
+        terminals = np.asarray(terminals).reshape(path_len, 1)
+        if path_len > self.max_size:
+            actions = actions[-self.max_size:]
+            terminals = terminals[-self.max_size:]
+            obs = {key: value[-self.max_size:] for key, value in obs.items()}
+            next_obs = {
+                key: value[-self.max_size:] for key, value in next_obs.items()
+            }
+            path_len = self.max_size
+        slots = self._reserve(path_len)
+
+        self._actions[slots] = actions
+        self._terminals[slots] = terminals
+        for key in self.ob_keys_to_save + self.internal_keys:
+            self._obs[key][slots] = obs[key]
+            self._next_obs[key][slots] = next_obs[key]
+        self._idx_to_episode_end[slots] = slots[-1]
+        self._release(slots)
+
+    def add_paths(self, paths):
+        for path in paths:
+            self.add_path(path)
+
+    def random_batch(self, batch_size):
+        assert self._size > 0
+        num_future_goals = self._num_future_goals(batch_size)
+        indices = self._sample_indices(batch_size)
+        while True:
+            versions = self._versions[indices]
+            writers = self._writers[indices]
+            future_obs_idxs = self._sample_future_indices(
+                indices[batch_size - num_future_goals:])
+            future_versions = self._versions[future_obs_idxs]
+            future_writers = self._writers[future_obs_idxs]
+            batch = self._relabeled_batch(indices, future_obs_idxs)
+            changed = self._changed(indices, versions, writers)
+            changed[batch_size - num_future_goals:] |= self._changed(
+                future_obs_idxs, future_versions, future_writers)
+            if not changed.any():
+                return batch
+            indices[changed] = self._sample_indices(np.sum(changed))
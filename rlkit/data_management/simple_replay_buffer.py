@@ -3,6 +3,9 @@ from collections import OrderedDict
 import numpy as np
 import warnings
 
+from rlkit.data_management import checkpoint
+from rlkit.data_management.memmap_storage import MemmapStorage, allocate
+from rlkit.data_management.random_state import get_random_state
 from rlkit.data_management.replay_buffer import ReplayBuffer
 
 
@@ -15,63 +18,429 @@ class SimpleReplayBuffer(ReplayBuffer):
         action_dim,
         env_info_sizes,
         replace = True,
+        observation_dtype=np.float32,
+        action_dtype=np.float32,
+        reward_dtype=np.float32,
+        pack_observations=False,
+        dedup_observations=False,
+        storage_dir=None,
     ):
+        """
+        :param observation_dtype: Storage dtype of the observations. Use
+        np.uint8 for observations that only take small integer values, e.g.
+        the one-hot taxi and office observations.
+        :param action_dtype: Storage dtype of the actions.
+        :param reward_dtype: Storage dtype of the rewards.
+        :param pack_observations: If True, observations are assumed to be
+        binary and are stored bit-packed (8 features per byte). They are
+        unpacked to uint8 arrays when sampled.
+        :param dedup_observations: If True, every observation is stored once
+        and transition i finds its next observation at
+        self._next_obs_idx[i] instead of in a separate next observation array.
+        :param storage_dir: If set, the arrays are np.memmap files in this
+        directory (relative to the logger's snapshot directory) instead of
+        living in RAM. An existing buffer in the directory is reopened.
+        """
         self._observation_dim = observation_dim
         self._action_dim = action_dim
         self._max_replay_buffer_size = max_replay_buffer_size
-        self._observations = np.zeros((max_replay_buffer_size, observation_dim))
-        # It's a bit memory inefficient to save the observations twice,
-        # but it makes the code *much* easier since you no longer have to
-        # worry about termination conditions.
-        self._next_obs = np.zeros((max_replay_buffer_size, observation_dim))
-        self._actions = np.zeros((max_replay_buffer_size, action_dim))
+        self._storage = self._create_storage(storage_dir)
+        self._pack_observations = pack_observations
+        if pack_observations:
+            stored_observation_dim = (observation_dim + 7) // 8
+            observation_dtype = np.uint8
+        else:
+            stored_observation_dim = observation_dim
+        self._observations = allocate(
+            self._storage, '_observations',
+            (max_replay_buffer_size, stored_observation_dim),
+            dtype=observation_dtype,
+        )
+        self._dedup_observations = dedup_observations
+        if dedup_observations:
+            assert max_replay_buffer_size > 1
+            # self._next_obs_idx[i] = slot holding the next observation of the
+            # transition stored at slot i, or -1 if slot i only holds the
+            # final next observation of an episode (or operator segment) and
+            # is not a transition itself.
+            self._next_obs = None
+            self._next_obs_idx = allocate(
+                self._storage, '_next_obs_idx', (max_replay_buffer_size,),
+                dtype=np.int64 if max_replay_buffer_size >= 2 ** 31
+                else np.int32,
+                fill_value=-1,
+            )
+            self._num_transitions = 0
+            # The slot at self._top holds the next observation of the last
+            # transition that was added.
+            self._has_tail = False
+        else:
+            # It's a bit memory inefficient to save the observations twice,
+            # but it makes the code *much* easier since you no longer have to
+            # worry about termination conditions.
+            self._next_obs = allocate(
+                self._storage, '_next_obs',
+                (max_replay_buffer_size, stored_observation_dim),
+                dtype=observation_dtype,
+            )
+        self._actions = self._allocate_actions(action_dim, action_dtype)
         # Make everything a 2D np array to make it easier for other code to
         # reason about the shape of the data
-        self._rewards = np.zeros((max_replay_buffer_size, 1))
+        self._rewards = allocate(
+            self._storage, '_rewards', (max_replay_buffer_size, 1),
+            dtype=reward_dtype,
+        )
         # self._terminals[i] = a terminal was received at time i
-        self._terminals = np.zeros((max_replay_buffer_size, 1), dtype='uint8')
+        self._terminals = allocate(
+            self._storage, '_terminals', (max_replay_buffer_size, 1),
+            dtype='uint8',
+        )
         # Define self._env_infos[key][i] to be the return value of env_info[key]
         # at time i
         self._env_infos = {}
         for key, size in env_info_sizes.items():
-            self._env_infos[key] = np.zeros((max_replay_buffer_size, size))
+            self._env_infos[key] = allocate(
+                self._storage, '_env_infos/' + key,
+                (max_replay_buffer_size, size),
+            )
         self._env_info_keys = list(env_info_sizes.keys())
 
         self._replace = replace
 
         self._top = 0
         self._size = 0
+        if self._storage is not None:
+            for key, value in self._storage.load_state().items():
+                setattr(self, key, value)
+        # Slots written since the last checkpoint in self._checkpoint_dir
+        # start at self._checkpoint_top.
+        self._checkpoint_dir = None
+        self._checkpoint_top = self._top
+        self._steps_since_checkpoint = 0
+
+    def _create_storage(self, storage_dir):
+        if storage_dir is None:
+            return None
+        return MemmapStorage(storage_dir)
+
+    def _allocate_actions(self, action_dim, action_dtype):
+        return allocate(
+            self._storage, '_actions',
+            (self._max_replay_buffer_size, action_dim), dtype=action_dtype,
+        )
+
+    def _storage_state(self):
+        state = dict(_top=int(self._top), _size=int(self._size))
+        if self._dedup_observations:
+            state.update(
+                _num_transitions=int(self._num_transitions),
+                _has_tail=bool(self._has_tail),
+            )
+        return state
+
+    def flush(self):
+        """
+        Write a consistent snapshot of a disk-backed buffer to its
+        storage_dir. This happens automatically at the end of every epoch.
+        """
+        if self._storage is not None:
+            self._storage.flush(self._storage_state())
+
+    def end_epoch(self, epoch):
+        self.flush()
+
+    def _checkpoint_arrays(self):
+        arrays = dict(
+            _observations=self._observations,
+            _actions=self._actions,
+            _rewards=self._rewards,
+            _terminals=self._terminals,
+        )
+        if self._dedup_observations:
+            arrays['_next_obs_idx'] = self._next_obs_idx
+        else:
+            arrays['_next_obs'] = self._next_obs
+        for key in self._env_info_keys:
+            arrays['_env_infos/' + key] = self._env_infos[key]
+        return arrays
+
+    def save_checkpoint(self, directory):
+        """
+        Save the buffer to .npy files in `directory`. If the previous
+        checkpoint was saved to or loaded from the same directory, only the
+        slots written since then are copied.
+        """
+        dirty_slices = None
+        if directory == self._checkpoint_dir:
+            # One more slot for the next observation that de-duplicated
+            # buffers keep at self._top.
+            dirty_slices = checkpoint.ring_slices(
+                self._checkpoint_top,
+                self._steps_since_checkpoint + 1,
+                self._max_replay_buffer_size,
+            )
+        checkpoint.save_checkpoint(
+            directory, self._checkpoint_arrays(), self._storage_state(),
+            dirty_slices=dirty_slices,
+        )
+        self._mark_checkpoint(directory)
+
+    def load_checkpoint(self, directory):
+        state = checkpoint.load_checkpoint(
+            directory, self._checkpoint_arrays())
+        for key, value in state.items():
+            setattr(self, key, value)
+        self._mark_checkpoint(directory)
+
+    def _mark_checkpoint(self, directory):
+        self._checkpoint_dir = directory
+        self._checkpoint_top = self._top
+        self._steps_since_checkpoint = 0
 
     def add_sample(self, observation, action, reward, next_observation,
                    terminal, env_info, **kwargs):
-        self._observations[self._top] = observation
+        observation = self._pack_obs(observation)
+        next_observation = self._pack_obs(next_observation)
+        if self._dedup_observations:
+            self._start_transition(observation)
+            next_slot = (self._top + 1) % self._max_replay_buffer_size
+            self._invalidate(next_slot)
+            self._observations[next_slot] = next_observation
+            self._next_obs_idx[self._top] = next_slot
+            self._num_transitions += 1
+            self._has_tail = True
+        else:
+            self._observations[self._top] = observation
+            self._next_obs[self._top] = next_observation
         self._actions[self._top] = action
         self._rewards[self._top] = reward
         self._terminals[self._top] = terminal
-        self._next_obs[self._top] = next_observation
 
         for key in self._env_info_keys:
             self._env_infos[key][self._top] = env_info[key]
         self._advance()
 
+    def add_path(self, path):
+        """
+        Add a whole path with slice assignments instead of calling add_sample
+        once per step. Wrapping the pointer takes at most two copies.
+
+        :param path: Dict like one outputted by rlkit.samplers.util.rollout
+        """
+        path_len = len(path["rewards"])
+        if path_len == 0:
+            self.terminate_episode()
+            return
+        obs = self._pack_obs(np.asarray(path["observations"]))
+        next_obs = self._pack_obs(np.asarray(path["next_observations"]))
+        if self._dedup_observations:
+            start, positions = self._dedup_positions(obs, next_obs)
+            num_slots = positions[-1] + 2
+        else:
+            num_slots = path_len
+        if num_slots > self._max_replay_buffer_size:
+            # The path overwrites the whole buffer, so the slicing below does
+            # not apply. This is rare enough to not be worth optimizing.
+            return super().add_path(path)
+        actions = self._encode_actions(path["actions"])
+        rewards = np.asarray(path["rewards"]).reshape(path_len, 1)
+        terminals = np.asarray(path["terminals"]).reshape(path_len, 1)
+        env_infos = {
+            key: np.array([
+                env_info[key] for env_info in path["env_infos"]
+            ]).reshape(path_len, -1)
+            for key in self._env_info_keys
+        }
+        if self._dedup_observations:
+            self._add_dedup_path(start, positions, obs, actions, rewards,
+                                 next_obs, terminals, env_infos)
+        else:
+            for buffer_slice, path_slice in self._ring_slices(
+                    self._top, path_len):
+                self._observations[buffer_slice] = obs[path_slice]
+                self._next_obs[buffer_slice] = next_obs[path_slice]
+                self._actions[buffer_slice] = actions[path_slice]
+                self._rewards[buffer_slice] = rewards[path_slice]
+                self._terminals[buffer_slice] = terminals[path_slice]
+                for key in self._env_info_keys:
+                    self._env_infos[key][buffer_slice] = (
+                        env_infos[key][path_slice]
+                    )
+            self._advance(path_len)
+        self.terminate_episode()
+
+    def add_paths(self, paths):
+        """
+        Concatenate the paths and add them with a single add_path call.
+        """
+        paths = [path for path in paths if len(path["rewards"]) > 0]
+        if len(paths) == 0:
+            return
+        if len(paths) == 1:
+            return self.add_path(paths[0])
+        path = {
+            key: np.concatenate([np.asarray(p[key]) for p in paths], axis=0)
+            for key in ["observations", "actions", "rewards",
+                        "next_observations", "terminals"]
+        }
+        path["env_infos"] = [
+            env_info for p in paths for env_info in p["env_infos"]
+        ]
+        path["agent_infos"] = [
+            agent_info for p in paths for agent_info in p["agent_infos"]
+        ]
+        self.add_path(path)
+
+    def _dedup_positions(self, obs, next_obs):
+        """
+        :return: The slot the path starts at and the offset of every
+        transition from that slot.
+        """
+        path_len = len(obs)
+        # A new segment starts after step k unless obs[k + 1] == next_obs[k].
+        segment_starts = np.concatenate((
+            [False],
+            np.any(obs[1:] != next_obs[:-1], axis=1),
+        ))
+        start = self._top
+        if (
+            self._has_tail
+            and not np.array_equal(self._observations[self._top], obs[0])
+        ):
+            start = (start + 1) % self._max_replay_buffer_size
+        # Offset of every transition from `start`; each new segment leaves an
+        # extra slot for the final next observation of the previous one.
+        positions = np.arange(path_len) + np.cumsum(segment_starts)
+        return start, positions
+
+    def _add_dedup_path(self, start, positions, obs, actions, rewards,
+                        next_obs, terminals, env_infos):
+        path_len = len(obs)
+        num_slots = positions[-1] + 2
+        slots = (start + np.arange(num_slots)) % self._max_replay_buffer_size
+        self._num_transitions -= np.count_nonzero(
+            self._next_obs_idx[slots] >= 0)
+        self._next_obs_idx[slots] = -1
+        transition_slots = slots[positions]
+        next_slots = slots[positions + 1]
+        self._observations[next_slots] = next_obs
+        self._observations[transition_slots] = obs
+        self._next_obs_idx[transition_slots] = next_slots
+        self._actions[transition_slots] = actions
+        self._rewards[transition_slots] = rewards
+        self._terminals[transition_slots] = terminals
+        for key in self._env_info_keys:
+            self._env_infos[key][transition_slots] = env_infos[key]
+        self._num_transitions += path_len
+        # Leave self._top at the tail, like add_sample does.
+        self._advance(
+            (start - self._top) % self._max_replay_buffer_size
+            + num_slots - 1
+        )
+        self._has_tail = True
+
+    def _encode_actions(self, actions):
+        actions = np.asarray(actions)
+        return actions.reshape(len(actions), -1)
+
+    def _ring_slices(self, start, length):
+        """
+        :return: List of (buffer slice, path slice) pairs covering `length`
+        rows starting at `start`, split in two if the pointer wraps.
+        """
+        end = start + length
+        if end <= self._max_replay_buffer_size:
+            return [(slice(start, end), slice(0, length))]
+        num_pre_wrap_steps = self._max_replay_buffer_size - start
+        return [
+            (slice(start, self._max_replay_buffer_size),
+             slice(0, num_pre_wrap_steps)),
+            (slice(0, end - self._max_replay_buffer_size),
+             slice(num_pre_wrap_steps, length)),
+        ]
+
     def terminate_episode(self):
         pass
 
-    def _advance(self):
-        self._top = (self._top + 1) % self._max_replay_buffer_size
-        if self._size < self._max_replay_buffer_size:
-            self._size += 1
+    def _advance(self, num_steps=1):
+        self._top = (self._top + num_steps) % self._max_replay_buffer_size
+        self._size = min(self._size + num_steps, self._max_replay_buffer_size)
+        self._steps_since_checkpoint += num_steps
+
+    def _start_transition(self, observation):
+        """
+        Store `observation` at self._top as the start of a new transition.
+
+        If the slot holds the next observation of the previous transition and
+        it matches `observation`, the path simply continues and the slot is
+        shared. Otherwise (new episode or operator segment) the previous next
+        observation is kept and the transition starts at the following slot.
+        """
+        if (
+            self._has_tail
+            and not np.array_equal(self._observations[self._top], observation)
+        ):
+            self._advance()
+        self._has_tail = False
+        self._invalidate(self._top)
+        self._observations[self._top] = observation
+
+    def _invalidate(self, slot):
+        if self._next_obs_idx[slot] >= 0:
+            self._next_obs_idx[slot] = -1
+            self._num_transitions -= 1
+
+    def _sample_indices(self, batch_size):
+        replace = self._replace or self.num_steps_can_sample() < batch_size
+        random_state = get_random_state()
+        if not self._dedup_observations:
+            return random_state.choice(self._size, size=batch_size,
+                                    replace=replace)
+        assert self._num_transitions > 0
+        if not replace:
+            valid_indices = np.flatnonzero(
+                self._next_obs_idx[:self._size] >= 0)
+            return random_state.choice(valid_indices, size=batch_size,
+                                    replace=False)
+        # Reject the slots that only hold a final next observation.
+        indices = random_state.randint(0, self._size, batch_size)
+        invalid = np.flatnonzero(self._next_obs_idx[indices] < 0)
+        while len(invalid) > 0:
+            indices[invalid] = random_state.randint(0, self._size, len(invalid))
+            invalid = invalid[self._next_obs_idx[indices[invalid]] < 0]
+        return indices
+
+    def _batch_next_obs(self, indices):
+        if self._dedup_observations:
+            return self._observations[self._next_obs_idx[indices]]
+        return self._next_obs[indices]
+
+    def _pack_obs(self, obs):
+        if self._pack_observations:
+            return np.packbits(np.asarray(obs, dtype=bool), axis=-1)
+        return obs
+
+    def _unpack_obs(self, obs):
+        if self._pack_observations:
+            return np.unpackbits(obs, axis=-1, count=self._observation_dim)
+        return obs
+
+    def _batch_actions(self, indices):
+        return self._actions[indices]
 
     def random_batch(self, batch_size):
-        indices = np.random.choice(self._size, size=batch_size, replace=self._replace or self._size < batch_size)
-        if not self._replace and self._size < batch_size:
+        indices = self._sample_indices(batch_size)
+        if not self._replace and self.num_steps_can_sample() < batch_size:
             warnings.warn('Replace was set to false, but is temporarily set to true because batch size is larger than current size of replay.')
+        return self._get_batch(indices)
+
+    def _get_batch(self, indices):
         batch = dict(
-            observations=self._observations[indices],
-            actions=self._actions[indices],
+            observations=self._unpack_obs(self._observations[indices]),
+            actions=self._batch_actions(indices),
             rewards=self._rewards[indices],
             terminals=self._terminals[indices],
-            next_observations=self._next_obs[indices],
+            next_observations=self._unpack_obs(self._batch_next_obs(indices)),
         )
         for key in self._env_info_keys:
             assert key not in batch.keys()
@@ -91,6 +460,8 @@ class SimpleReplayBuffer(ReplayBuffer):
         }
 
     def num_steps_can_sample(self):
+        if self._dedup_observations:
+            return self._num_transitions
         return self._size
 
     def get_diagnostics(self):
@@ -100,17 +471,17 @@ class SimpleReplayBuffer(ReplayBuffer):
 
 
 class SimpleReplayBufferDiscreteAction(SimpleReplayBuffer):
+    """
+    Stores the integer index of each action and only expands it to a one-hot
+    vector when a batch is sampled.
+    """
 
-    def add_sample(self, observation, action, reward, next_observation,
-                   terminal, env_info, **kwargs):
-        new_action = np.zeros(self._action_dim)
-        new_action[action] = 1
-        return super().add_sample(
-            observation=observation,
-            action=new_action,
-            reward=reward,
-            next_observation=next_observation,
-            terminal=terminal,
-            env_info=env_info,
-            **kwargs
+    def _allocate_actions(self, action_dim, action_dtype):
+        self._one_hot_actions = np.eye(action_dim, dtype=action_dtype)
+        return allocate(
+            self._storage, '_actions', (self._max_replay_buffer_size, 1),
+            dtype=np.min_scalar_type(max(action_dim - 1, 0)),
         )
+
+    def _batch_actions(self, indices):
+        return self._one_hot_actions[self._actions[indices, 0]]
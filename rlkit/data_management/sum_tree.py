@@ -0,0 +1,85 @@
+import numpy as np
+
+from rlkit.data_management.random_state import get_random_state
+
+
+class SumTree(object):
+    """
+    Array-backed binary tree where every node holds the sum of its children.
+
+    Node 1 is the root, node i has children 2i and 2i + 1, and leaf j is
+    stored at node capacity + j. Updating a batch of leaves and sampling a
+    batch of leaves in proportion to their values both take O(log N) NumPy
+    operations, each vectorized over the batch.
+    """
+
+    def __init__(self, size, nodes=None):
+        """
+        :param nodes: Zero-filled array of num_nodes(size) floats to keep the
+        tree in, e.g. in shared memory. Defaults to a new array.
+        """
+        self._size = size
+        self._capacity = self.num_nodes(size) // 2
+        if nodes is None:
+            nodes = np.zeros(2 * self._capacity)
+        assert nodes.shape == (2 * self._capacity,)
+        self._tree = nodes
+
+    @staticmethod
+    def num_nodes(size):
+        capacity = 1
+        while capacity < size:
+            capacity *= 2
+        return 2 * capacity
+
+    @property
+    def total(self):
+        return self._tree[1]
+
+    def __getitem__(self, indices):
+        return self._tree[np.asarray(indices) + self._capacity]
+
+    def update(self, indices, values):
+        """
+        Set the leaves at `indices` to `values` and recompute their ancestors.
+        """
+        nodes = np.asarray(indices, dtype=np.int64).reshape(-1) \
+            + self._capacity
+        self._tree[nodes] = np.asarray(values).reshape(-1)
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self._tree[nodes] = (
+                self._tree[2 * nodes] + self._tree[2 * nodes + 1]
+            )
+            if nodes[0] == 1:
+                break
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        """
+        :param values: Array of numbers in [0, total).
+        :return: For each value, the index of the leaf whose prefix-sum
+        interval contains it.
+        """
+        values = np.minimum(
+            np.asarray(values, dtype=np.float64),
+            np.nextafter(self.total, 0),
+        )
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self._capacity:
+            left = 2 * nodes
+            left_values = self._tree[left]
+            go_right = values >= left_values
+            values = np.where(go_right, values - left_values, values)
+            nodes = left + go_right
+        return np.minimum(nodes - self._capacity, self._size - 1)
+
+    def sample(self, batch_size):
+        """
+        Sample leaf indices in proportion to their values, using one
+        uniformly drawn number per equal-size segment of the total.
+        """
+        segment = self.total / batch_size
+        offsets = get_random_state().random(batch_size)
+        values = (np.arange(batch_size) + offsets) * segment
+        return self.find(values)
@@ -1,5 +1,7 @@
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
+import h5py
 import numpy as np
 import torch
 import torch.optim as optim
@@ -24,23 +26,76 @@ from rlkit.core import logger
 
 import glob
 
-def load_hdf5(dataset, replay_buffer):
+def load_hdf5(dataset, replay_buffer, chunk_size=100000, num_workers=4):
+    """
+    Copy an offline dataset into `replay_buffer`, replacing its contents.
+
+    :param dataset: Dict of arrays, e.g. from d4rl's env.get_dataset(), or an
+    open h5py.File. Its arrays are read `chunk_size` transitions at a time and
+    written straight into the buffer slices, so at most `num_workers` chunks
+    are in memory at once.
+    :param num_workers: Number of chunks copied in parallel.
+
+    Unless the dataset has `next_observations`, the next observation of a
+    transition is the following observation. Transitions for which that is
+    not their next observation, i.e. the last one and those ending in a
+    timeout, are skipped unless they are terminal.
+    """
+    assert not replay_buffer._dedup_observations
     all_obs = dataset['observations']
     all_act = dataset['actions']
-    N = min(all_obs.shape[0], 1000000)
-    _obs = all_obs[:N]
-    _actions = all_act[:N]
-    _next_obs = np.concatenate([all_obs[1:N,:], np.zeros_like(_obs[0])[np.newaxis,:]], axis=0)
-    _rew = dataset['rewards'][:N]
-    _done = dataset['terminals'][:N]
-
-    replay_buffer._observations[:N] = _obs[:N]
-    replay_buffer._next_obs[:N] = _next_obs[:N]
-    replay_buffer._actions[:N] = _actions[:N]
-    replay_buffer._rewards[:N] = np.expand_dims(_rew, 1)[:N]
-    replay_buffer._terminals[:N] = np.expand_dims(_done, 1)[:N]
-    replay_buffer._size = N-1
-    replay_buffer._top = replay_buffer._size
+    all_rew = dataset['rewards']
+    all_next_obs = None
+    if 'next_observations' in dataset:
+        all_next_obs = dataset['next_observations']
+    total = all_obs.shape[0]
+    N = min(total, replay_buffer._max_replay_buffer_size)
+
+    terminals = np.asarray(dataset['terminals'][:N]).astype(bool)
+    keep = np.ones(N, dtype=bool)
+    if all_next_obs is None:
+        keep[N - 1] = N < total
+        if 'timeouts' in dataset:
+            keep &= ~np.asarray(dataset['timeouts'][:N]).astype(bool)
+        keep |= terminals
+    # Buffer slot of every kept transition.
+    slots = np.cumsum(keep) - 1
+
+    def select(values, mask):
+        return values if mask.all() else values[mask]
+
+    def copy_chunk(start):
+        end = min(start + chunk_size, N)
+        mask = keep[start:end]
+        num_kept = np.count_nonzero(mask)
+        if num_kept == 0:
+            return
+        first = slots[start:end][mask][0]
+        dst = slice(first, first + num_kept)
+        if all_next_obs is None:
+            obs = all_obs[start:min(end + 1, total)]
+            next_obs = obs[1:]
+            if len(next_obs) < end - start:
+                next_obs = np.concatenate(
+                    [next_obs, np.zeros_like(obs[:1])], axis=0)
+            obs = obs[:end - start]
+        else:
+            obs = all_obs[start:end]
+            next_obs = all_next_obs[start:end]
+        replay_buffer._observations[dst] = select(obs, mask)
+        replay_buffer._next_obs[dst] = select(next_obs, mask)
+        replay_buffer._actions[dst] = select(all_act[start:end], mask)
+        replay_buffer._rewards[dst] = \
+            select(all_rew[start:end], mask).reshape(-1, 1)
+        replay_buffer._terminals[dst] = \
+            select(terminals[start:end], mask).reshape(-1, 1)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        list(executor.map(copy_chunk, range(0, N, chunk_size)))
+
+    replay_buffer._top = 0
+    replay_buffer._size = 0
+    replay_buffer._advance(int(np.count_nonzero(keep)))
 
 class HDF5PathLoader:
     """
@@ -69,6 +124,8 @@ class HDF5PathLoader:
             env_info_key=None,
             obs_key=None,
             load_terminals=True,
+            hdf5_chunk_size=100000,
+            hdf5_num_workers=4,
 
             **kwargs
     ):
@@ -91,6 +148,8 @@ class HDF5PathLoader:
         self.obs_key = obs_key
         self.recompute_reward = recompute_reward
         self.load_terminals = load_terminals
+        self.hdf5_chunk_size = hdf5_chunk_size
+        self.hdf5_num_workers = hdf5_num_workers
 
         self.trainer.replay_buffer = self.replay_buffer
         self.trainer.demo_train_buffer = self.demo_train_buffer
@@ -98,7 +157,17 @@ class HDF5PathLoader:
 
     def load_demos(self, dataset):
         # Off policy
-        load_hdf5(dataset, self.replay_buffer)
+        if isinstance(dataset, str):
+            # Stream from the file instead of reading it into memory first.
+            with h5py.File(dataset, 'r') as f:
+                self.load_demos(f)
+            return
+        load_hdf5(
+            dataset,
+            self.replay_buffer,
+            chunk_size=self.hdf5_chunk_size,
+            num_workers=self.hdf5_num_workers,
+        )
 
     def get_batch_from_buffer(self, replay_buffer):
         batch = replay_buffer.random_batch(self.bc_batch_size)
@@ -412,7 +412,10 @@ def experiment(variant):
             demo_test_buffer=demo_test_buffer,
             **path_loader_kwargs
         )
-        path_loader.load_demos(expl_env.get_dataset())
+        # An HDF5 file is streamed into the buffer, get_dataset() loads the
+        # whole dataset into memory first.
+        path_loader.load_demos(
+            variant.get('env_dataset_path') or expl_env.get_dataset())
     if variant.get('save_initial_buffers', False):
         buffers = dict(
             replay_buffer=replay_buffer,
@@ -48,7 +48,10 @@ def _elem_or_tuple_to_variable(elem_or_tuple):
         return tuple(
             _elem_or_tuple_to_variable(e) for e in elem_or_tuple
         )
-    return ptu.from_numpy(elem_or_tuple).float()
+    if isinstance(elem_or_tuple, torch.Tensor):
+        # Already converted, e.g. sampled from a TorchReplayBuffer.
+        return elem_or_tuple
+    return ptu.from_numpy(elem_or_tuple)
 
 
 def elem_or_tuple_to_numpy(elem_or_tuple):
@@ -60,7 +63,9 @@ def elem_or_tuple_to_numpy(elem_or_tuple):
 
 def _filter_batch(np_batch):
     for k, v in np_batch.items():
-        if v.dtype == np.bool:
+        if isinstance(v, torch.Tensor):
+            yield k, v
+        elif v.dtype == np.bool_:
             yield k, v.astype(int)
         else:
             yield k, v
@@ -71,7 +76,8 @@ def np_to_pytorch_batch(np_batch):
         return {
             k: _elem_or_tuple_to_variable(x)
             for k, x in _filter_batch(np_batch)
-            if x.dtype != np.dtype('O')  # ignore object (e.g. dictionaries)
+            if isinstance(x, torch.Tensor)
+            or x.dtype != np.dtype('O')  # ignore object (e.g. dictionaries)
         }
     else:
         _elem_or_tuple_to_variable(np_batch)
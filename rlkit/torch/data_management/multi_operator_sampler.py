@@ -0,0 +1,170 @@
+import numpy as np
+import torch
+
+import rlkit.torch.pytorch_util as ptu
+from rlkit.data_management.random_state import get_random_state
+from rlkit.data_management.simple_replay_buffer import SimpleReplayBuffer
+
+
+class MultiOperatorBatchSampler(object):
+    """
+    Samples the minibatches of all operator replay buffers in one pass.
+
+    The indices of every uniformly sampled SimpleReplayBuffer are drawn with a
+    single RNG call. All batches are gathered into one contiguous float32
+    staging block, which is copied to ptu.device at once. Each operator gets a
+    dict of tensors that are contiguous views into the copied block.
+    Buffers with their own sampling (prioritized, de-duplicated, ...) are
+    sampled with their random_batch and staged the same way.
+
+    On a GPU, the host staging blocks are reused every `num_staging_blocks`
+    calls, and each call's copy on the device is new. On the CPU, the
+    batches are views into the staging block itself, so every call stages
+    into a new block, and batches stay valid however many are prefetched.
+    """
+
+    def __init__(
+            self,
+            replay_buffers,
+            pin_memory=True,
+            num_staging_blocks=2,
+    ):
+        """
+        :param replay_buffers: Dict from operator to replay buffer.
+        :param pin_memory: Stage in page-locked memory and copy to the GPU
+        asynchronously. Ignored without CUDA.
+        """
+        self.replay_buffers = replay_buffers
+        self._device = torch.device(ptu.device or 'cpu')
+        self._pin_memory = (
+            pin_memory
+            and self._device.type == 'cuda'
+            and torch.cuda.is_available()
+        )
+        self._num_staging_blocks = num_staging_blocks
+        self._blocks = [None] * num_staging_blocks
+        self._block_events = [None] * num_staging_blocks
+        self._next_block = 0
+        self._layouts = {}
+
+    def _is_uniform(self, replay_buffer):
+        buffer_class = type(replay_buffer)
+        return (
+            isinstance(replay_buffer, SimpleReplayBuffer)
+            and buffer_class.random_batch is SimpleReplayBuffer.random_batch
+            and buffer_class._sample_indices
+            is SimpleReplayBuffer._sample_indices
+            and not replay_buffer._dedup_observations
+            and replay_buffer._replace
+        )
+
+    def random_batches(self, batch_size):
+        """
+        :param batch_size: Batch size of all operators, or a dict from
+        operator to its batch size to sample only these operators.
+        :return: Dict from operator to a batch dict of tensors, for every
+        operator whose buffer is not empty.
+        """
+        if isinstance(batch_size, dict):
+            batch_sizes = batch_size
+        else:
+            batch_sizes = {
+                operator: batch_size
+                for operator, replay_buffer in self.replay_buffers.items()
+                if replay_buffer._size > 0
+            }
+        operators = [
+            operator for operator in self.replay_buffers
+            if operator in batch_sizes
+        ]
+        np_batches = {}
+        # One RNG call for every batch size of the uniform buffers.
+        for size in sorted(set(batch_sizes.values())):
+            uniform_operators = [
+                operator for operator in operators
+                if batch_sizes[operator] == size
+                and self._is_uniform(self.replay_buffers[operator])
+            ]
+            if not uniform_operators:
+                continue
+            sizes = np.array([
+                self.replay_buffers[operator]._size
+                for operator in uniform_operators
+            ])
+            all_indices = (
+                get_random_state().random((len(uniform_operators), size))
+                * sizes[:, None]
+            ).astype(np.int64)
+            for operator, indices in zip(uniform_operators, all_indices):
+                np_batches[operator] = \
+                    self.replay_buffers[operator]._get_batch(indices)
+        for operator in operators:
+            if operator not in np_batches:
+                np_batches[operator] = self.replay_buffers[operator] \
+                    .random_batch(batch_sizes[operator])
+        # Stage in the order of the buffers.
+        np_batches = {operator: np_batches[operator] for operator in operators}
+        return self._stage(np_batches)
+
+    def _compute_layout(self, np_batches):
+        layout = {}
+        offset = 0
+        for operator, np_batch in np_batches.items():
+            layout[operator] = {}
+            for key, values in np_batch.items():
+                if values.dtype == np.dtype('O'):
+                    continue
+                end = offset + values.size
+                layout[operator][key] = (offset, end, values.shape)
+                offset = end
+        return layout, offset
+
+    def _staging_block(self, block_size):
+        slot = self._next_block
+        self._next_block = (slot + 1) % self._num_staging_blocks
+        if self._block_events[slot] is not None:
+            # Wait until the last copy out of this block has finished.
+            self._block_events[slot].synchronize()
+        if self._blocks[slot] is None or len(self._blocks[slot]) < block_size:
+            self._blocks[slot] = torch.empty(
+                block_size, dtype=torch.float32,
+                pin_memory=self._pin_memory,
+            )
+        return slot, self._blocks[slot][:block_size]
+
+    def _stage(self, np_batches):
+        layout_key = tuple(
+            (operator, key, values.shape, values.dtype.char)
+            for operator, np_batch in np_batches.items()
+            for key, values in np_batch.items()
+        )
+        if layout_key not in self._layouts:
+            # The schedule of an UpdateScheduler alternates between a few
+            # layouts, which share the staging blocks.
+            self._layouts[layout_key] = self._compute_layout(np_batches)
+        layout, block_size = self._layouts[layout_key]
+
+        if self._device.type == 'cpu':
+            # The batches are views into the block, so reusing it would
+            # overwrite batches that are still queued, e.g. by a
+            # BatchPrefetcher.
+            slot, block = None, torch.empty(block_size, dtype=torch.float32)
+        else:
+            slot, block = self._staging_block(block_size)
+        staging = block.numpy()
+        for operator, fields in layout.items():
+            for key, (offset, end, shape) in fields.items():
+                staging[offset:end].reshape(shape)[...] = \
+                    np_batches[operator][key]
+
+        device_block = block.to(self._device, non_blocking=self._pin_memory)
+        if self._pin_memory:
+            self._block_events[slot] = torch.cuda.Event()
+            self._block_events[slot].record()
+        batches = {}
+        for operator, fields in layout.items():
+            batches[operator] = {
+                key: device_block[offset:end].view(shape)
+                for key, (offset, end, shape) in fields.items()
+            }
+        return batches
@@ -0,0 +1,206 @@
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+import rlkit.torch.pytorch_util as ptu
+from rlkit.data_management.replay_buffer import ReplayBuffer
+
+
+class TorchReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer whose storage is torch tensors, so that `random_batch`
+    samples with torch.randint and returns tensors on ptu.device that the
+    trainers use without calling np_to_pytorch_batch.
+
+    By default the storage lives on ptu.device. If the buffer does not fit in
+    GPU memory, keep it on the CPU with `storage_device='cpu'` and
+    `pin_memory=True`: batches are then gathered into pinned staging tensors
+    and copied to ptu.device asynchronously.
+    """
+
+    def __init__(
+            self,
+            max_replay_buffer_size,
+            observation_dim,
+            action_dim,
+            env_info_sizes=None,
+            discrete_actions=False,
+            storage_device=None,
+            pin_memory=False,
+    ):
+        """
+        :param discrete_actions: If True, actions are stored as integer
+        indices and expanded to one-hot vectors when sampled.
+        :param storage_device: Where to keep the data. Defaults to ptu.device.
+        :param pin_memory: Stage batches of a CPU buffer in page-locked memory
+        before copying them to ptu.device. Ignored without CUDA.
+        """
+        if env_info_sizes is None:
+            env_info_sizes = {}
+        if storage_device is None:
+            storage_device = ptu.device
+        self._storage_device = torch.device(storage_device or 'cpu')
+        self._device = torch.device(ptu.device or 'cpu')
+        self._pin_memory = (
+            pin_memory
+            and self._storage_device.type == 'cpu'
+            and torch.cuda.is_available()
+        )
+        self._observation_dim = observation_dim
+        self._action_dim = action_dim
+        self._max_replay_buffer_size = max_replay_buffer_size
+        self._discrete_actions = discrete_actions
+
+        self._observations = self._zeros(observation_dim)
+        self._next_obs = self._zeros(observation_dim)
+        if discrete_actions:
+            self._actions = self._zeros(1, dtype=torch.long)
+            self._one_hot_actions = torch.eye(action_dim, device=self._device)
+        else:
+            self._actions = self._zeros(action_dim)
+        self._rewards = self._zeros(1)
+        self._terminals = self._zeros(1)
+        self._env_infos = {}
+        for key, size in env_info_sizes.items():
+            self._env_infos[key] = self._zeros(size)
+        self._env_info_keys = list(env_info_sizes.keys())
+
+        # Two sets of pinned staging tensors, so that one can be filled while
+        # the other is still being copied to the device.
+        self._staging = [{}, {}]
+        self._staging_events = [None, None]
+        self._staging_slot = 0
+
+        self._top = 0
+        self._size = 0
+
+    def _zeros(self, dim, dtype=torch.float32):
+        return torch.zeros(
+            (self._max_replay_buffer_size, dim),
+            dtype=dtype,
+            device=self._storage_device,
+        )
+
+    def _to_storage(self, array, dtype=torch.float32):
+        return torch.as_tensor(
+            np.asarray(array), dtype=dtype, device=self._storage_device)
+
+    def add_sample(self, observation, action, reward, next_observation,
+                   terminal, env_info=None, **kwargs):
+        path = dict(
+            observations=[observation],
+            actions=[action],
+            rewards=[reward],
+            next_observations=[next_observation],
+            terminals=[terminal],
+            env_infos=[env_info or {}],
+        )
+        self.add_path(path)
+
+    def add_path(self, path):
+        """
+        Copy a whole path to the storage device at once.
+        """
+        path_len = len(path['rewards'])
+        if path_len == 0:
+            return
+        if path_len > self._max_replay_buffer_size:
+            path = {
+                key: value[-self._max_replay_buffer_size:]
+                for key, value in path.items()
+            }
+            path_len = self._max_replay_buffer_size
+        data = {
+            '_observations': self._to_storage(
+                path['observations']).reshape(path_len, -1),
+            '_next_obs': self._to_storage(
+                path['next_observations']).reshape(path_len, -1),
+            '_rewards': self._to_storage(path['rewards']).reshape(path_len, 1),
+            '_terminals': self._to_storage(
+                path['terminals']).reshape(path_len, 1),
+        }
+        if self._discrete_actions:
+            actions = self._to_storage(path['actions'], dtype=torch.long)
+            if actions.numel() != path_len:
+                # One-hot actions
+                actions = actions.reshape(path_len, -1).argmax(dim=1)
+            data['_actions'] = actions.reshape(path_len, 1)
+        else:
+            data['_actions'] = self._to_storage(
+                path['actions']).reshape(path_len, -1)
+        env_infos = {
+            key: self._to_storage(
+                [info[key] for info in path['env_infos']]
+            ).reshape(path_len, -1)
+            for key in self._env_info_keys
+        }
+
+        end = self._top + path_len
+        num_pre_wrap_steps = min(end, self._max_replay_buffer_size) - self._top
+        slices = [(slice(self._top, self._top + num_pre_wrap_steps),
+                   slice(0, num_pre_wrap_steps))]
+        if num_pre_wrap_steps < path_len:
+            slices.append((slice(0, path_len - num_pre_wrap_steps),
+                           slice(num_pre_wrap_steps, path_len)))
+        for buffer_slice, path_slice in slices:
+            for name, values in data.items():
+                getattr(self, name)[buffer_slice] = values[path_slice]
+            for key, values in env_infos.items():
+                self._env_infos[key][buffer_slice] = values[path_slice]
+        self._top = end % self._max_replay_buffer_size
+        self._size = min(self._size + path_len, self._max_replay_buffer_size)
+
+    def terminate_episode(self):
+        pass
+
+    def num_steps_can_sample(self):
+        return self._size
+
+    def random_batch(self, batch_size):
+        indices = torch.randint(
+            0, self._size, (batch_size,), device=self._storage_device)
+        sources = dict(
+            observations=self._observations,
+            actions=self._actions,
+            rewards=self._rewards,
+            terminals=self._terminals,
+            next_observations=self._next_obs,
+        )
+        for key in self._env_info_keys:
+            assert key not in sources.keys()
+            sources[key] = self._env_infos[key]
+        if self._pin_memory:
+            batch = self._stage(sources, indices)
+        else:
+            batch = {
+                key: source[indices].to(self._device)
+                for key, source in sources.items()
+            }
+        if self._discrete_actions:
+            batch['actions'] = self._one_hot_actions[batch['actions'][:, 0]]
+        return batch
+
+    def _stage(self, sources, indices):
+        slot = self._staging_slot
+        self._staging_slot = 1 - slot
+        if self._staging_events[slot] is not None:
+            # Wait until the last copy out of this slot has finished.
+            self._staging_events[slot].synchronize()
+        staging = self._staging[slot]
+        batch = {}
+        for key, source in sources.items():
+            shape = (len(indices), source.shape[1])
+            if key not in staging or staging[key].shape != shape:
+                staging[key] = torch.empty(
+                    shape, dtype=source.dtype, pin_memory=True)
+            torch.index_select(source, 0, indices, out=staging[key])
+            batch[key] = staging[key].to(self._device, non_blocking=True)
+        self._staging_events[slot] = torch.cuda.Event()
+        self._staging_events[slot].record()
+        return batch
+
+    def get_diagnostics(self):
+        return OrderedDict([
+            ('size', self._size)
+        ])
@@ -0,0 +1,162 @@
+"""
+Data-parallel training with several processes, launched either locally with
+torch.multiprocessing, by torchrun, or by mpirun.
+
+Every process collects its own data into its own replay buffers and trains
+its own copy of the networks. The optimizers, e.g.
+rlkit.torch.optim.distributed_adam.DistributedAdam, average the gradients
+over the processes, so the copies stay the same. As with MpiAdam, every
+process has to run the same updates in the same order, e.g. train the same
+operators in every train call.
+"""
+import os
+import socket
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+
+def is_initialized():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    """
+    :return: Rank of this process in the torch.distributed process group,
+    or else in MPI.COMM_WORLD. 0 without either.
+    """
+    if is_initialized():
+        return dist.get_rank()
+    if MPI is not None:
+        return MPI.COMM_WORLD.Get_rank()
+    return 0
+
+
+def get_world_size():
+    if is_initialized():
+        return dist.get_world_size()
+    if MPI is not None:
+        return MPI.COMM_WORLD.Get_size()
+    return 1
+
+
+def is_main_process():
+    return get_rank() == 0
+
+
+def all_reduce_min(values):
+    """
+    :param values: 1D array of integers.
+    :return: The element-wise minimum of `values` over all processes.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if get_world_size() == 1:
+        return values
+    if is_initialized():
+        tensor = torch.from_numpy(values.copy())
+        if dist.get_backend() == 'nccl':
+            tensor = tensor.cuda()
+        dist.all_reduce(tensor, op=dist.ReduceOp.MIN)
+        return tensor.cpu().numpy()
+    result = np.empty_like(values)
+    MPI.COMM_WORLD.Allreduce(values, result, op=MPI.MIN)
+    return result
+
+
+def broadcast_object(obj, src=0):
+    """
+    :return: `obj` of process `src`, on every process.
+    """
+    if get_world_size() == 1:
+        return obj
+    if is_initialized():
+        objects = [obj]
+        dist.broadcast_object_list(objects, src=src)
+        return objects[0]
+    return MPI.COMM_WORLD.bcast(obj, root=src)
+
+
+def init_data_parallel(backend='gloo', rank=None, world_size=None,
+                       init_method=None):
+    """
+    Join the torch.distributed process group of a data-parallel run.
+
+    :param backend: 'gloo' for CPUs, 'nccl' for GPUs or 'mpi' if torch was
+    built with MPI.
+    :param rank: Defaults to the RANK environment variable set by torchrun
+    or, under mpirun, to the rank in MPI.COMM_WORLD.
+    :param world_size: Defaults to WORLD_SIZE or the size of MPI.COMM_WORLD.
+    :param init_method: Defaults to the MASTER_ADDR and MASTER_PORT
+    environment variables, localhost:29500 if they are not set.
+    """
+    if rank is None:
+        if 'RANK' in os.environ or MPI is None:
+            rank = int(os.environ.get('RANK', 0))
+        else:
+            rank = MPI.COMM_WORLD.Get_rank()
+    if world_size is None:
+        if 'WORLD_SIZE' in os.environ or MPI is None:
+            world_size = int(os.environ.get('WORLD_SIZE', 1))
+        else:
+            world_size = MPI.COMM_WORLD.Get_size()
+    if init_method is None:
+        os.environ.setdefault('MASTER_ADDR', 'localhost')
+        os.environ.setdefault('MASTER_PORT', '29500')
+        init_method = 'env://'
+    dist.init_process_group(
+        backend,
+        init_method=init_method,
+        rank=rank,
+        world_size=world_size,
+    )
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def _run_process(rank, fn, args, world_size, backend, port, intra_op_threads):
+    torch.set_num_threads(intra_op_threads)
+    init_data_parallel(
+        backend,
+        rank=rank,
+        world_size=world_size,
+        init_method='tcp://localhost:{}'.format(port),
+    )
+    try:
+        fn(*args)
+    finally:
+        dist.destroy_process_group()
+
+
+def launch_data_parallel(fn, num_processes, args=(), backend='gloo',
+                         intra_op_threads=None):
+    """
+    Run `fn(*args)` in `num_processes` local processes that form a
+    torch.distributed process group, and wait for all of them.
+
+    The processes are started with the spawn method, so `fn` has to be
+    importable, e.g. a module-level function of the launching script.
+
+    :param intra_op_threads: Torch threads of every process. Defaults to the
+    current number of threads divided by `num_processes`, so that the
+    processes do not oversubscribe the cores.
+    """
+    if intra_op_threads is None:
+        intra_op_threads = max(1, torch.get_num_threads() // num_processes)
+    mp.spawn(
+        _run_process,
+        args=(fn, args, num_processes, backend, _free_port(),
+              intra_op_threads),
+        nprocs=num_processes,
+        join=True,
+    )
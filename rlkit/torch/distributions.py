@@ -31,6 +31,13 @@ class Distribution(TorchDistribution):
     def get_diagnostics(self):
         return {}
 
+    def get_diagnostic_tensors(self):
+        """
+        :return: Dict from name to a tensor of values, the device-side
+        counterpart of get_diagnostics for rlkit.torch.metrics.EpochStatistics.
+        """
+        return {}
+
 
 class TorchDistributionWrapper(Distribution):
     def __init__(self, distribution: TorchDistribution):
@@ -427,3 +434,10 @@ class TanhNormal(Distribution):
             ptu.get_numpy(torch.log(self.normal_std)),
         ))
         return stats
+
+    def get_diagnostic_tensors(self):
+        return OrderedDict([
+            ('mean', self.mean),
+            ('normal/std', self.normal_std),
+            ('normal/log_std', torch.log(self.normal_std)),
+        ])
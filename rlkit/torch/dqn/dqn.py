@@ -7,6 +7,7 @@ from torch import nn as nn
 
 import rlkit.torch.pytorch_util as ptu
 from rlkit.core.eval_util import create_stats_ordered_dict
+from rlkit.torch.metrics import EpochStatistics
 from rlkit.torch.torch_rl_algorithm import TorchTrainer
 
 
@@ -22,7 +23,16 @@ class DQNTrainer(TorchTrainer):
 
             discount=0.99,
             reward_scale=1.0,
+            mixed_precision=False,
+            accumulate_statistics=False,
     ):
+        """
+        :param mixed_precision: Compute the loss under bfloat16 autocast, see
+        rlkit.torch.pytorch_util.autocast.
+        :param accumulate_statistics: Record the statistics of every train
+        step on the device, see rlkit.torch.metrics.EpochStatistics, and
+        report them over the whole epoch instead of for its first batch.
+        """
         super().__init__()
         self.qf = qf
         self.target_qf = target_qf
@@ -36,7 +46,10 @@ class DQNTrainer(TorchTrainer):
         self.discount = discount
         self.reward_scale = reward_scale
         self.qf_criterion = qf_criterion or nn.MSELoss()
+        self.mixed_precision = mixed_precision
         self.eval_statistics = OrderedDict()
+        self.accumulate_statistics = accumulate_statistics
+        self.epoch_statistics = EpochStatistics()
         self._n_train_steps_total = 0
         self._need_to_update_eval_statistics = True
 
@@ -51,14 +64,15 @@ class DQNTrainer(TorchTrainer):
         Compute loss
         """
 
-        target_q_values = self.target_qf(next_obs).detach().max(
-            1, keepdim=True
-        )[0]
-        y_target = rewards + (1. - terminals) * self.discount * target_q_values
-        y_target = y_target.detach()
-        # actions is a one-hot vector
-        y_pred = torch.sum(self.qf(obs) * actions, dim=1, keepdim=True)
-        qf_loss = self.qf_criterion(y_pred, y_target)
+        with ptu.autocast(self.mixed_precision):
+            target_q_values = self.target_qf(next_obs).detach().max(
+                1, keepdim=True
+            )[0]
+            y_target = rewards + (1. - terminals) * self.discount * target_q_values
+            y_target = y_target.detach()
+            # actions is a one-hot vector
+            y_pred = torch.sum(self.qf(obs) * actions, dim=1, keepdim=True)
+            qf_loss = self.qf_criterion(y_pred, y_target)
 
         """
         Soft target network updates
@@ -78,7 +92,10 @@ class DQNTrainer(TorchTrainer):
         """
         Save some statistics for eval using just one batch.
         """
-        if self._need_to_update_eval_statistics:
+        if self.accumulate_statistics:
+            self.epoch_statistics.add_scalar('QF Loss', qf_loss)
+            self.epoch_statistics.add_values('Y Predictions', y_pred)
+        elif self._need_to_update_eval_statistics:
             self._need_to_update_eval_statistics = False
             self.eval_statistics['QF Loss'] = np.mean(ptu.get_numpy(qf_loss))
             self.eval_statistics.update(create_stats_ordered_dict(
@@ -88,10 +105,13 @@ class DQNTrainer(TorchTrainer):
         self._n_train_steps_total += 1
 
     def get_diagnostics(self):
+        if self.accumulate_statistics:
+            return self.epoch_statistics.get_diagnostics()
         return self.eval_statistics
 
     def end_epoch(self, epoch):
         self._need_to_update_eval_statistics = True
+        self.epoch_statistics.reset()
 
     @property
     def networks(self):
@@ -22,9 +22,16 @@ class HERTrainer(TorchTrainer):
     def end_epoch(self, epoch):
         self._base_trainer.end_epoch(epoch)
 
+    def end_training(self):
+        self._base_trainer.end_training()
+
     @property
     def networks(self):
         return self._base_trainer.networks
 
+    @property
+    def td_error_tracker(self):
+        return getattr(self._base_trainer, 'td_error_tracker', None)
+
     def get_snapshot(self):
         return self._base_trainer.get_snapshot()
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+import rlkit.torch.pytorch_util as ptu
+
+
+class EpochStatistics(object):
+    """
+    Accumulates training statistics over an epoch on the device.
+
+    Every `add_*` call only queues a few reductions on the device. The
+    results are copied to the host once, in `get_diagnostics`, so recording
+    statistics at every gradient step does not synchronize with the device.
+    The keys are the same as those of create_stats_ordered_dict.
+    """
+
+    def __init__(self):
+        self._scalars = OrderedDict()
+        self._values = OrderedDict()
+
+    def add_scalar(self, name, value):
+        """
+        Record e.g. a loss. Its mean over the epoch is reported as `name`.
+        """
+        value = torch.as_tensor(value).detach().float().mean()
+        if name in self._scalars:
+            count, total = self._scalars[name]
+            self._scalars[name] = (count + 1, total + value)
+        else:
+            self._scalars[name] = (1, value)
+
+    def add_values(self, name, values):
+        """
+        Record a batch of values, e.g. Q predictions. Their mean, std, max
+        and min over the epoch are reported.
+        """
+        values = values.detach().float()
+        count = values.numel()
+        mean = values.mean()
+        # Sum of squared deviations from the mean. Unlike the sum of squares,
+        # it does not cancel for values with a large mean.
+        m2 = ((values - mean) ** 2).sum()
+        minimum = values.min()
+        maximum = values.max()
+        if name in self._values:
+            (old_count, old_mean, old_m2,
+             old_minimum, old_maximum) = self._values[name]
+            # Chan et al.'s parallel update of the mean and M2.
+            total_count = old_count + count
+            delta = mean - old_mean
+            mean = old_mean + delta * (count / total_count)
+            m2 = old_m2 + m2 + delta ** 2 * (old_count * count / total_count)
+            count = total_count
+            minimum = torch.min(minimum, old_minimum)
+            maximum = torch.max(maximum, old_maximum)
+        self._values[name] = (count, mean, m2, minimum, maximum)
+
+    def get_diagnostics(self):
+        tensors = [total for _, total in self._scalars.values()]
+        for _, mean, m2, minimum, maximum in self._values.values():
+            tensors += [mean, m2, minimum, maximum]
+        if not tensors:
+            return OrderedDict()
+        # One copy to the host for all statistics.
+        numbers = ptu.get_numpy(torch.stack(tensors)).astype(np.float64)
+        stats = OrderedDict()
+        for i, (name, (count, _)) in enumerate(self._scalars.items()):
+            stats[name] = numbers[i] / count
+        numbers = numbers[len(self._scalars):].reshape(-1, 4)
+        for (name, (count, *_)), (mean, m2, minimum, maximum) \
+                in zip(self._values.items(), numbers):
+            stats[name + ' Mean'] = mean
+            stats[name + ' Std'] = np.sqrt(max(m2 / count, 0))
+            stats[name + ' Max'] = maximum
+            stats[name + ' Min'] = minimum
+        return stats
+
+    def reset(self):
+        self._scalars = OrderedDict()
+        self._values = OrderedDict()
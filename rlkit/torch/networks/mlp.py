@@ -63,7 +63,12 @@ class Mlp(PyTorchModule):
             if self.layer_norm and i < len(self.fcs) - 1:
                 h = self.layer_norms[i](h)
             h = self.hidden_activation(h)
-        preactivation = self.last_fc(h)
+        if ptu.is_autocast_enabled():
+            # Keep outputs like Q-values at full precision.
+            with ptu.autocast(False):
+                preactivation = self.last_fc(h.float())
+        else:
+            preactivation = self.last_fc(h)
         output = self.output_activation(preactivation)
         if return_preactivations:
             return output, preactivation
@@ -341,3 +346,132 @@ class ParallelMlp(nn.Module):
         flat = self.network(x)
         batch_size = x.shape[0]
         return flat.view(batch_size, -1, self.num_heads)
+
+
+class StackedMlp(PyTorchModule):
+    """
+    Several Mlps (or ConcatMlps) with identical architectures whose
+    parameters are stacked, so that all of them are evaluated with one
+    batched matmul per layer.
+
+    The first dimension of the output, and of the input unless all Mlps get
+    the same input, indexes the Mlp. The Mlps themselves keep working: their
+    parameters are replaced by views into the stacked parameters, so they
+    see every update made through this module, including moving it to
+    another device.
+    """
+    def __init__(self, mlps):
+        super().__init__()
+        mlps = list(mlps)
+        assert self.can_stack(mlps)
+        first = mlps[0]
+        self.hidden_activation = first.hidden_activation
+        self.output_activation = first.output_activation
+        self.weights = nn.ParameterList()
+        self.biases = nn.ParameterList()
+        for layer in range(len(first.fcs) + 1):
+            fcs = [(mlp.fcs + [mlp.last_fc])[layer] for mlp in mlps]
+            # (num mlps, out, in), so that every Mlp's weight is contiguous.
+            self.weights.append(nn.Parameter(
+                torch.stack([fc.weight.data for fc in fcs])))
+            self.biases.append(nn.Parameter(
+                torch.stack([fc.bias.data for fc in fcs]).unsqueeze(1)))
+        # A plain list, so that the Mlps' parameters are not counted twice.
+        self._mlps = mlps
+        self._share_parameters()
+
+    @staticmethod
+    def can_stack(mlps):
+        first = mlps[0]
+        if type(first) not in (Mlp, ConcatMlp):
+            return False
+        for mlp in mlps:
+            if (
+                    type(mlp) is not type(first)
+                    or mlp.layer_norm
+                    or mlp.hidden_activation is not first.hidden_activation
+                    or mlp.output_activation is not first.output_activation
+                    or getattr(mlp, 'dim', 1) != 1
+                    or len(mlp.fcs) != len(first.fcs)
+            ):
+                return False
+            for fc, first_fc in zip(
+                    mlp.fcs + [mlp.last_fc], first.fcs + [first.last_fc]):
+                if fc.weight.shape != first_fc.weight.shape:
+                    return False
+        return True
+
+    def _share_parameters(self):
+        for i, mlp in enumerate(self._mlps):
+            for fc, weight, bias in zip(
+                    mlp.fcs + [mlp.last_fc], self.weights, self.biases):
+                fc.weight = nn.Parameter(weight.data[i])
+                fc.bias = nn.Parameter(bias.data[i, 0])
+
+    def _apply(self, *args, **kwargs):
+        module = super()._apply(*args, **kwargs)
+        self._share_parameters()
+        return module
+
+    def forward(self, *inputs, indices=None):
+        """
+        :param inputs: Tensors of shape (num mlps, batch size, input size),
+        or (batch size, input size) to give every Mlp the same input. Several
+        inputs are concatenated, like ConcatMlp does.
+        :param indices: If set, only evaluate the Mlps with these indices,
+        in this order. The first dimension of the input must match.
+        """
+        h = torch.cat(inputs, dim=-1)
+        num_layers = len(self.weights)
+        for layer, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            if indices is not None:
+                weight, bias = weight[indices], bias[indices]
+            if layer == num_layers - 1 and ptu.is_autocast_enabled():
+                # Keep the outputs at full precision, like Mlp.
+                with ptu.autocast(False):
+                    h = self._linear(h.float(), weight, bias)
+            else:
+                h = self._linear(h, weight, bias)
+            if layer < num_layers - 1:
+                h = self.hidden_activation(h)
+        return self.output_activation(h)
+
+    @staticmethod
+    def _linear(h, weight, bias):
+        if h.dim() == 2:
+            return torch.matmul(h, weight.transpose(1, 2)) + bias
+        return torch.baddbmm(bias, h, weight.transpose(1, 2))
+
+
+class TwinQ(PyTorchModule):
+    """
+    Evaluates two Q-functions, e.g. the critics of SAC, with one call.
+
+    Mlp critics with identical architectures are stacked into a StackedMlp
+    and both heads are computed in one grouped forward. Other critics, like
+    the relational QValueReNN, are called one after the other.
+
+    Grouping the QValueReNN critics of FetchBlockConstruction with
+    torch.func.vmap over their stacked parameters gives the same Q-values,
+    but a forward and backward pass is 5 to 30% slower on the CPU for 1 to
+    6 blocks, also when the critics of 4 operators are grouped at once
+    instead of looping over the operators, see
+    scripts/benchmark_twin_q.py. So they are not grouped.
+    """
+    def __init__(self, qf1, qf2):
+        super().__init__()
+        if StackedMlp.can_stack([qf1, qf2]):
+            self.stacked_qf = StackedMlp([qf1, qf2])
+        else:
+            self.stacked_qf = None
+            self.qf1 = qf1
+            self.qf2 = qf2
+
+    def forward(self, *inputs):
+        """
+        :return: Tensor of shape (2, batch size, 1) with the Q-values of
+        both Q-functions.
+        """
+        if self.stacked_qf is not None:
+            return self.stacked_qf(*inputs)
+        return torch.stack([self.qf1(*inputs), self.qf2(*inputs)])
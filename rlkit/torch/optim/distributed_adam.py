@@ -0,0 +1,274 @@
+import torch
+import torch.distributed as dist
+from torch import optim
+
+from rlkit.torch import distributed
+from rlkit.torch.distributed import MPI
+
+
+class _MpiWork(object):
+    """
+    Non-blocking MPI allreduce of a CPU copy of a device buffer.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.host_buffer = buffer.cpu() if buffer.device.type != 'cpu' \
+            else buffer
+        self.request = MPI.COMM_WORLD.Iallreduce(
+            MPI.IN_PLACE, self.host_buffer.numpy(), op=MPI.SUM)
+
+    def wait(self):
+        self.request.Wait()
+        if self.host_buffer is not self.buffer:
+            self.buffer.copy_(self.host_buffer)
+
+
+def _allreduce_async(buffer):
+    if distributed.is_initialized():
+        return dist.all_reduce(buffer, async_op=True)
+    return _MpiWork(buffer)
+
+
+class _Bucket(object):
+    def __init__(self, index, params):
+        self.index = index
+        self.params = params
+        self.numel = sum(param.numel() for param in params)
+        self.buffer = None
+        self.work = None
+        self.ready = set()
+        # A gradient was accumulated again after the bucket was launched.
+        self.stale = False
+
+    def launch(self):
+        if self.buffer is None:
+            # The gradients, then one flag per parameter that is 1 if it has
+            # a gradient on this process.
+            self.buffer = self.params[0].new_empty(
+                self.numel + len(self.params))
+        has_grad = self.buffer[self.numel:]
+        offset = 0
+        for i, param in enumerate(self.params):
+            numel = param.numel()
+            if param.grad is None:
+                self.buffer[offset:offset + numel].zero_()
+                has_grad[i] = 0
+            else:
+                self.buffer[offset:offset + numel].copy_(
+                    param.grad.reshape(-1))
+                has_grad[i] = 1
+            offset += numel
+        self.work = _allreduce_async(self.buffer)
+        self.stale = False
+
+    def finish(self, world_size):
+        self.work.wait()
+        self.work = None
+        self.buffer.div_(world_size)
+        has_grad = (self.buffer[self.numel:] > 0).tolist()
+        offset = 0
+        for i, param in enumerate(self.params):
+            numel = param.numel()
+            if param.grad is not None:
+                param.grad.copy_(
+                    self.buffer[offset:offset + numel].view_as(param.grad))
+            elif has_grad[i]:
+                # Another process has a gradient, so this one has to step
+                # the parameter too, to keep the copies the same.
+                param.grad = self.buffer[offset:offset + numel].view_as(
+                    param).clone()
+            offset += numel
+
+
+class BucketedAllreduce(object):
+    """
+    Averages the gradients of some parameters over the processes of a
+    data-parallel run, see rlkit.torch.distributed. Uses the
+    torch.distributed process group if there is one, and MPI.COMM_WORLD
+    otherwise. With a single process, it does nothing.
+
+    The parameters are grouped into buckets of about `bucket_cap_mb`, in the
+    reverse order of `params`, which is roughly the order in which backward
+    computes their gradients. Once backward has accumulated the gradients of
+    all parameters of a bucket and of the buckets before it, the allreduce of
+    the bucket starts in the background while backward continues.
+    `synchronize` starts the remaining buckets, e.g. of parameters that got
+    no gradient, and waits for all of them.
+
+    The buckets start in the same order on every process, as long as every
+    process runs the same backward passes. A parameter that has a gradient on
+    some processes but not on others gets the average on all of them, so
+    that every process steps it. If backward accumulates into a bucket after
+    it started, on any process, `synchronize` reduces the bucket again on
+    all of them.
+    """
+
+    def __init__(self, params, bucket_cap_mb=25, overlap_with_backward=True):
+        """
+        :param overlap_with_backward: If False, all buckets are reduced in
+        `synchronize`, after backward.
+        """
+        params = [param for param in params if param.requires_grad]
+        self.world_size = distributed.get_world_size()
+        self.buckets = []
+        bucket = []
+        bucket_bytes = 0
+        for param in reversed(params):
+            if bucket and (
+                    bucket_bytes >= bucket_cap_mb * 2 ** 20
+                    or param.dtype != bucket[0].dtype
+                    or param.device != bucket[0].device
+            ):
+                self.buckets.append(_Bucket(len(self.buckets), bucket))
+                bucket = []
+                bucket_bytes = 0
+            bucket.append(param)
+            bucket_bytes += param.numel() * param.element_size()
+        if bucket:
+            self.buckets.append(_Bucket(len(self.buckets), bucket))
+        self._next_bucket = 0
+        self._armed = False
+        self._hook_handles = []
+        if (self.world_size > 1 and overlap_with_backward
+                and hasattr(torch.Tensor, 'register_post_accumulate_grad_hook')):
+            for bucket in self.buckets:
+                for param in bucket.params:
+                    self._hook_handles.append(
+                        param.register_post_accumulate_grad_hook(
+                            self._hook(bucket)))
+
+    def _hook(self, bucket):
+        def hook(param):
+            self._on_grad_ready(bucket, param)
+        return hook
+
+    def _on_grad_ready(self, bucket, param):
+        if not self._armed:
+            return
+        if bucket.index < self._next_bucket:
+            bucket.stale = True
+            return
+        bucket.ready.add(id(param))
+        while (self._next_bucket < len(self.buckets)
+               and len(self.buckets[self._next_bucket].ready)
+               == len(self.buckets[self._next_bucket].params)):
+            self.buckets[self._next_bucket].launch()
+            self._next_bucket += 1
+
+    def start(self):
+        """
+        Start a new round, e.g. when the gradients are zeroed. Only the
+        gradients accumulated after this are reduced in the background.
+        """
+        for bucket in self.buckets:
+            if bucket.work is not None:
+                # Collectives cannot be cancelled.
+                bucket.work.wait()
+                bucket.work = None
+            bucket.ready = set()
+            bucket.stale = False
+        self._next_bucket = 0
+        self._armed = True
+
+    def synchronize(self):
+        """
+        Replace the gradients by their averages over all processes.
+        """
+        if self.world_size > 1:
+            for bucket in self.buckets[self._next_bucket:]:
+                bucket.launch()
+            if self._hook_handles:
+                # Reduce a bucket again, including what backward accumulated
+                # after the first launch, if it is stale on any process, so
+                # that every process runs the same collectives.
+                stale = -distributed.all_reduce_min(
+                    [-int(bucket.stale) for bucket in self.buckets])
+                for bucket, bucket_stale in zip(self.buckets, stale):
+                    if bucket_stale:
+                        bucket.work.wait()
+                        bucket.launch()
+            for bucket in self.buckets:
+                bucket.finish(self.world_size)
+        for bucket in self.buckets:
+            bucket.ready = set()
+        self._next_bucket = 0
+        self._armed = False
+
+    def remove_hooks(self):
+        for handle in self._hook_handles:
+            handle.remove()
+        self._hook_handles = []
+
+
+class DistributedAdam(optim.Adam):
+    """
+    Adam on gradients averaged over the processes of a data-parallel run.
+
+    A replacement for MpiAdam that also works with a torch.distributed
+    process group, e.g. local processes started by
+    rlkit.torch.distributed.launch_data_parallel, and that reduces the
+    gradients in buckets during backward, see BucketedAllreduce, instead of
+    all of them at once after it. The parameters are broadcast from the
+    first process on construction, so all processes start from the same
+    networks.
+
+    Gradients are only reduced in the background after `zero_grad`, so
+    gradients that another loss accumulates before, e.g. the policy loss in
+    the critics, cost no communication.
+    """
+
+    def __init__(self, params, lr=1e-3, bucket_cap_mb=25,
+                 overlap_with_backward=True, gpu_id=None, **kwargs):
+        """
+        :param gpu_id: Ignored, for compatibility with MpiAdam.
+        :param kwargs: Passed on to torch.optim.Adam.
+        """
+        super().__init__(params, lr=lr, **kwargs)
+        self.bucket_cap_mb = bucket_cap_mb
+        self.overlap_with_backward = overlap_with_backward
+        self._create_reducer()
+        self.sync()
+
+    def _create_reducer(self):
+        self.reducer = BucketedAllreduce(
+            [param for group in self.param_groups for param in group['params']],
+            bucket_cap_mb=self.bucket_cap_mb,
+            overlap_with_backward=self.overlap_with_backward,
+        )
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['bucket_cap_mb'] = self.bucket_cap_mb
+        state['overlap_with_backward'] = self.overlap_with_backward
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._create_reducer()
+
+    def zero_grad(self, *args, **kwargs):
+        super().zero_grad(*args, **kwargs)
+        self.reducer.start()
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        assert closure is None, "DistributedAdam does not take a closure"
+        self.reducer.synchronize()
+        return super().step()
+
+    @torch.no_grad()
+    def sync(self):
+        """
+        Broadcast the parameters from the first process.
+        """
+        if self.reducer.world_size <= 1:
+            return
+        for group in self.param_groups:
+            for param in group['params']:
+                if distributed.is_initialized():
+                    dist.broadcast(param.data, 0)
+                else:
+                    data = param.data.cpu()
+                    MPI.COMM_WORLD.Bcast(data.numpy(), root=0)
+                    param.data.copy_(data)
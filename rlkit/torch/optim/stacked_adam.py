@@ -0,0 +1,56 @@
+import torch
+from torch.optim.optimizer import Optimizer
+
+
+class StackedAdam(Optimizer):
+    """
+    Adam for stacked parameters, e.g. those of a StackedMlp, whose first
+    dimension indexes independent networks.
+
+    Every network has its own step count, so this is the same as one Adam
+    per network. `step(indices)` only updates the networks with these
+    indices, and leaves the parameters and moments of the others unchanged,
+    like the Adams of networks that were not trained in a step.
+    """
+
+    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8):
+        super().__init__(params, dict(lr=lr, betas=betas, eps=eps))
+
+    @torch.no_grad()
+    def step(self, indices=None):
+        """
+        :param indices: LongTensor with the indices of the networks to
+        update. Defaults to all of them.
+        """
+        for group in self.param_groups:
+            beta1, beta2 = group['betas']
+            for param in group['params']:
+                if param.grad is None:
+                    continue
+                state = self.state[param]
+                if not state:
+                    state['step'] = torch.zeros(
+                        param.shape[0], device=param.device)
+                    state['exp_avg'] = torch.zeros_like(param)
+                    state['exp_avg_sq'] = torch.zeros_like(param)
+                if indices is None:
+                    rows = torch.arange(param.shape[0], device=param.device)
+                else:
+                    rows = indices
+                grad = param.grad[rows]
+                exp_avg = state['exp_avg'][rows].mul_(beta1).add_(
+                    grad, alpha=1 - beta1)
+                exp_avg_sq = state['exp_avg_sq'][rows].mul_(beta2).addcmul_(
+                    grad, grad, value=1 - beta2)
+                step = state['step'][rows] + 1
+                state['step'][rows] = step
+                state['exp_avg'][rows] = exp_avg
+                state['exp_avg_sq'][rows] = exp_avg_sq
+
+                shape = (-1,) + (1,) * (param.dim() - 1)
+                bias_correction1 = (1 - beta1 ** step).view(shape)
+                bias_correction2 = (1 - beta2 ** step).view(shape)
+                denom = (exp_avg_sq.sqrt() / bias_correction2.sqrt()).add_(
+                    group['eps'])
+                param[rows] = param[rows] - group['lr'] * (
+                    exp_avg / bias_correction1) / denom
@@ -1,3 +1,5 @@
+import contextlib
+
 import torch
 import numpy as np
 from torch import nn
@@ -34,6 +36,94 @@ def copy_model_params_from_to(source, target):
         target_param.data.copy_(param.data)
 
 
+class TargetNetworkUpdater(object):
+    """
+    Updates the parameters of many target networks at once.
+
+    Register every (source, target) pair once. A soft update then
+    Polyak-averages all registered parameters with two foreach calls instead
+    of two temporary tensors per parameter, and a hard update copies them.
+    Parameters shared by a source and its target, and targets registered
+    twice, are only updated once.
+
+    The parameters are collected when a pair is registered. Moving the
+    networks to another device keeps them, but replacing a network's
+    parameter objects afterwards does not.
+
+    Pairs may be registered with a key, e.g. their operator, so that a step
+    only updates the targets of the networks that were trained in it. For
+    stacked networks, e.g. StackedMlp, a step can likewise be restricted to
+    some indices of the first dimension.
+    """
+
+    def __init__(self, tau=1e-2, update_period=1, hard_update=False):
+        """
+        :param tau: Polyak averaging weight of the source parameters.
+        :param update_period: `step` updates every `update_period` steps.
+        :param hard_update: Copy the source parameters instead of averaging.
+        """
+        self.tau = tau
+        self.update_period = update_period
+        self.hard_update = hard_update
+        self._sources = []
+        self._targets = []
+        self._keys = []
+        self._target_ids = set()
+
+    def register(self, source, target, key=None):
+        for target_param, param in zip(
+                target.parameters(), source.parameters()):
+            if target_param is param or id(target_param) in self._target_ids:
+                continue
+            self._target_ids.add(id(target_param))
+            self._sources.append(param)
+            self._targets.append(target_param)
+            self._keys.append(key)
+
+    def step(self, n_train_steps, keys=None, indices=None):
+        if n_train_steps % self.update_period == 0:
+            self.update(keys, indices)
+
+    @torch.no_grad()
+    def update(self, keys=None, indices=None):
+        """
+        :param keys: If set, only update the pairs registered with these
+        keys.
+        :param indices: If set, only update these indices of the first
+        dimension of every parameter.
+        """
+        if keys is None:
+            targets, sources = self._targets, self._sources
+        else:
+            keys = set(keys)
+            pairs = [
+                (target_param, param) for target_param, param, key
+                in zip(self._targets, self._sources, self._keys)
+                if key in keys
+            ]
+            targets = [target_param for target_param, _ in pairs]
+            sources = [param for _, param in pairs]
+        if not targets:
+            return
+        if indices is not None:
+            for target_param, param in zip(targets, sources):
+                if self.hard_update:
+                    target_param[indices] = param[indices]
+                else:
+                    target_param[indices] = target_param[indices].lerp(
+                        param[indices], self.tau)
+            return
+        if self.hard_update:
+            for target_param, param in zip(targets, sources):
+                target_param.copy_(param)
+        elif hasattr(torch, '_foreach_mul_'):
+            torch._foreach_mul_(targets, 1.0 - self.tau)
+            torch._foreach_add_(targets, sources, alpha=self.tau)
+        else:
+            for target_param, param in zip(targets, sources):
+                target_param.mul_(1.0 - self.tau).add_(param, alpha=self.tau)
+
+
 def maximum_2d(t1, t2):
     # noinspection PyArgumentList
     return torch.max(
@@ -252,6 +342,39 @@ def set_device(gpu_id):
     torch.cuda.set_device(gpu_id)
 
 
+def _device_type():
+    return torch.device(device or 'cpu').type
+
+
+def autocast(enabled=True):
+    """
+    Context manager for bfloat16 automatic mixed precision on `device`.
+
+    Matrix multiplications inside run in bfloat16 while the parameters, and
+    so the optimizer, stay in float32. Run the backward pass after leaving
+    the context. With enabled=False, autocast is switched off inside, e.g.
+    for the output layer of a network.
+    """
+    if not hasattr(torch, 'autocast'):
+        assert not enabled, "Mixed precision needs torch >= 1.10"
+        return contextlib.nullcontext()
+    return torch.autocast(
+        _device_type(), dtype=torch.bfloat16, enabled=enabled)
+
+
+def is_autocast_enabled():
+    if not hasattr(torch, 'autocast'):
+        return False
+    device_type = _device_type()
+    try:
+        return torch.is_autocast_enabled(device_type)
+    except TypeError:
+        # Before torch 2.4, the CPU had its own function.
+        if device_type == 'cpu':
+            return torch.is_autocast_cpu_enabled()
+        return torch.is_autocast_enabled()
+
+
 # noinspection PyPep8Naming
 def FloatTensor(*args, torch_device=None, **kwargs):
     if torch_device is None:
@@ -260,11 +383,15 @@ def FloatTensor(*args, torch_device=None, **kwargs):
 
 
 def from_numpy(*args, **kwargs):
-    return torch.from_numpy(*args, **kwargs).float().to(device)
+    return torch.from_numpy(*args, **kwargs).to(device).float()
 
 
 def get_numpy(tensor):
-    return tensor.to('cpu').detach().numpy()
+    tensor = tensor.to('cpu').detach()
+    if tensor.dtype == getattr(torch, 'bfloat16', None):
+        # NumPy has no bfloat16, e.g. for outputs of autocast regions.
+        tensor = tensor.float()
+    return tensor.numpy()
 
 
 def randint(*sizes, torch_device=None, **kwargs):
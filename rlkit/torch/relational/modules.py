@@ -1,5 +1,8 @@
+import math
+
 from torch import nn as nn
 from torch.nn import Parameter, functional as F
+from torch.utils.checkpoint import checkpoint
 
 from rlkit.torch.core import PyTorchModule
 from rlkit.torch.networks import Mlp
@@ -77,9 +80,27 @@ class Attention(PyTorchModule):
                  layer_norm=True,
                  activation_fnx=F.leaky_relu,
                  softmax_temperature=1.0,
-                 residual_connection=False):
+                 residual_connection=False,
+                 attention_kernel='additive',
+                 query_chunk_size=16):
+        """
+        :param attention_kernel: How the attention is computed:
+            - 'additive': expands the queries, contexts and memories to
+              N x nQ x nV x nH x nE blocks. Memory grows with nQ * nV * nE.
+            - 'additive_chunked': the same attention. The logits are computed
+              for `query_chunk_size` queries at a time, and recomputed in
+              backward instead of keeping the expanded blocks. The memories
+              are summed with a batched matmul. Memory grows with
+              nQ * nV + query_chunk_size * nV * nE.
+            - 'dot_product': logits are dot products of the query heads and
+              the contexts, divided by sqrt(nE), computed with a batched
+              matmul. fc_logit is not used. A different model than the
+              additive attention, so its snapshots are not interchangeable.
+        The masking is the same for all kernels.
+        """
         # self.save_init_params(locals())
         super().__init__()
+        assert attention_kernel in ('additive', 'additive_chunked', 'dot_product'), attention_kernel
         self.fc_createheads = nn.Linear(embedding_dim, num_heads * embedding_dim)
         self.fc_logit = nn.Linear(embedding_dim, 1)
         self.fc_reduceheads = nn.Linear(num_heads * embedding_dim, embedding_dim)
@@ -87,6 +108,60 @@ class Attention(PyTorchModule):
         self.softmax_temperature = Parameter(torch.tensor(softmax_temperature))
         self.residual_connection=residual_connection
         self.activation_fnx = activation_fnx
+        self.attention_kernel = attention_kernel
+        self.query_chunk_size = query_chunk_size
+
+    def __setstate__(self, state):
+        # Snapshots from before the kernels were added use the additive one.
+        state.setdefault('attention_kernel', 'additive')
+        state.setdefault('query_chunk_size', 16)
+        super().__setstate__(state)
+
+    def _additive_logits(self, query, context):
+        """
+        N, nQ, nH, nE query, N, nV, nE context -> N, nQ, nV, nH logits
+        """
+        return self.fc_logit(torch.tanh(
+            context.unsqueeze(1).unsqueeze(3) + query.unsqueeze(2))).squeeze(-1)
+
+    def _chunked_additive_logits(self, query, context):
+        nQ = query.size(1)
+        chunks = []
+        for start in range(0, nQ, self.query_chunk_size):
+            query_chunk = query.narrow(
+                1, start, min(self.query_chunk_size, nQ - start))
+            if torch.is_grad_enabled():
+                # Only the logits of the chunk are kept for backward.
+                chunks.append(checkpoint(
+                    self._additive_logits, query_chunk, context,
+                    use_reentrant=False))
+            else:
+                chunks.append(self._additive_logits(query_chunk, context))
+        return torch.cat(chunks, dim=1)
+
+    def _matmul_attention(self, query, context, memory, mask):
+        """
+        Same result as the expanded path of `forward`, without N x nQ x nV x
+        nH x nE blocks.
+
+        :return: N, nQ, nH, nE attention heads
+        """
+        N, nQ, nH, nE = query.size()
+        if self.attention_kernel == 'dot_product':
+            # -> N, nQ, nV, nH
+            qc_logits = torch.einsum('nqhe,nve->nqvh', query, context) / math.sqrt(nE)
+        else:
+            qc_logits = self._chunked_additive_logits(query, context)
+
+        # N, nV -> N, 1, nV, 1
+        logit_mask = mask.unsqueeze(1).unsqueeze(3)
+
+        # The softmax runs in float32 under mixed precision.
+        attention_probs = F.softmax(qc_logits.float() / self.softmax_temperature * logit_mask + (-99999) * (1 - logit_mask), dim=2)
+
+        # N, nQ, nV, nH x N, nV, nE -> N, nQ, nH, nE
+        masked_probs = (attention_probs * logit_mask).to(memory.dtype)
+        return torch.einsum('nqvh,nve->nqhe', masked_probs, memory)
 
     def forward(self, query, context, memory, mask, return_attention=False):
         """
@@ -106,12 +181,19 @@ class Attention(PyTorchModule):
 
         nV = memory.size(1)
         if self.residual_connection:
-            residual_values= memory.clone()
+            residual_values = memory
         # assert len(mask.size()) == 2
 
         # N, nQ, nE -> N, nQ, nH, nE
         # if nH > 1:
         query = self.fc_createheads(query).view(N, nQ, nH, nE)
+        if self.attention_kernel != 'additive':
+            attention_heads = self.activation_fnx(
+                self._matmul_attention(query, context, memory, mask))
+            attention_result = self.fc_reduceheads(attention_heads.reshape(N, nQ, nH*nE))
+            if self.residual_connection:
+                attention_result = attention_result + residual_values
+            return attention_result
         # else:
         #     query = query.view(N, nQ, nH, nE)
 
@@ -133,7 +215,8 @@ class Attention(PyTorchModule):
         logit_mask = mask.unsqueeze(1).unsqueeze(3).unsqueeze(-1).expand_as(qc_logits)
 
         # qc_logits N, nQ, nV, nH, 1 -> N, nQ, nV, nH, 1
-        attention_probs = F.softmax(qc_logits / self.softmax_temperature * logit_mask + (-99999) * (1 - logit_mask), dim=2)
+        # The softmax runs in float32 under mixed precision.
+        attention_probs = F.softmax(qc_logits.float() / self.softmax_temperature * logit_mask + (-99999) * (1 - logit_mask), dim=2)
 
 
         # N, nV, nE -> N, nQ, nV, nH, nE
@@ -210,11 +293,19 @@ class AttentiveGraphToGraph(PyTorchModule):
                  embedding_dim=64,
                  num_heads=1,
                  layer_norm=True,
+                 attention_kernel='additive',
+                 query_chunk_size=16,
                  **kwargs):
+        """
+        :param attention_kernel: See Attention. 'additive_chunked' or
+        'dot_product' keep the memory manageable with dozens of vertices.
+        """
         # self.save_init_params(locals())
         super().__init__()
         self.fc_qcm = nn.Linear(embedding_dim, 3 * embedding_dim)
-        self.attention = Attention(embedding_dim, num_heads=num_heads, layer_norm=layer_norm)
+        self.attention = Attention(embedding_dim, num_heads=num_heads, layer_norm=layer_norm,
+                                   attention_kernel=attention_kernel,
+                                   query_chunk_size=query_chunk_size)
         self.layer_norm= nn.LayerNorm(3*embedding_dim) if layer_norm else None
 
     def forward(self, vertices, mask):
@@ -249,7 +340,12 @@ class AttentiveGraphPooling(PyTorchModule):
                  num_heads=1,
                  init_w=3e-3,
                  layer_norm=True,
-                 mlp_kwargs=None):
+                 mlp_kwargs=None,
+                 attention_kernel='additive',
+                 query_chunk_size=16):
+        """
+        :param attention_kernel: See Attention.
+        """
         # self.save_init_params(locals())
         super().__init__()
         self.fc_cm = nn.Linear(embedding_dim, 2 * embedding_dim)
@@ -258,7 +354,9 @@ class AttentiveGraphPooling(PyTorchModule):
         self.input_independent_query = Parameter(torch.Tensor(embedding_dim))
         self.input_independent_query.data.uniform_(-init_w, init_w)
         # self.num_heads = num_heads
-        self.attention = Attention(embedding_dim, num_heads=num_heads, layer_norm=layer_norm)
+        self.attention = Attention(embedding_dim, num_heads=num_heads, layer_norm=layer_norm,
+                                   attention_kernel=attention_kernel,
+                                   query_chunk_size=query_chunk_size)
 
         if mlp_kwargs is not None:
             self.proj = Mlp(**mlp_kwargs)
@@ -31,7 +31,7 @@ class ValueReNN(PyTorchModule):
                 mask=None,
                 return_stacked_softmax=False):
         if mask is None:
-            mask = torch.ones((obs.size()[0], self._mask)).to(ptu.device)
+            mask = ptu.ones((obs.size()[0], self._mask))
         vertices = self.input_module(obs, mask=mask)
         new_vertices = self.graph_propagation.forward(vertices, mask=mask)
         pooled_output = self.readout(new_vertices, mask=mask)
@@ -66,7 +66,7 @@ class QValueReNN(PyTorchModule):
         # if mask is None:
         #     mask = torch.ones((obs.size()[0], self._mask)).to(ptu.device)
         vertices = self.input_module(obs, actions=actions, mask=mask)
-        mask = torch.ones((obs.size()[0], vertices.shape[1])).to(ptu.device)
+        mask = ptu.ones((obs.size()[0], vertices.shape[1]))
         relational_block_embeddings = self.graph_propagation.forward(vertices, mask=mask)
         pooled_output = self.readout(relational_block_embeddings, mask=mask)
         assert pooled_output.size(-1) == 1
@@ -108,7 +108,7 @@ class PolicyReNN(PyTorchModule, TorchStochasticPolicy):
         # if mask is None:
         #     mask = torch.ones((obs.size()[0], self._mask)).to(ptu.device)
         vertices = self.input_module(obs, mask=mask)
-        mask = torch.ones((obs.size()[0], vertices.shape[1])).to(ptu.device)
+        mask = ptu.ones((obs.size()[0], vertices.shape[1]))
         response_embeddings = self.graph_propagation.forward(vertices, mask=mask)
 
         selected_objects = self.selection_attention(
@@ -140,3 +140,29 @@ class PolicyReNN(PyTorchModule, TorchStochasticPolicy):
         #
         # agent_info = dict()
         # return actions, agent_info
+
+
+def compile_relational_network(network, **compile_kwargs):
+    """
+    Compile a ValueReNN, QValueReNN or PolicyReNN in place with torch.compile.
+
+    The network is used as before, in the trainers and for rollouts through
+    eval_np or get_action(s). Rollouts and training use different batch
+    sizes, so each compiles its own graph on its first call. The
+    normalizer's statistics are inputs of the graph, not constants, so
+    updating the normalizer does not recompile. Pickled and copied networks,
+    e.g. snapshots, are not compiled.
+
+    Leave the debug checks of relational_util off, their comparisons
+    synchronize with the device on every call.
+
+    TorchScript is not supported: the preprocessing reads the normalizer's
+    numpy statistics, which torch.jit.trace would freeze.
+
+    :param compile_kwargs: Passed on to torch.compile, e.g. mode.
+    :return: The network.
+    """
+    assert hasattr(network, 'compile'), \
+        "Compiling modules in place requires torch >= 2.2"
+    network.compile(**compile_kwargs)
+    return network
@@ -3,6 +3,23 @@ import rlkit.torch.pytorch_util as ptu
 import numpy as np
 
 
+_debug_checks = False
+
+
+def set_debug_checks(enabled=True):
+    """
+    Turn on the consistency checks of the preprocessing functions, like the
+    reconstruction of the observation from the batched objects. The checks
+    compare tensors, which synchronizes with the device on every call and
+    breaks graphs of torch.compile, so they are off by default.
+    """
+    global _debug_checks
+    _debug_checks = enabled
+
+
+def debug_checks_enabled():
+    return _debug_checks
+
 
 def boxworld_preprocessing(obs,
                         mask=None,append_grid=None,nrow=9,ncol=9,nfeat=3):
@@ -49,15 +66,15 @@ def fetch_preprocessing_robot(obs,
         action_dim = 0
 
     if zero_state_preprocessing_fnx:
-        obs = torch.zeros(batch_size, environment_state_length).to(ptu.device)
+        obs = ptu.zeros(batch_size, environment_state_length)
 
     nB = (environment_state_length - shared_dim) / (object_dim + goal_dim)
 
     assert nB.is_integer(), (nB, environment_state_length, shared_dim, object_dim, goal_dim) # TODO: this checks if the lopped state still breaks down into the right object dimensions. The only worry here is whether the obs was messed up at the start of the function, e.g. the samples from the replay buffer incorrectly put the lopped state somewwhere.
 
     nB = int(nB)
-    # if mask is None:
-    mask = torch.ones(obs.shape[0], nB).to(ptu.get_device())
+    # The mask is ignored: every block is present, so masking would only
+    # multiply the state by ones.
 
     kwargs_state_length = shared_dim + object_dim * nB + goal_dim * nB
     assert kwargs_state_length == environment_state_length, F"{kwargs_state_length} != {environment_state_length}"
@@ -79,11 +96,12 @@ def fetch_preprocessing_robot(obs,
     # -> N x nB x nFg
     batched_goals = flattened_goals.view(batch_size, nB, goal_dim)
 
-    assert torch.eq(torch.cat((
-                         robot_state_flat.view(batch_size, -1),
-                         batched_objects.view(batch_size, -1),
-                         batched_goals.view(batch_size, -1)), dim=1),
-        obs).all()
+    if _debug_checks:
+        assert torch.eq(torch.cat((
+            robot_state_flat.view(batch_size, -1),
+            batched_objects.view(batch_size, -1),
+            batched_goals.view(batch_size, -1)), dim=1),
+            obs).all()
 
     # Broadcast robot_state
     # -> N x nB x nR
@@ -98,8 +116,6 @@ def fetch_preprocessing_robot(obs,
 
     batch_objgoals = torch.cat((batched_objects, batched_goals), dim=-1)
 
-    batch_shared = batch_shared.clone() * mask.unsqueeze(-1).expand_as(batch_shared)
-    batch_objgoals = batch_objgoals.clone() * mask.unsqueeze(-1).expand_as(batch_objgoals)
     # assert torch.unique(batch_shared, dim=1).shape == torch.Size([batch_size, 1, robot_dim]), (
     # torch.unique(batch_shared, dim=1).shape, torch.Size([batch_size, 1, robot_dim]))
 
@@ -124,7 +140,8 @@ def fetch_preprocessing_robot(obs,
     if actions is not None:
         batch_shared = torch.cat((actions.unsqueeze(1).expand(-1, nB, -1), batch_shared), dim=-1)
 
-    assert batch_shared.shape == torch.Size([batch_size, nB, shared_dim + action_dim]), (batch_shared.shape, torch.Size([batch_size, nB, shared_dim + action_dim]))
+    if _debug_checks:
+        assert batch_shared.shape == torch.Size([batch_size, nB, shared_dim + action_dim]), (batch_shared.shape, torch.Size([batch_size, nB, shared_dim + action_dim]))
 
     if return_combined_state:
         batched_combined_state = torch.cat((batch_shared, batch_objgoals), dim=-1)
@@ -165,7 +182,7 @@ def fetch_preprocessing(obs,
         action_dim = 0
 
     if zero_state_preprocessing_fnx:
-        obs = torch.zeros(batch_size, environment_state_length).to(ptu.device)
+        obs = ptu.zeros(batch_size, environment_state_length)
 
     nB = (environment_state_length - shared_dim) / (object_dim + goal_dim)
 
@@ -173,7 +190,7 @@ def fetch_preprocessing(obs,
 
     nB = int(nB)
     if mask is None:
-        mask = torch.ones(obs.shape[0], nB).to(ptu.get_device())
+        mask = ptu.ones(obs.shape[0], nB)
 
     kwargs_state_length = shared_dim + object_dim * nB + goal_dim * nB
     assert kwargs_state_length == environment_state_length, F"{kwargs_state_length} != {environment_state_length}"
@@ -195,11 +212,12 @@ def fetch_preprocessing(obs,
     # -> N x nB x nFg
     batched_goals = flattened_goals.view(batch_size, nB, goal_dim)
 
-    assert torch.eq(torch.cat((
-        robot_state_flat.view(batch_size, -1),
-        batched_objects.view(batch_size, -1),
-        batched_goals.view(batch_size, -1)), dim=1),
-        obs).all()
+    if _debug_checks:
+        assert torch.eq(torch.cat((
+            robot_state_flat.view(batch_size, -1),
+            batched_objects.view(batch_size, -1),
+            batched_goals.view(batch_size, -1)), dim=1),
+            obs).all()
 
     # Broadcast robot_state
     # -> N x nB x nR
@@ -214,8 +232,9 @@ def fetch_preprocessing(obs,
 
     batch_objgoals = torch.cat((batched_objects, batched_goals), dim=-1)
 
-    batch_shared = batch_shared.clone() * mask.unsqueeze(-1).expand_as(batch_shared)
-    batch_objgoals = batch_objgoals.clone() * mask.unsqueeze(-1).expand_as(batch_objgoals)
+    # The products are new tensors, the views of obs are not modified.
+    batch_shared = batch_shared * mask.unsqueeze(-1)
+    batch_objgoals = batch_objgoals * mask.unsqueeze(-1)
     # assert torch.unique(batch_shared, dim=1).shape == torch.Size([batch_size, 1, robot_dim]), (
     # torch.unique(batch_shared, dim=1).shape, torch.Size([batch_size, 1, robot_dim]))
 
@@ -240,7 +259,8 @@ def fetch_preprocessing(obs,
     if actions is not None:
         batch_shared = torch.cat((actions.unsqueeze(1).expand(-1, nB, -1), batch_shared), dim=-1)
 
-    assert batch_shared.shape == torch.Size([batch_size, nB, shared_dim + action_dim]), (batch_shared.shape, torch.Size([batch_size, nB, shared_dim + action_dim]))
+    if _debug_checks:
+        assert batch_shared.shape == torch.Size([batch_size, nB, shared_dim + action_dim]), (batch_shared.shape, torch.Size([batch_size, nB, shared_dim + action_dim]))
 
     if return_combined_state:
         batched_combined_state = torch.cat((batch_shared, batch_objgoals), dim=-1)
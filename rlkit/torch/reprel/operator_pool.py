@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+class OperatorThreadPool(object):
+    """
+    Runs the independent updates of the RePReL operators on a thread pool.
+
+    Torch releases the GIL inside its kernels, so the updates of several
+    operators can run at the same time. Every worker thread limits itself to
+    `intra_op_threads` threads for torch's intra-op parallelism, so that the
+    operators do not oversubscribe the cores. The calling thread waits for
+    all operators, so anything that is not per operator, like logging or
+    target network updates, happens after `map` returns.
+
+    With `num_threads` <= 1, the operators are updated one after another on
+    the calling thread.
+    """
+
+    def __init__(self, num_threads=0, intra_op_threads=None):
+        """
+        :param intra_op_threads: Defaults to torch's current number of
+        threads divided by `num_threads`.
+        """
+        self.num_threads = num_threads
+        if intra_op_threads is None:
+            intra_op_threads = max(
+                1, torch.get_num_threads() // max(num_threads, 1))
+        self.intra_op_threads = intra_op_threads
+        self._executor = None
+
+    def map(self, fn, operator_batch):
+        """
+        :return: Dict from operator to fn(operator, batch), in the order of
+        `operator_batch`.
+        """
+        if self.num_threads <= 1 or len(operator_batch) <= 1:
+            return OrderedDict(
+                (operator, fn(operator, batch))
+                for operator, batch in operator_batch.items()
+            )
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.num_threads)
+        num_threads = torch.get_num_threads()
+        try:
+            futures = OrderedDict(
+                (operator, self._executor.submit(
+                    self._run, fn, operator, batch))
+                for operator, batch in operator_batch.items()
+            )
+            return OrderedDict(
+                (operator, future.result())
+                for operator, future in futures.items()
+            )
+        finally:
+            # Depending on the parallel backend, the thread limit is global.
+            torch.set_num_threads(num_threads)
+
+    def _run(self, fn, operator, batch):
+        torch.set_num_threads(self.intra_op_threads)
+        return fn(operator, batch)
+
+    def shutdown(self):
+        """
+        Stop the worker threads. A later `map` starts new ones.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -1,11 +1,17 @@
 from rlkit.torch.torch_rl_algorithm import TorchTrainer
 import torch.optim as optim
 from torch import nn as nn
+import copy
 from collections import OrderedDict
 from rlkit.torch.core import np_to_pytorch_batch
+from rlkit.torch.metrics import EpochStatistics
 import torch
 import rlkit.torch.pytorch_util as ptu
 from rlkit.core.eval_util import create_stats_ordered_dict
+from rlkit.core.update_scheduler import TDErrorTracker
+from rlkit.torch.networks.mlp import StackedMlp
+from rlkit.torch.optim.stacked_adam import StackedAdam
+from rlkit.torch.reprel.operator_pool import OperatorThreadPool
 import numpy as np
 
 
@@ -24,7 +30,37 @@ class RePReLDQNTrainer(TorchTrainer):
             qf_criterion=None,
             discount=0.99,
             reward_scale=1.0,
+            replay_buffers=None,
+            stack_operator_qfs=False,
+            hard_target_update=False,
+            num_operator_threads=0,
+            intra_op_threads=None,
+            mixed_precision=False,
+            accumulate_statistics=False,
     ):
+        """
+        :param replay_buffers: Optional dict from operator to its replay
+        buffer. The TD errors of batches that carry `indices` are
+        passed to the `update_priorities` method of the operator's buffer.
+        :param stack_operator_qfs: Hold the operator Q-functions, which must
+        be Mlps with the same architecture, in one StackedMlp (and the target
+        Q-functions in another). Every train step then runs one forward pass
+        per batch size, e.g. one with the fixed schedule, and one backward
+        pass and one Adam step for all operators. The operator Mlps
+        stay in use by the policies and in the snapshot. Every operator keeps
+        its own Adam state, see StackedAdam, and operators without a batch in
+        a step are left unchanged, as without stacking.
+        :param hard_target_update: Copy the Q-functions into the targets every
+        `target_update_period` steps instead of Polyak averaging.
+        :param num_operator_threads: If > 1, the operators are updated
+        concurrently on this many threads, each using `intra_op_threads`
+        torch threads. See OperatorThreadPool.
+        :param mixed_precision: Compute the losses under bfloat16 autocast,
+        see rlkit.torch.pytorch_util.autocast.
+        :param accumulate_statistics: Record the statistics of every train
+        step on the device, see rlkit.torch.metrics.EpochStatistics, and
+        report them over the whole epoch instead of for its first batch.
+        """
         super().__init__()
         self.num_operators = len(operator_qfs)
         self.operator_qfs = operator_qfs
@@ -32,25 +68,73 @@ class RePReLDQNTrainer(TorchTrainer):
         self.learning_rate = learning_rate
         self.soft_target_tau = soft_target_tau
         self.target_update_period = target_update_period
-        self.qf_optimizers = {operator:optim.Adam(
-            qf.parameters(),
-            lr=self.learning_rate,
-        ) for operator, qf in self.operator_qfs.items()}
+        self.stack_operator_qfs = stack_operator_qfs
+        if stack_operator_qfs:
+            self.operators = list(self.operator_qfs.keys())
+            self._operator_index = {
+                operator: i for i, operator in enumerate(self.operators)
+            }
+            self.stacked_qf = StackedMlp(
+                [self.operator_qfs[op] for op in self.operators])
+            self.stacked_target_qf = StackedMlp(
+                [self.operator_target_qfs[op] for op in self.operators])
+            self.qf_optimizer = StackedAdam(
+                self.stacked_qf.parameters(),
+                lr=self.learning_rate,
+            )
+        else:
+            self.qf_optimizers = {operator:optim.Adam(
+                qf.parameters(),
+                lr=self.learning_rate,
+            ) for operator, qf in self.operator_qfs.items()}
+        self.target_network_updater = ptu.TargetNetworkUpdater(
+            tau=soft_target_tau,
+            update_period=target_update_period,
+            hard_update=hard_target_update,
+        )
+        if stack_operator_qfs:
+            self.target_network_updater.register(
+                self.stacked_qf, self.stacked_target_qf)
+        else:
+            for operator, qf in self.operator_qfs.items():
+                self.target_network_updater.register(
+                    qf, self.operator_target_qfs[operator], key=operator)
+        self.operator_pool = OperatorThreadPool(
+            num_operator_threads, intra_op_threads)
         self.discount = discount
         self.reward_scale = reward_scale
+        self.replay_buffers = replay_buffers or {}
         self.qf_criterion = qf_criterion or nn.MSELoss()
+        if hasattr(self.qf_criterion, 'reduction'):
+            # Per-sample losses, to be weighted for prioritized replay.
+            self._per_sample_qf_criterion = copy.copy(self.qf_criterion)
+            self._per_sample_qf_criterion.reduction = 'none'
+        else:
+            self._per_sample_qf_criterion = None
+        self.mixed_precision = mixed_precision
+        self.td_error_tracker = TDErrorTracker()
         self.eval_statistics = OrderedDict()
+        self.accumulate_statistics = accumulate_statistics
+        self.epoch_statistics = EpochStatistics()
         self._n_train_steps_total = 0
         self._need_to_update_eval_statistics = True
 
     def get_diagnostics(self):
+        if self.accumulate_statistics:
+            return self.epoch_statistics.get_diagnostics()
         return self.eval_statistics
 
     def end_epoch(self, epoch):
         self._need_to_update_eval_statistics = True
+        self.epoch_statistics.reset()
+
+    def end_training(self):
+        self.operator_pool.shutdown()
 
     @property
     def networks(self):
+        if self.stack_operator_qfs:
+            return [self.stacked_qf, self.stacked_target_qf]
         return list(self.operator_qfs.values()) \
                + list(self.operator_target_qfs.values())
 
@@ -70,21 +154,43 @@ class RePReLDQNTrainer(TorchTrainer):
 
 
     def train_from_torch(self, operator_batch):
-        for operator, batch in operator_batch.items():
-            qf = self.operator_qfs[operator]
-            qf_optimizer = self.qf_optimizers[operator]
-            target_qf = self.operator_target_qfs[operator]
+        if self.stack_operator_qfs:
+            return self._train_stacked(operator_batch)
+        operator_stats = self.operator_pool.map(
+            self._train_operator, operator_batch)
+        for eval_statistics in operator_stats.values():
+            self.eval_statistics.update(eval_statistics)
+
+        """
+        Soft Updates
+        """
+        self.target_network_updater.step(
+            self._n_train_steps_total, keys=operator_batch)
+        self._n_train_steps_total += 1
+        if self._need_to_update_eval_statistics:
+            self._need_to_update_eval_statistics = False
+
+    def _per_sample_qf_loss(self, y_pred, y_target):
+        assert self._per_sample_qf_criterion is not None, \
+            "Prioritized replay needs a qf_criterion with a reduction"
+        return self._per_sample_qf_criterion(y_pred, y_target)
 
-            rewards = batch['rewards'] * self.reward_scale
-            terminals = batch['terminals']
-            obs = batch['observations']
-            actions = batch['actions']
-            next_obs = batch['next_observations']
+    def _train_operator(self, operator, batch):
+        qf = self.operator_qfs[operator]
+        qf_optimizer = self.qf_optimizers[operator]
+        target_qf = self.operator_target_qfs[operator]
 
-            """
-            Compute loss
-            """
+        rewards = batch['rewards'] * self.reward_scale
+        terminals = batch['terminals']
+        obs = batch['observations']
+        actions = batch['actions']
+        next_obs = batch['next_observations']
 
+        """
+        Compute loss
+        """
+
+        with ptu.autocast(self.mixed_precision):
             target_q_values = target_qf(next_obs).detach().max(
                 1, keepdim=True
             )[0]
@@ -92,32 +198,170 @@ class RePReLDQNTrainer(TorchTrainer):
             y_target = y_target.detach()
             # actions is a one-hot vector
             y_pred = torch.sum(qf(obs) * actions, dim=1, keepdim=True)
-            qf_loss = self.qf_criterion(y_pred, y_target)
-
-            """
-            Soft target network updates
-            """
-            qf_optimizer.zero_grad()
-            qf_loss.backward()
-            qf_optimizer.step()
-
-            """
-            Soft Updates
-            """
-            if self._n_train_steps_total % self.target_update_period == 0:
-                ptu.soft_update_from_to(
-                    qf, target_qf, self.soft_target_tau
+            if 'weights' in batch:
+                # Importance sampling correction of prioritized replay.
+                qf_loss = torch.mean(
+                    batch['weights'] * self._per_sample_qf_loss(y_pred, y_target)
                 )
+            else:
+                qf_loss = self.qf_criterion(y_pred, y_target)
+        if 'indices' in batch and operator in self.replay_buffers:
+            self.replay_buffers[operator].update_priorities(
+                ptu.get_numpy(batch['indices']),
+                ptu.get_numpy(y_pred - y_target),
+            )
+
+        """
+        Soft target network updates
+        """
+        qf_optimizer.zero_grad()
+        qf_loss.backward()
+        qf_optimizer.step()
+        self.td_error_tracker.add(operator, qf_loss.detach())
+
+        """
+        Save some statistics for eval using just one batch.
+        """
+        eval_statistics = OrderedDict()
+        if self.accumulate_statistics:
+            self.epoch_statistics.add_scalar(f'{operator}/QF Loss', qf_loss)
+            self.epoch_statistics.add_values(
+                f'{operator}/Y Predictions', y_pred)
+        elif self._need_to_update_eval_statistics:
+            eval_statistics[f'{operator}/QF Loss'] = np.mean(ptu.get_numpy(qf_loss))
+            eval_statistics.update(create_stats_ordered_dict(
+                f'{operator}/Y Predictions',
+                ptu.get_numpy(y_pred),
+            ))
+        return eval_statistics
+
+    def _stacked_qf_losses(self, operators, operator_batch):
+        """
+        One StackedMlp pass for operators whose batches have the same size.
+
+        :return: The QF loss of every operator, and its TD errors and
+        predictions stacked along the first dimension.
+        """
+        indices = None
+        if len(operators) < len(self.operators):
+            indices = torch.tensor(
+                [self._operator_index[op] for op in operators],
+                device=self.stacked_qf.weights[0].device,
+            )
+
+        def stack(key):
+            return torch.stack([operator_batch[op][key] for op in operators])
+
+        rewards = stack('rewards') * self.reward_scale
+        terminals = stack('terminals')
+        obs = stack('observations')
+        actions = stack('actions')
+        next_obs = stack('next_observations')
 
-            """
-            Save some statistics for eval using just one batch.
-            """
-            if self._need_to_update_eval_statistics:
-                self.eval_statistics[f'{operator}/QF Loss'] = np.mean(ptu.get_numpy(qf_loss))
+        """
+        Compute loss
+        """
+
+        with ptu.autocast(self.mixed_precision):
+            target_q_values = self.stacked_target_qf(
+                next_obs, indices=indices).detach().max(2, keepdim=True)[0]
+            y_target = rewards + (1. - terminals) * self.discount * target_q_values
+            y_target = y_target.detach()
+            # actions is a one-hot vector
+            y_pred = torch.sum(
+                self.stacked_qf(obs, indices=indices) * actions,
+                dim=2,
+                keepdim=True,
+            )
+            td_errors = y_pred - y_target
+            if any('weights' in operator_batch[op] for op in operators):
+                # Importance sampling correction of prioritized replay.
+                weights = torch.stack([
+                    operator_batch[op]['weights']
+                    if 'weights' in operator_batch[op]
+                    else torch.ones_like(operator_batch[op]['rewards'])
+                    for op in operators
+                ])
+                qf_losses = torch.mean(
+                    weights * self._per_sample_qf_loss(y_pred, y_target),
+                    dim=(1, 2),
+                )
+            elif isinstance(self.qf_criterion, nn.MSELoss):
+                qf_losses = torch.mean(td_errors ** 2, dim=(1, 2))
+            else:
+                qf_losses = torch.stack([
+                    self.qf_criterion(y_pred[i], y_target[i])
+                    for i in range(len(operators))
+                ])
+        return qf_losses, td_errors, y_pred
+
+    def _train_stacked(self, operator_batch):
+        # Operators can only share a pass if their batches have the same
+        # size, which an UpdateScheduler with max_batch_size may not give.
+        groups = OrderedDict()
+        for op in self.operators:
+            if op in operator_batch:
+                batch_size = len(operator_batch[op]['rewards'])
+                groups.setdefault(batch_size, []).append(op)
+        operators, qf_losses, td_errors, y_pred = [], [], [], []
+        for group in groups.values():
+            group_qf_losses, group_td_errors, group_y_pred = \
+                self._stacked_qf_losses(group, operator_batch)
+            operators += group
+            qf_losses.append(group_qf_losses)
+            td_errors += list(group_td_errors)
+            y_pred += list(group_y_pred)
+        qf_losses = torch.cat(qf_losses)
+        trained = None
+        if len(operators) < len(self.operators):
+            trained = torch.tensor(
+                [self._operator_index[op] for op in operators],
+                device=self.stacked_qf.weights[0].device,
+            )
+        for i, operator in enumerate(operators):
+            if (
+                    'indices' in operator_batch[operator]
+                    and operator in self.replay_buffers
+            ):
+                self.replay_buffers[operator].update_priorities(
+                    ptu.get_numpy(operator_batch[operator]['indices']),
+                    ptu.get_numpy(td_errors[i]),
+                )
+
+        """
+        Update all operators at once
+        """
+        # The operator losses depend on disjoint parameters, so the gradient
+        # of their sum is the per-operator gradient.
+        self.qf_optimizer.zero_grad()
+        qf_losses.sum().backward()
+        self.qf_optimizer.step(trained)
+        detached_qf_losses = qf_losses.detach()
+        for i, operator in enumerate(operators):
+            self.td_error_tracker.add(operator, detached_qf_losses[i])
+
+        """
+        Soft Updates
+        """
+        self.target_network_updater.step(
+            self._n_train_steps_total, indices=trained)
+
+        """
+        Save some statistics for eval using just one batch.
+        """
+        if self.accumulate_statistics:
+            for i, operator in enumerate(operators):
+                self.epoch_statistics.add_scalar(
+                    f'{operator}/QF Loss', qf_losses[i])
+                self.epoch_statistics.add_values(
+                    f'{operator}/Y Predictions', y_pred[i])
+        elif self._need_to_update_eval_statistics:
+            np_qf_losses = ptu.get_numpy(qf_losses)
+            for i, operator in enumerate(operators):
+                self.eval_statistics[f'{operator}/QF Loss'] = np_qf_losses[i]
                 self.eval_statistics.update(create_stats_ordered_dict(
                     f'{operator}/Y Predictions',
-                    ptu.get_numpy(y_pred),
+                    ptu.get_numpy(y_pred[i]),
                 ))
-        self._n_train_steps_total += 1
-        if self._need_to_update_eval_statistics:
             self._need_to_update_eval_statistics = False
+        self._n_train_steps_total += 1
@@ -11,10 +11,17 @@ import rlkit.torch.pytorch_util as ptu
 from rlkit.core.eval_util import create_stats_ordered_dict
 from rlkit.torch.torch_rl_algorithm import TorchTrainer
 from rlkit.core.logging import add_prefix
+from rlkit.core.update_scheduler import TDErrorTracker
 import gtimer as gt
 from rlkit.torch.core import np_to_pytorch_batch
+from rlkit.torch.metrics import EpochStatistics
+from rlkit.torch.networks.mlp import TwinQ
 
+from rlkit.torch import distributed
+from rlkit.torch.optim.distributed_adam import DistributedAdam
 from rlkit.torch.optim.mpi_adam import MpiAdam
+from rlkit.torch.reprel.operator_pool import OperatorThreadPool
+from rlkit.torch.sac.sac import warn_mixed_precision
 
 SACLosses = namedtuple(
     'SACLosses',
@@ -22,6 +29,15 @@ SACLosses = namedtuple(
 )
 
 
+def _unique_parameters(modules):
+    # Modules may share submodules, e.g. a graph propagation network.
+    parameters = OrderedDict()
+    for module in modules:
+        for parameter in module.parameters():
+            parameters[id(parameter)] = parameter
+    return list(parameters.values())
+
+
 class RePReLSACTrainer(TorchTrainer, LossFunction):
     def __init__(
             self,
@@ -46,8 +62,38 @@ class RePReLSACTrainer(TorchTrainer, LossFunction):
 
             use_automatic_entropy_tuning=True,
             target_entropy=None,
-            gpu_id=0
+            gpu_id=0,
+            fuse_operator_updates=False,
+            hard_target_update=False,
+            num_operator_threads=0,
+            intra_op_threads=None,
+            mixed_precision=False,
+            accumulate_statistics=False,
     ):
+        """
+        :param fuse_operator_updates: Update all operators together. The two
+        critics of every operator are wrapped in a TwinQ and evaluated
+        together. The losses of all operators are summed and
+        back-propagated in two passes, and one optimizer each for the
+        policies, critics and alphas of all operators takes one step. With
+        MpiAdam, this is one allreduce per optimizer, with DistributedAdam
+        one per bucket. The networks and their snapshot are the same as
+        without it.
+        :param hard_target_update: Copy the critics into the target critics
+        every `target_update_period` steps instead of Polyak averaging.
+        :param num_operator_threads: If > 1, the operators are updated
+        concurrently on this many threads, each using `intra_op_threads`
+        torch threads. See OperatorThreadPool. Not supported with MpiAdam
+        or DistributedAdam across several processes, whose allreduces would
+        then run in a different order on every process.
+        :param mixed_precision: Compute the losses under bfloat16 autocast,
+        see rlkit.torch.pytorch_util.autocast. Warns off the CPU, see
+        rlkit.torch.sac.sac.warn_mixed_precision.
+        :param accumulate_statistics: Record the statistics of every train
+        step on the device, see rlkit.torch.metrics.EpochStatistics, and
+        report them over the whole epoch instead of for its first batch.
+        The policy statistics are then reported per operator.
+        """
         super().__init__()
         self.gpu_id = gpu_id
         self.num_operators = len(operator_policies)
@@ -57,8 +103,35 @@ class RePReLSACTrainer(TorchTrainer, LossFunction):
         self.operator_qf2s = operator_qf2s
         self.operator_target_qf1s = operator_target_qf1s
         self.operator_target_qf2s = operator_target_qf2s
+        self.fuse_operator_updates = fuse_operator_updates
+        if fuse_operator_updates:
+            self.operator_twin_qfs = {
+                operator: TwinQ(qf1, operator_qf2s[operator])
+                for operator, qf1 in operator_qf1s.items()
+            }
+            self.operator_twin_target_qfs = {
+                operator: TwinQ(target_qf1, operator_target_qf2s[operator])
+                for operator, target_qf1 in operator_target_qf1s.items()
+            }
         self.soft_target_tau = soft_target_tau
         self.target_update_period = target_update_period
+        self.target_network_updater = ptu.TargetNetworkUpdater(
+            tau=soft_target_tau,
+            update_period=target_update_period,
+            hard_update=hard_target_update,
+        )
+        if fuse_operator_updates:
+            for operator, twin_qf in self.operator_twin_qfs.items():
+                self.target_network_updater.register(
+                    twin_qf, self.operator_twin_target_qfs[operator],
+                    key=operator)
+        else:
+            for operator, qf1 in operator_qf1s.items():
+                self.target_network_updater.register(
+                    qf1, operator_target_qf1s[operator], key=operator)
+                self.target_network_updater.register(
+                    operator_qf2s[operator], operator_target_qf2s[operator],
+                    key=operator)
         self.use_automatic_entropy_tuning = use_automatic_entropy_tuning
         if self.use_automatic_entropy_tuning:
             if target_entropy is None:
@@ -68,41 +141,85 @@ class RePReLSACTrainer(TorchTrainer, LossFunction):
             else:
                 self.target_entropy = target_entropy
             self.log_alpha = {operator: ptu.zeros(1, requires_grad=True) for operator, policy in operator_policies.items()}
-            self.alpha_optimizers = {operator: optimizer_class(
-                [self.log_alpha[operator]],
-                lr=policy_lr,
-                gpu_id=self.gpu_id if ptu.get_mode() == "gpu_opt" else None
-            ) for operator, policy in operator_policies.items()}
+            if fuse_operator_updates:
+                self.alpha_optimizer = optimizer_class(
+                    list(self.log_alpha.values()),
+                    lr=policy_lr,
+                    gpu_id=self.gpu_id if ptu.get_mode() == "gpu_opt" else None
+                )
+            else:
+                self.alpha_optimizers = {operator: optimizer_class(
+                    [self.log_alpha[operator]],
+                    lr=policy_lr,
+                    gpu_id=self.gpu_id if ptu.get_mode() == "gpu_opt" else None
+                ) for operator, policy in operator_policies.items()}
 
         self.plotter = plotter
         self.render_eval_paths = render_eval_paths
 
         self.qf_criterion = nn.MSELoss()
 
-        self.policy_optimizers = {operator: optimizer_class(
-            policy.parameters(),
-            lr=policy_lr,
-            gpu_id=self.gpu_id if ptu.get_mode() == "gpu_opt" else None
-        ) for operator, policy in self.operator_policies.items()}
-        self.qf1_optimizers = {operator: optimizer_class(
-            qf1.parameters(),
-            lr=qf_lr,
-            gpu_id=self.gpu_id if ptu.get_mode() == "gpu_opt" else None
-        ) for operator, qf1 in self.operator_qf1s.items()}
-        self.qf2_optimizers = {operator: optimizer_class(
-            qf2.parameters(),
-            lr=qf_lr,
-            gpu_id=self.gpu_id if ptu.get_mode() == "gpu_opt" else None
-        ) for operator, qf2 in self.operator_qf2s.items()}
-
-        if optimizer_class is MpiAdam:
-            for operator, qf1 in self.qf1_optimizers.items(): qf1.sync()
-            for operator, qf2 in self.qf2_optimizers.items(): qf2.sync()
-            for operator, alpha in self.alpha_optimizers.items(): alpha.sync()
-            for operator, policy in self.policy_optimizers.items(): policy.sync()
+        if fuse_operator_updates:
+            self.policy_optimizer = optimizer_class(
+                _unique_parameters(self.operator_policies.values()),
+                lr=policy_lr,
+                gpu_id=self.gpu_id if ptu.get_mode() == "gpu_opt" else None
+            )
+            self.qf_optimizer = optimizer_class(
+                _unique_parameters(self.operator_twin_qfs.values()),
+                lr=qf_lr,
+                gpu_id=self.gpu_id if ptu.get_mode() == "gpu_opt" else None
+            )
+            self._policy_and_alpha_parameters = \
+                self.policy_optimizer.param_groups[0]['params']
+            if self.use_automatic_entropy_tuning:
+                self._policy_and_alpha_parameters = \
+                    self._policy_and_alpha_parameters \
+                    + list(self.log_alpha.values())
+            self._qf_parameters = self.qf_optimizer.param_groups[0]['params']
+            if optimizer_class is MpiAdam:
+                self.policy_optimizer.sync()
+                self.qf_optimizer.sync()
+                if self.use_automatic_entropy_tuning:
+                    self.alpha_optimizer.sync()
+        else:
+            self.policy_optimizers = {operator: optimizer_class(
+                policy.parameters(),
+                lr=policy_lr,
+                gpu_id=self.gpu_id if ptu.get_mode() == "gpu_opt" else None
+            ) for operator, policy in self.operator_policies.items()}
+            self.qf1_optimizers = {operator: optimizer_class(
+                qf1.parameters(),
+                lr=qf_lr,
+                gpu_id=self.gpu_id if ptu.get_mode() == "gpu_opt" else None
+            ) for operator, qf1 in self.operator_qf1s.items()}
+            self.qf2_optimizers = {operator: optimizer_class(
+                qf2.parameters(),
+                lr=qf_lr,
+                gpu_id=self.gpu_id if ptu.get_mode() == "gpu_opt" else None
+            ) for operator, qf2 in self.operator_qf2s.items()}
+
+            if optimizer_class is MpiAdam:
+                for operator, qf1 in self.qf1_optimizers.items(): qf1.sync()
+                for operator, qf2 in self.qf2_optimizers.items(): qf2.sync()
+                for operator, alpha in self.alpha_optimizers.items(): alpha.sync()
+                for operator, policy in self.policy_optimizers.items(): policy.sync()
+
+        assert not (
+            num_operator_threads > 1
+            and optimizer_class in (MpiAdam, DistributedAdam)
+            and distributed.get_world_size() > 1
+        ), "Use num_operator_threads with a single process"
+        self.operator_pool = OperatorThreadPool(
+            num_operator_threads, intra_op_threads)
 
         self.discount = discount
         self.reward_scale = reward_scale
+        warn_mixed_precision(mixed_precision)
+        self.mixed_precision = mixed_precision
+        self.accumulate_statistics = accumulate_statistics
+        self.epoch_statistics = EpochStatistics()
+        self.td_error_tracker = TDErrorTracker()
         self._n_train_steps_total = 0
         self._need_to_update_eval_statistics = True
         self.eval_statistics = OrderedDict()
@@ -116,20 +233,34 @@ class RePReLSACTrainer(TorchTrainer, LossFunction):
 
 
     def train_from_torch(self, operator_batch):
+        if self.fuse_operator_updates:
+            return self._train_fused(operator_batch)
         gt.blank_stamp()
-        stats={}
-        for operator, batch in operator_batch.items():
-            qf1 = self.operator_qf1s[operator]
-            qf2 = self.operator_qf2s[operator]
-            policy = self.operator_policies[operator]
-            target_qf1 = self.operator_target_qf1s[operator]
-            target_qf2 = self.operator_target_qf2s[operator]
+        stats = self.operator_pool.map(self._train_operator, operator_batch)
 
-            qf1_optimizer = self.qf1_optimizers[operator]
-            qf2_optimizer = self.qf2_optimizers[operator]
-            alpha_optimizer = self.alpha_optimizers[operator]
-            policy_optimizer = self.policy_optimizers[operator]
+        self.target_network_updater.step(
+            self._n_train_steps_total, keys=operator_batch)
 
+        if self._need_to_update_eval_statistics:
+            self.eval_statistics = stats
+            # Compute statistics using only one batch per epoch
+            self._need_to_update_eval_statistics = False
+        self._n_train_steps_total += 1
+        gt.stamp('sac training', unique=False)
+
+    def _train_operator(self, operator, batch):
+        qf1 = self.operator_qf1s[operator]
+        qf2 = self.operator_qf2s[operator]
+        policy = self.operator_policies[operator]
+        target_qf1 = self.operator_target_qf1s[operator]
+        target_qf2 = self.operator_target_qf2s[operator]
+
+        qf1_optimizer = self.qf1_optimizers[operator]
+        qf2_optimizer = self.qf2_optimizers[operator]
+        alpha_optimizer = self.alpha_optimizers[operator]
+        policy_optimizer = self.policy_optimizers[operator]
+
+        with ptu.autocast(self.mixed_precision):
             losses, _stats = self.compute_loss(
                 batch,
                 skip_statistics=not self._need_to_update_eval_statistics,
@@ -140,34 +271,68 @@ class RePReLSACTrainer(TorchTrainer, LossFunction):
                 target_qf2=target_qf2,
                 operator=operator
             )
-            stats[operator]=_stats
-            """
-            Update networks
-            """
-            if self.use_automatic_entropy_tuning:
-                alpha_optimizer.zero_grad()
-                losses.alpha_loss.backward()
-                alpha_optimizer.step()
-
-            policy_optimizer.zero_grad()
-            losses.policy_loss.backward()
-            policy_optimizer.step()
-
-            qf1_optimizer.zero_grad()
-            losses.qf1_loss.backward()
-            qf1_optimizer.step()
+        """
+        Update networks
+        """
+        if self.use_automatic_entropy_tuning:
+            alpha_optimizer.zero_grad()
+            losses.alpha_loss.backward()
+            alpha_optimizer.step()
+
+        policy_optimizer.zero_grad()
+        losses.policy_loss.backward()
+        policy_optimizer.step()
+
+        qf1_optimizer.zero_grad()
+        losses.qf1_loss.backward()
+        qf1_optimizer.step()
+
+        qf2_optimizer.zero_grad()
+        losses.qf2_loss.backward()
+        qf2_optimizer.step()
+        self.td_error_tracker.add(
+            operator, (losses.qf1_loss.detach() + losses.qf2_loss.detach()) / 2)
+        return _stats
+
+    def _train_fused(self, operator_batch):
+        gt.blank_stamp()
+        stats = {}
+        policy_and_alpha_loss = 0
+        qf_loss = 0
+        for operator, batch in operator_batch.items():
+            with ptu.autocast(self.mixed_precision):
+                losses, stats[operator] = self.compute_fused_loss(
+                    batch,
+                    skip_statistics=not self._need_to_update_eval_statistics,
+                    operator=operator,
+                )
+            policy_and_alpha_loss = policy_and_alpha_loss \
+                + losses.policy_loss + losses.alpha_loss
+            qf_loss = qf_loss + losses.qf1_loss + losses.qf2_loss
+            self.td_error_tracker.add(
+                operator,
+                (losses.qf1_loss.detach() + losses.qf2_loss.detach()) / 2,
+            )
 
-            qf2_optimizer.zero_grad()
-            losses.qf2_loss.backward()
-            qf2_optimizer.step()
+        """
+        Update networks
+        """
+        # Restricting the passes to their parameters keeps the policy loss
+        # out of the critics' gradients.
+        if self.use_automatic_entropy_tuning:
+            self.alpha_optimizer.zero_grad()
+        self.policy_optimizer.zero_grad()
+        self.qf_optimizer.zero_grad()
+        policy_and_alpha_loss.backward(
+            inputs=self._policy_and_alpha_parameters)
+        qf_loss.backward(inputs=self._qf_parameters)
+        if self.use_automatic_entropy_tuning:
+            self.alpha_optimizer.step()
+        self.policy_optimizer.step()
+        self.qf_optimizer.step()
 
-            if self._n_train_steps_total % self.target_update_period == 0:
-                ptu.soft_update_from_to(
-                    qf1, target_qf1, self.soft_target_tau
-                )
-                ptu.soft_update_from_to(
-                    qf2, target_qf2, self.soft_target_tau
-                )
+        self.target_network_updater.step(
+            self._n_train_steps_total, keys=operator_batch)
 
         if self._need_to_update_eval_statistics:
             self.eval_statistics = stats
@@ -241,33 +406,93 @@ class RePReLSACTrainer(TorchTrainer, LossFunction):
         Save some statistics for eval
         """
         eval_statistics = OrderedDict()
-        if not skip_statistics:
-            eval_statistics[f'{operator}/QF1 Loss'] = np.mean(ptu.get_numpy(qf1_loss))
-            eval_statistics[f'{operator}/QF2 Loss'] = np.mean(ptu.get_numpy(qf2_loss))
-            eval_statistics[f'{operator}/Policy Loss'] = np.mean(ptu.get_numpy(
-                policy_loss
-            ))
-            eval_statistics.update(create_stats_ordered_dict(
-                f'{operator}/Q1 Predictions',
-                ptu.get_numpy(q1_pred),
-            ))
-            eval_statistics.update(create_stats_ordered_dict(
-                f'{operator}/Q2 Predictions',
-                ptu.get_numpy(q2_pred),
-            ))
-            eval_statistics.update(create_stats_ordered_dict(
-                f'{operator}/Q Targets',
-                ptu.get_numpy(q_target),
-            ))
-            eval_statistics.update(create_stats_ordered_dict(
-                f'{operator}/Log Pis',
-                ptu.get_numpy(log_pi),
-            ))
-            policy_statistics = add_prefix(dist.get_diagnostics(), "policy/")
-            eval_statistics.update(policy_statistics)
-            if self.use_automatic_entropy_tuning:
-                eval_statistics[f'{operator}/Alpha'] = alpha.item()
-                eval_statistics[f'{operator}/Alpha Loss'] = alpha_loss.item()
+        if self.accumulate_statistics:
+            self._accumulate_loss_statistics(
+                operator, dist, log_pi, alpha, alpha_loss, policy_loss,
+                q1_pred, q2_pred, q_target, qf1_loss, qf2_loss,
+            )
+        elif not skip_statistics:
+            eval_statistics = self._loss_statistics(
+                operator, dist, log_pi, alpha, alpha_loss, policy_loss,
+                q1_pred, q2_pred, q_target, qf1_loss, qf2_loss,
+            )
+
+        loss = SACLosses(
+            policy_loss=policy_loss,
+            qf1_loss=qf1_loss,
+            qf2_loss=qf2_loss,
+            alpha_loss=alpha_loss,
+        )
+
+        return loss, eval_statistics
+
+    def compute_fused_loss(
+            self,
+            batch,
+            skip_statistics=False,
+            operator=None,
+    ) -> Tuple[SACLosses, LossStatistics]:
+        """
+        Same losses as compute_loss, with the operator's TwinQ critics.
+
+        Both critics are evaluated in one call, the target without building
+        a graph, and alpha is detached in the policy loss, so that the
+        policy and alpha losses can be back-propagated in one pass.
+        """
+        policy = self.operator_policies[operator]
+        twin_qf = self.operator_twin_qfs[operator]
+        twin_target_qf = self.operator_twin_target_qfs[operator]
+        rewards = batch['rewards']
+        terminals = batch['terminals']
+        obs = batch['observations']
+        actions = batch['actions']
+        next_obs = batch['next_observations']
+
+        """
+        Policy and Alpha Loss
+        """
+        dist = policy(obs)
+        new_obs_actions, log_pi = dist.rsample_and_logprob()
+        log_pi = log_pi.unsqueeze(-1)
+        if self.use_automatic_entropy_tuning:
+            alpha_loss = -(self.log_alpha[operator] * (log_pi + self.target_entropy).detach()).mean()
+            alpha = self.log_alpha[operator].exp().detach()
+        else:
+            alpha_loss = 0
+            alpha = 1
+
+        q_new_actions = torch.min(*twin_qf(obs, new_obs_actions))
+        policy_loss = (alpha * log_pi - q_new_actions).mean()
+
+        """
+        QF Loss
+        """
+        q1_pred, q2_pred = twin_qf(obs, actions)
+        with torch.no_grad():
+            next_dist = policy(next_obs)
+            new_next_actions, new_log_pi = next_dist.rsample_and_logprob()
+            new_log_pi = new_log_pi.unsqueeze(-1)
+            target_q_values = torch.min(
+                *twin_target_qf(next_obs, new_next_actions)
+            ) - alpha * new_log_pi
+            q_target = self.reward_scale * rewards + (1. - terminals) * self.discount * target_q_values
+        qf1_loss = self.qf_criterion(q1_pred, q_target)
+        qf2_loss = self.qf_criterion(q2_pred, q_target)
+
+        """
+        Save some statistics for eval
+        """
+        eval_statistics = OrderedDict()
+        if self.accumulate_statistics:
+            self._accumulate_loss_statistics(
+                operator, dist, log_pi, alpha, alpha_loss, policy_loss,
+                q1_pred, q2_pred, q_target, qf1_loss, qf2_loss,
+            )
+        elif not skip_statistics:
+            eval_statistics = self._loss_statistics(
+                operator, dist, log_pi, alpha, alpha_loss, policy_loss,
+                q1_pred, q2_pred, q_target, qf1_loss, qf2_loss,
+            )
 
         loss = SACLosses(
             policy_loss=policy_loss,
@@ -278,26 +503,95 @@ class RePReLSACTrainer(TorchTrainer, LossFunction):
 
         return loss, eval_statistics
 
+    def _loss_statistics(
+            self, operator, dist, log_pi, alpha, alpha_loss, policy_loss,
+            q1_pred, q2_pred, q_target, qf1_loss, qf2_loss,
+    ):
+        eval_statistics = OrderedDict()
+        eval_statistics[f'{operator}/QF1 Loss'] = np.mean(ptu.get_numpy(qf1_loss))
+        eval_statistics[f'{operator}/QF2 Loss'] = np.mean(ptu.get_numpy(qf2_loss))
+        eval_statistics[f'{operator}/Policy Loss'] = np.mean(ptu.get_numpy(
+            policy_loss
+        ))
+        eval_statistics.update(create_stats_ordered_dict(
+            f'{operator}/Q1 Predictions',
+            ptu.get_numpy(q1_pred),
+        ))
+        eval_statistics.update(create_stats_ordered_dict(
+            f'{operator}/Q2 Predictions',
+            ptu.get_numpy(q2_pred),
+        ))
+        eval_statistics.update(create_stats_ordered_dict(
+            f'{operator}/Q Targets',
+            ptu.get_numpy(q_target),
+        ))
+        eval_statistics.update(create_stats_ordered_dict(
+            f'{operator}/Log Pis',
+            ptu.get_numpy(log_pi),
+        ))
+        policy_statistics = add_prefix(dist.get_diagnostics(), "policy/")
+        eval_statistics.update(policy_statistics)
+        if self.use_automatic_entropy_tuning:
+            eval_statistics[f'{operator}/Alpha'] = alpha.item()
+            eval_statistics[f'{operator}/Alpha Loss'] = alpha_loss.item()
+        return eval_statistics
+
+    def _accumulate_loss_statistics(
+            self, operator, dist, log_pi, alpha, alpha_loss, policy_loss,
+            q1_pred, q2_pred, q_target, qf1_loss, qf2_loss,
+    ):
+        statistics = self.epoch_statistics
+        statistics.add_scalar(f'{operator}/QF1 Loss', qf1_loss)
+        statistics.add_scalar(f'{operator}/QF2 Loss', qf2_loss)
+        statistics.add_scalar(f'{operator}/Policy Loss', policy_loss)
+        statistics.add_values(f'{operator}/Q1 Predictions', q1_pred)
+        statistics.add_values(f'{operator}/Q2 Predictions', q2_pred)
+        statistics.add_values(f'{operator}/Q Targets', q_target)
+        statistics.add_values(f'{operator}/Log Pis', log_pi)
+        for name, values in dist.get_diagnostic_tensors().items():
+            statistics.add_values(f'{operator}/policy/{name}', values)
+        if self.use_automatic_entropy_tuning:
+            statistics.add_scalar(f'{operator}/Alpha', alpha)
+            statistics.add_scalar(f'{operator}/Alpha Loss', alpha_loss)
+
     def get_diagnostics(self):
         stats = super().get_diagnostics()
+        if self.accumulate_statistics:
+            stats.update(self.epoch_statistics.get_diagnostics())
+            return stats
         for operator, _ in self.operator_qf1s.items():
-            stats.update(self.eval_statistics[operator])
+            # Operators without a batch in the step have no statistics.
+            stats.update(self.eval_statistics.get(operator, {}))
         #stats.update(self.eval_statistics)
         return stats
 
     def end_epoch(self, epoch):
         self._need_to_update_eval_statistics = True
+        self.epoch_statistics.reset()
+
+    def end_training(self):
+        self.operator_pool.shutdown()
 
     @property
     def networks(self):
-        return list(self.operator_policies.values()) + \
+        networks = list(self.operator_policies.values()) + \
                list(self.operator_qf1s.values()) + \
                list(self.operator_qf2s.values()) + \
                list(self.operator_target_qf1s.values()) + \
                list(self.operator_target_qf2s.values())
+        if self.fuse_operator_updates:
+            # Last, so that stacked critics re-share their parameters.
+            networks += list(self.operator_twin_qfs.values()) + \
+                list(self.operator_twin_target_qfs.values())
+        return networks
 
     @property
     def optimizers(self):
+        if self.fuse_operator_updates:
+            optimizers = [self.policy_optimizer, self.qf_optimizer]
+            if self.use_automatic_entropy_tuning:
+                optimizers.append(self.alpha_optimizer)
+            return optimizers
         return list(self.policy_optimizers.values()) \
                + list(self.qf1_optimizers.values()) \
                + list(self.qf2_optimizers.values()) \
@@ -312,6 +606,10 @@ class RePReLSACTrainer(TorchTrainer, LossFunction):
             operator_target_qf2s=self.operator_target_qf2s,
             log_alpha=self.log_alpha,
             optimizers=dict(
+                alpha_optimizer=self.alpha_optimizer,
+                qf_optimizer=self.qf_optimizer,
+                policy_optimizer=self.policy_optimizer,
+            ) if self.fuse_operator_updates else dict(
                 alpha_optimizers=self.alpha_optimizers,
                 qf1_optimizers=self.qf1_optimizers,
                 qf2_optimizers=self.qf2_optimizers,
@@ -14,6 +14,7 @@ from rlkit.core.logging import add_prefix
 from rlkit.util.ml_util import PiecewiseLinearSchedule, ConstantSchedule
 import torch.nn.functional as F
 from rlkit.torch.networks import LinearTransform
+from rlkit.torch.sac.sac import warn_mixed_precision
 import time
 
 
@@ -96,7 +97,16 @@ class AWACTrainer(TorchTrainer):
             buffer_policy_reset_period=-1,
             num_buffer_policy_train_steps_on_reset=100,
             advantage_weighted_buffer_loss=True,
+            mixed_precision=False,
     ):
+        """
+        :param mixed_precision: Run the train step under bfloat16 autocast,
+        see rlkit.torch.pytorch_util.autocast. The backward passes are
+        interleaved with the loss computations here, so autocast is switched
+        off for every backward pass and optimizer step, see
+        `_optimizer_step`. Warns off the CPU, see
+        rlkit.torch.sac.sac.warn_mixed_precision.
+        """
         super().__init__()
         self.env = env
         self.policy = policy
@@ -131,6 +141,8 @@ class AWACTrainer(TorchTrainer):
 
         self.qf_criterion = nn.MSELoss()
         self.vf_criterion = nn.MSELoss()
+        warn_mixed_precision(mixed_precision)
+        self.mixed_precision = mixed_precision
 
         self.optimizers = {}
 
@@ -447,6 +459,18 @@ class AWACTrainer(TorchTrainer):
         self.eval_statistics.update(policy_statistics)
 
     def train_from_torch(self, batch, train=True, pretrain=False,):
+        with ptu.autocast(self.mixed_precision):
+            return self._train_from_torch(
+                batch, train=train, pretrain=pretrain)
+
+    def _optimizer_step(self, optimizer, loss, **backward_kwargs):
+        # Backward runs outside of autocast, as in the other trainers.
+        with ptu.autocast(False):
+            optimizer.zero_grad()
+            loss.backward(**backward_kwargs)
+            optimizer.step()
+
+    def _train_from_torch(self, batch, train=True, pretrain=False,):
         rewards = batch['rewards']
         terminals = batch['terminals']
         obs = batch['observations']
@@ -472,9 +496,7 @@ class AWACTrainer(TorchTrainer):
 
         if self.use_automatic_entropy_tuning:
             alpha_loss = -(self.log_alpha * (log_pi + self.target_entropy).detach()).mean()
-            self.alpha_optimizer.zero_grad()
-            alpha_loss.backward()
-            self.alpha_optimizer.step()
+            self._optimizer_step(self.alpha_optimizer, alpha_loss)
             alpha = self.log_alpha.exp()
         else:
             alpha_loss = 0
@@ -563,9 +585,7 @@ class AWACTrainer(TorchTrainer):
             kldiv = torch.distributions.kl.kl_divergence(dist, buffer_dist)
             beta_loss = -1*(beta*(kldiv-self.beta_epsilon).detach()).mean()
 
-            self.beta_optimizer.zero_grad()
-            beta_loss.backward()
-            self.beta_optimizer.step()
+            self._optimizer_step(self.beta_optimizer, beta_loss)
         else:
             beta = self.beta_schedule.get_value(self._n_train_steps_total)
 
@@ -682,9 +702,11 @@ class AWACTrainer(TorchTrainer):
                         buffer_policy_loss, buffer_train_logp_loss, buffer_train_mse_loss, _ = self.run_bc_batch(
                         self.replay_buffer.train_replay_buffer, self.buffer_policy)
 
-                    self.buffer_policy_optimizer.zero_grad()
-                    buffer_policy_loss.backward(retain_graph=True)
-                    self.buffer_policy_optimizer.step()
+                    self._optimizer_step(
+                        self.buffer_policy_optimizer,
+                        buffer_policy_loss,
+                        retain_graph=True,
+                    )
 
         if self.train_bc_on_rl_buffer:
             if self.advantage_weighted_buffer_loss:
@@ -715,23 +737,15 @@ class AWACTrainer(TorchTrainer):
         Update networks
         """
         if self._n_train_steps_total % self.q_update_period == 0:
-            self.qf1_optimizer.zero_grad()
-            qf1_loss.backward()
-            self.qf1_optimizer.step()
-
-            self.qf2_optimizer.zero_grad()
-            qf2_loss.backward()
-            self.qf2_optimizer.step()
+            self._optimizer_step(self.qf1_optimizer, qf1_loss)
+            self._optimizer_step(self.qf2_optimizer, qf2_loss)
 
         if self._n_train_steps_total % self.policy_update_period == 0 and self.update_policy:
-            self.policy_optimizer.zero_grad()
-            policy_loss.backward()
-            self.policy_optimizer.step()
+            self._optimizer_step(self.policy_optimizer, policy_loss)
 
         if self.train_bc_on_rl_buffer and self._n_train_steps_total % self.policy_update_period == 0 :
-            self.buffer_policy_optimizer.zero_grad()
-            buffer_policy_loss.backward()
-            self.buffer_policy_optimizer.step()
+            self._optimizer_step(
+                self.buffer_policy_optimizer, buffer_policy_loss)
 
 
 
@@ -110,6 +110,13 @@ class TanhGaussianPolicy(Mlp, TorchStochasticPolicy):
         h = obs
         for i, fc in enumerate(self.fcs):
             h = self.hidden_activation(fc(h))
+        if ptu.is_autocast_enabled():
+            # The distribution is computed at full precision.
+            with ptu.autocast(False):
+                return self._distribution(h.float())
+        return self._distribution(h)
+
+    def _distribution(self, h):
         mean = self.last_fc(h)
         if self.std is None:
             log_std = self.last_fc_log_std(h)
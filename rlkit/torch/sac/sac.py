@@ -1,3 +1,4 @@
+import warnings
 from collections import OrderedDict, namedtuple
 from typing import Tuple
 
@@ -9,12 +10,26 @@ from torch import nn as nn
 
 import rlkit.torch.pytorch_util as ptu
 from rlkit.core.eval_util import create_stats_ordered_dict
+from rlkit.torch.metrics import EpochStatistics
 from rlkit.torch.torch_rl_algorithm import TorchTrainer
 from rlkit.core.logging import add_prefix
 import gtimer as gt
 
 from rlkit.torch.optim.mpi_adam import MpiAdam
 
+
+def warn_mixed_precision(mixed_precision):
+    """
+    The held-out Q error of SAC with bfloat16 mixed precision is only shown
+    to match that of float32 on the CPU, by
+    scripts/benchmark_mixed_precision.py.
+    """
+    if mixed_precision and ptu._device_type() != 'cpu':
+        warnings.warn(
+            'Mixed precision SAC is only checked against float32 on the CPU, '
+            'run scripts/benchmark_mixed_precision.py on this device first.')
+
+
 SACLosses = namedtuple(
     'SACLosses',
     'policy_loss qf1_loss qf2_loss alpha_loss',
@@ -44,7 +59,17 @@ class SACTrainer(TorchTrainer, LossFunction):
 
             use_automatic_entropy_tuning=True,
             target_entropy=None,
+            mixed_precision=False,
+            accumulate_statistics=False,
     ):
+        """
+        :param mixed_precision: Compute the losses under bfloat16 autocast,
+        see rlkit.torch.pytorch_util.autocast. Warns off the CPU, see
+        `warn_mixed_precision`.
+        :param accumulate_statistics: Record the statistics of every train
+        step on the device, see rlkit.torch.metrics.EpochStatistics, and
+        report them over the whole epoch instead of for its first batch.
+        """
         super().__init__()
         self.env = env
         self.policy = policy
@@ -75,6 +100,10 @@ class SACTrainer(TorchTrainer, LossFunction):
 
         self.qf_criterion = nn.MSELoss()
         self.vf_criterion = nn.MSELoss()
+        warn_mixed_precision(mixed_precision)
+        self.mixed_precision = mixed_precision
+        self.accumulate_statistics = accumulate_statistics
+        self.epoch_statistics = EpochStatistics()
 
         self.policy_optimizer = optimizer_class(
             self.policy.parameters(),
@@ -106,10 +135,11 @@ class SACTrainer(TorchTrainer, LossFunction):
 
     def train_from_torch(self, batch):
         gt.blank_stamp()
-        losses, stats = self.compute_loss(
-            batch,
-            skip_statistics=not self._need_to_update_eval_statistics,
-        )
+        with ptu.autocast(self.mixed_precision):
+            losses, stats = self.compute_loss(
+                batch,
+                skip_statistics=not self._need_to_update_eval_statistics,
+            )
         """
         Update networks
         """
@@ -202,7 +232,21 @@ class SACTrainer(TorchTrainer, LossFunction):
         Save some statistics for eval
         """
         eval_statistics = OrderedDict()
-        if not skip_statistics:
+        if self.accumulate_statistics:
+            statistics = self.epoch_statistics
+            statistics.add_scalar('QF1 Loss', qf1_loss)
+            statistics.add_scalar('QF2 Loss', qf2_loss)
+            statistics.add_scalar('Policy Loss', policy_loss)
+            statistics.add_values('Q1 Predictions', q1_pred)
+            statistics.add_values('Q2 Predictions', q2_pred)
+            statistics.add_values('Q Targets', q_target)
+            statistics.add_values('Log Pis', log_pi)
+            for name, values in dist.get_diagnostic_tensors().items():
+                statistics.add_values('policy/' + name, values)
+            if self.use_automatic_entropy_tuning:
+                statistics.add_scalar('Alpha', alpha)
+                statistics.add_scalar('Alpha Loss', alpha_loss)
+        elif not skip_statistics:
             eval_statistics['QF1 Loss'] = np.mean(ptu.get_numpy(qf1_loss))
             eval_statistics['QF2 Loss'] = np.mean(ptu.get_numpy(qf2_loss))
             eval_statistics['Policy Loss'] = np.mean(ptu.get_numpy(
@@ -241,11 +285,15 @@ class SACTrainer(TorchTrainer, LossFunction):
 
     def get_diagnostics(self):
         stats = super().get_diagnostics()
-        stats.update(self.eval_statistics)
+        if self.accumulate_statistics:
+            stats.update(self.epoch_statistics.get_diagnostics())
+        else:
+            stats.update(self.eval_statistics)
         return stats
 
     def end_epoch(self, epoch):
         self._need_to_update_eval_statistics = True
+        self.epoch_statistics.reset()
 
     @property
     def networks(self):
@@ -0,0 +1,126 @@
+"""
+Benchmark the attention kernels of rlkit.torch.relational.modules.Attention.
+
+Builds GraphPropagation with AttentiveGraphToGraph blocks followed by
+AttentiveGraphPooling, as in the relational networks, for an increasing
+number of vertices (blocks), and reports for every attention kernel:
+  - the memory of the tensors autograd saves for backward, which dominates
+    the memory of a training step,
+  - the time of a training step (forward and backward),
+  - the maximum difference of the output to the 'additive' kernel (not
+    meaningful for 'dot_product', which is a different model).
+"""
+import argparse
+import copy
+import time
+
+import torch
+
+import rlkit.torch.pytorch_util as ptu
+from rlkit.torch.relational.modules import (
+    AttentiveGraphPooling,
+    GraphPropagation,
+)
+
+KERNELS = ['additive', 'additive_chunked', 'dot_product']
+
+
+class Network(torch.nn.Module):
+    def __init__(self, args):
+        super().__init__()
+        self.graph_propagation = GraphPropagation(
+            graph_module_kwargs=dict(
+                num_heads=args.num_heads,
+                embedding_dim=args.embedding_dim,
+            ),
+            layer_norm=True,
+            num_relational_blocks=args.num_relational_blocks,
+        )
+        self.readout = AttentiveGraphPooling(
+            embedding_dim=args.embedding_dim,
+            num_heads=args.num_heads,
+        )
+
+    def forward(self, vertices, mask):
+        return self.readout(self.graph_propagation(vertices, mask), mask)
+
+
+def set_kernel(network, kernel, query_chunk_size):
+    for module in network.modules():
+        if hasattr(module, 'attention_kernel'):
+            module.attention_kernel = kernel
+            module.query_chunk_size = query_chunk_size
+
+
+def saved_tensor_mb(fn):
+    """
+    :return: MB of the distinct tensors autograd saves for backward in `fn`.
+    """
+    storages = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        output = fn()
+    return output, sum(storages.values()) / 2 ** 20
+
+
+def benchmark(num_vertices, args):
+    torch.manual_seed(args.seed)
+    network = Network(args).to(ptu.device)
+    vertices = ptu.randn(args.batch_size, num_vertices, args.embedding_dim)
+    mask = ptu.ones(args.batch_size, num_vertices)
+    # Some padded blocks, as with fewer objects than `num_vertices`.
+    mask[:, num_vertices * 3 // 4:] = 0
+    reference = None
+    for kernel in KERNELS:
+        model = copy.deepcopy(network)
+        set_kernel(model, kernel, args.query_chunk_size)
+        output, memory_mb = saved_tensor_mb(lambda: model(vertices, mask))
+        output = output.detach()
+        if reference is None:
+            reference = output
+
+        def train_step():
+            model.zero_grad()
+            model(vertices, mask).pow(2).mean().backward()
+
+        train_step()
+        start = time.perf_counter()
+        for _ in range(args.num_steps):
+            train_step()
+        train_ms = 1000 * (time.perf_counter() - start) / args.num_steps
+        print('  {:>3} vertices {:<17} saved for backward {:>9.2f} MB, '
+              'train {:>9.3f} ms/step, output difference {:.2e}'.format(
+                  num_vertices,
+                  kernel,
+                  memory_mb,
+                  train_ms,
+                  (output - reference).abs().max().item(),
+              ))
+
+
+def main(args):
+    ptu.set_gpu_mode(args.gpu)
+    for num_vertices in args.num_vertices:
+        benchmark(num_vertices, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-vertices', type=int, nargs='+',
+                        default=[8, 16, 32, 64])
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--embedding-dim', type=int, default=64)
+    parser.add_argument('--num-heads', type=int, default=1)
+    parser.add_argument('--num-relational-blocks', type=int, default=3)
+    parser.add_argument('--query-chunk-size', type=int, default=16)
+    parser.add_argument('--num-steps', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--gpu', action='store_true', default=False)
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,140 @@
+"""
+Benchmark data-parallel RePReL SAC training with DistributedAdam.
+
+Starts `--num-processes` local processes with a gloo process group, see
+rlkit.torch.distributed.launch_data_parallel, and reports the time per
+gradient step of RePReLSACTrainer on the first process for:
+  - flat: one bucket reduced after backward, the communication pattern of
+    MpiAdam,
+  - bucketed: buckets of `--bucket-cap-mb` reduced during backward.
+A single process without communication is timed for reference. Every
+process gets its own batches of `--batch-size` transitions.
+"""
+import argparse
+import copy
+import functools
+import time
+
+import numpy as np
+import torch
+import torch.distributed as dist
+
+import rlkit.torch.pytorch_util as ptu
+from rlkit.torch import distributed
+from rlkit.torch.networks import ConcatMlp
+from rlkit.torch.optim.distributed_adam import DistributedAdam
+from rlkit.torch.reprel.reprel_sac import RePReLSACTrainer
+from rlkit.torch.sac.policies import TanhGaussianPolicy
+
+
+class _ActionSpace(object):
+    def __init__(self, action_dim):
+        self.shape = (action_dim,)
+
+
+class _Env(object):
+    def __init__(self, action_dim):
+        self.action_space = _ActionSpace(action_dim)
+
+
+def make_trainer(args, bucket_cap_mb, overlap_with_backward):
+    torch.manual_seed(args.seed)
+    operators = range(args.num_operators)
+
+    def qfs():
+        return {
+            operator: ConcatMlp(
+                hidden_sizes=args.hidden_sizes,
+                output_size=1,
+                input_size=args.obs_dim + args.action_dim,
+            )
+            for operator in operators
+        }
+
+    qf1s, qf2s = qfs(), qfs()
+    return RePReLSACTrainer(
+        _Env(args.action_dim),
+        operator_policies={
+            operator: TanhGaussianPolicy(
+                args.hidden_sizes, args.obs_dim, args.action_dim)
+            for operator in operators
+        },
+        operator_qf1s=qf1s,
+        operator_qf2s=qf2s,
+        operator_target_qf1s=copy.deepcopy(qf1s),
+        operator_target_qf2s=copy.deepcopy(qf2s),
+        optimizer_class=functools.partial(
+            DistributedAdam,
+            bucket_cap_mb=bucket_cap_mb,
+            overlap_with_backward=overlap_with_backward,
+        ),
+        fuse_operator_updates=args.fuse_operator_updates,
+    )
+
+
+def random_batch(args):
+    return {
+        operator: dict(
+            observations=np.random.randn(args.batch_size, args.obs_dim),
+            next_observations=np.random.randn(args.batch_size, args.obs_dim),
+            actions=np.random.uniform(
+                -1, 1, (args.batch_size, args.action_dim)),
+            rewards=np.random.randn(args.batch_size, 1),
+            terminals=np.zeros((args.batch_size, 1)),
+        )
+        for operator in range(args.num_operators)
+    }
+
+
+def benchmark(args, name, bucket_cap_mb, overlap_with_backward):
+    np.random.seed(args.seed + distributed.get_rank())
+    trainer = make_trainer(args, bucket_cap_mb, overlap_with_backward)
+    batches = [random_batch(args) for _ in range(args.num_steps + 5)]
+    for batch in batches[:5]:
+        trainer.train(batch)
+    if distributed.is_initialized():
+        dist.barrier()
+    start = time.perf_counter()
+    for batch in batches[5:]:
+        trainer.train(batch)
+    elapsed = time.perf_counter() - start
+    if distributed.is_main_process():
+        print('  {:<10} {} process(es) {:>10.3f} ms/step'.format(
+            name, distributed.get_world_size(),
+            1000 * elapsed / args.num_steps))
+
+
+def run(args):
+    ptu.set_gpu_mode(False)
+    if distributed.get_world_size() == 1:
+        benchmark(args, 'single', args.bucket_cap_mb, True)
+    else:
+        benchmark(args, 'flat', float('inf'), False)
+        benchmark(args, 'bucketed', args.bucket_cap_mb, True)
+
+
+def main(args):
+    print('RePReL SAC, {} operators, {}'.format(
+        args.num_operators,
+        'fused updates' if args.fuse_operator_updates else 'per operator'))
+    distributed.launch_data_parallel(run, 1, args=(args,))
+    distributed.launch_data_parallel(run, args.num_processes, args=(args,))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-processes', type=int, default=2)
+    parser.add_argument('--num-operators', type=int, default=4)
+    parser.add_argument('--fuse-operator-updates', action='store_true',
+                        default=False)
+    parser.add_argument('--bucket-cap-mb', type=float, default=1)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--obs-dim', type=int, default=67)
+    parser.add_argument('--action-dim', type=int, default=4)
+    parser.add_argument('--hidden-sizes', type=int, nargs='+',
+                        default=[256, 256, 256])
+    parser.add_argument('--num-steps', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    main(args)
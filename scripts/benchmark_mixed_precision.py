@@ -0,0 +1,245 @@
+"""
+Benchmark bfloat16 mixed precision training against float32.
+
+Trains two copies of the same networks on the same batches, one with
+`mixed_precision=True`, and reports the time per gradient step of both and
+the error of their Q-values on held-out data, averaged over several random
+seeds. All transitions are terminal and the reward is a fixed random
+function of the observation and action, so the Q-functions regress onto the
+same known target. The dimensions default
+to those of the taxi and office RePReL operators. The relational Attention
+modules are compared on their forward and backward passes.
+"""
+import argparse
+import copy
+import time
+
+import numpy as np
+import torch
+
+import rlkit.torch.pytorch_util as ptu
+from rlkit.torch.dqn.dqn import DQNTrainer
+from rlkit.torch.networks import ConcatMlp, Mlp
+from rlkit.torch.optim.mpi_adam import MpiAdam
+from rlkit.torch.relational.modules import AttentiveGraphToGraph
+from rlkit.torch.reprel.reprel_dqn import RePReLDQNTrainer
+from rlkit.torch.reprel.reprel_sac import RePReLSACTrainer
+from rlkit.torch.sac.policies import TanhGaussianPolicy
+
+
+class _ActionSpace(object):
+    def __init__(self, action_dim):
+        self.shape = (action_dim,)
+
+
+class _Env(object):
+    def __init__(self, action_dim):
+        self.action_space = _ActionSpace(action_dim)
+
+
+def random_batch(args, discrete, reward_weights):
+    if discrete:
+        actions = np.eye(args.action_dim)[
+            np.random.randint(0, args.action_dim, args.batch_size)]
+    else:
+        actions = np.random.uniform(-1, 1, (args.batch_size, args.action_dim))
+    observations = np.random.randint(
+        0, 2, (args.batch_size, args.obs_dim)).astype(np.float64)
+    rewards = np.tanh(
+        np.concatenate([observations, actions], axis=1) @ reward_weights)
+    return dict(
+        observations=observations,
+        next_observations=observations,
+        actions=actions,
+        rewards=rewards,
+        terminals=np.ones((args.batch_size, 1)),
+    )
+
+
+def make_dqn(args, mixed_precision):
+    torch.manual_seed(args.seed)
+    qf = Mlp(args.hidden_sizes, args.action_dim, args.obs_dim)
+    trainer = DQNTrainer(
+        qf, copy.deepcopy(qf), mixed_precision=mixed_precision)
+    return trainer, lambda obs, actions: (qf(obs) * actions).sum(
+        dim=1, keepdim=True)
+
+
+def make_reprel_dqn(args, mixed_precision):
+    torch.manual_seed(args.seed)
+    qfs = {
+        operator: Mlp(args.hidden_sizes, args.action_dim, args.obs_dim)
+        for operator in range(args.num_operators)
+    }
+    trainer = RePReLDQNTrainer(
+        qfs, copy.deepcopy(qfs), mixed_precision=mixed_precision)
+    return trainer, lambda obs, actions: (qfs[0](obs) * actions).sum(
+        dim=1, keepdim=True)
+
+
+def make_reprel_sac(args, mixed_precision):
+    torch.manual_seed(args.seed)
+    operators = range(args.num_operators)
+
+    def qfs():
+        return {
+            operator: ConcatMlp(
+                hidden_sizes=args.hidden_sizes,
+                output_size=1,
+                input_size=args.obs_dim + args.action_dim,
+            )
+            for operator in operators
+        }
+    qf1s, qf2s = qfs(), qfs()
+    trainer = RePReLSACTrainer(
+        _Env(args.action_dim),
+        operator_policies={
+            operator: TanhGaussianPolicy(
+                args.hidden_sizes, args.obs_dim, args.action_dim)
+            for operator in operators
+        },
+        operator_qf1s=qf1s,
+        operator_qf2s=qf2s,
+        operator_target_qf1s=copy.deepcopy(qf1s),
+        operator_target_qf2s=copy.deepcopy(qf2s),
+        optimizer_class=MpiAdam,
+        mixed_precision=mixed_precision,
+    )
+    return trainer, lambda obs, actions: qf1s[0](obs, actions)
+
+
+TRAINERS = dict(
+    dqn=(make_dqn, True, False),
+    reprel_dqn=(make_reprel_dqn, True, True),
+    reprel_sac=(make_reprel_sac, False, True),
+)
+
+
+def train_and_evaluate(name, args, mixed_precision):
+    """
+    :return: The time per gradient step in ms and the held-out Q error of
+    a trainer trained with the random seed `args.seed`.
+    """
+    make_trainer, discrete, multi_operator = TRAINERS[name]
+    np.random.seed(args.seed)
+    reward_weights = np.random.randn(args.obs_dim + args.action_dim, 1) \
+        / np.sqrt(args.obs_dim)
+    batches = [
+        random_batch(args, discrete, reward_weights)
+        for _ in range(args.num_steps)
+    ]
+    if multi_operator:
+        batches = [
+            {operator: batch for operator in range(args.num_operators)}
+            for batch in batches
+        ]
+    eval_batch = {
+        key: ptu.from_numpy(value) for key, value
+        in random_batch(args, discrete, reward_weights).items()
+    }
+    trainer, qf = make_trainer(args, mixed_precision)
+    torch.manual_seed(args.seed)
+    start = time.perf_counter()
+    for batch in batches:
+        trainer.train(batch)
+    elapsed = time.perf_counter() - start
+    with torch.no_grad():
+        q_values = qf(eval_batch['observations'], eval_batch['actions'])
+    error = torch.mean((q_values - eval_batch['rewards']) ** 2).item()
+    return 1000 * elapsed / args.num_steps, error
+
+
+def benchmark_trainer(name, args):
+    """
+    The held-out Q error varies a lot between random seeds, also between
+    the float32 and bfloat16 runs of one seed, so it is averaged over
+    `args.num_seeds` seeds. The ratio is the mean over the seeds of the
+    bfloat16 error divided by the float32 error of the same seed.
+    """
+    errors = {}
+    for mixed_precision in [False, True]:
+        times = []
+        errors[mixed_precision] = []
+        for seed in range(args.seed, args.seed + args.num_seeds):
+            seed_args = copy.copy(args)
+            seed_args.seed = seed
+            step_ms, error = train_and_evaluate(
+                name, seed_args, mixed_precision)
+            times.append(step_ms)
+            errors[mixed_precision].append(error)
+        print('  {:<12} {:<9} {:>10.3f} ms/step, held-out Q error '
+              '{:.5f} +- {:.5f}'.format(
+                  name,
+                  'bfloat16' if mixed_precision else 'float32',
+                  np.mean(times),
+                  np.mean(errors[mixed_precision]),
+                  np.std(errors[mixed_precision]),
+              ))
+    ratios = np.array(errors[True]) / np.array(errors[False])
+    print('  {:<12} bfloat16 / float32 held-out Q error {:.3f} '
+          '(min {:.3f}, max {:.3f} over {} seeds)'.format(
+              name, ratios.mean(), ratios.min(), ratios.max(),
+              args.num_seeds))
+
+
+def benchmark_attention(args):
+    torch.manual_seed(args.seed)
+    module = AttentiveGraphToGraph(embedding_dim=args.embedding_dim)
+    vertices = torch.randn(
+        args.batch_size, args.num_vertices, args.embedding_dim)
+    mask = torch.ones(args.batch_size, args.num_vertices)
+    outputs = {}
+    gradients = {}
+    for mixed_precision in [False, True]:
+        module.zero_grad()
+        start = time.perf_counter()
+        for _ in range(args.num_steps):
+            with ptu.autocast(mixed_precision):
+                output = module(vertices, mask)
+            output.float().sum().backward()
+        elapsed = time.perf_counter() - start
+        outputs[mixed_precision] = output.float().detach()
+        gradients[mixed_precision] = torch.cat([
+            parameter.grad.flatten() for parameter in module.parameters()
+            if parameter.grad is not None
+        ]) / args.num_steps
+        print('  {:<12} {:<9} {:>10.3f} ms/step'.format(
+            'attention',
+            'bfloat16' if mixed_precision else 'float32',
+            1000 * elapsed / args.num_steps,
+        ))
+    error = (outputs[True] - outputs[False]).abs().mean().item()
+    scale = outputs[False].abs().mean().item()
+    print('  {:<12} mean output difference {:.5f}, {:.2%} of the mean '
+          'output'.format('attention', error, error / scale))
+    error = torch.norm(gradients[True] - gradients[False]).item()
+    scale = torch.norm(gradients[False]).item()
+    print('  {:<12} relative gradient difference {:.2%}'.format(
+        'attention', error / scale))
+
+
+def main(args):
+    ptu.set_gpu_mode(False)
+    for name in args.trainers:
+        benchmark_trainer(name, args)
+    benchmark_attention(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trainers', nargs='+', default=list(TRAINERS),
+                        choices=list(TRAINERS))
+    parser.add_argument('--num-operators', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--obs-dim', type=int, default=30)
+    parser.add_argument('--action-dim', type=int, default=6)
+    parser.add_argument('--hidden-sizes', type=int, nargs='+',
+                        default=[256, 256])
+    parser.add_argument('--embedding-dim', type=int, default=64)
+    parser.add_argument('--num-vertices', type=int, default=8)
+    parser.add_argument('--num-steps', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--num-seeds', type=int, default=5)
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,92 @@
+"""
+Benchmark sampling one training step's minibatches for many operators.
+
+Compares calling random_batch and np_to_pytorch_batch once per operator
+buffer, as RePReLAlgorithm does by default, against MultiOperatorBatchSampler,
+which draws all indices at once and copies one staging block to the device.
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+import rlkit.torch.pytorch_util as ptu
+from rlkit.data_management.simple_replay_buffer import \
+    SimpleReplayBufferDiscreteAction
+from rlkit.torch.core import np_to_pytorch_batch
+from rlkit.torch.data_management.multi_operator_sampler import \
+    MultiOperatorBatchSampler
+
+
+def make_buffers(num_operators, args):
+    replay_buffers = {}
+    for operator in range(num_operators):
+        replay_buffer = SimpleReplayBufferDiscreteAction(
+            max_replay_buffer_size=args.buffer_size,
+            observation_dim=args.obs_dim,
+            action_dim=args.action_dim,
+            env_info_sizes={},
+        )
+        obs = np.random.randint(0, 2, (args.buffer_size + 1, args.obs_dim))
+        replay_buffer.add_path(dict(
+            observations=obs[:-1],
+            actions=np.random.randint(
+                0, args.action_dim, (args.buffer_size, 1)),
+            rewards=np.random.randn(args.buffer_size, 1),
+            next_observations=obs[1:],
+            terminals=np.zeros((args.buffer_size, 1), dtype=bool),
+            agent_infos=[{}] * args.buffer_size,
+            env_infos=[{}] * args.buffer_size,
+        ))
+        replay_buffers[operator] = replay_buffer
+    return replay_buffers
+
+
+def benchmark(name, sample, num_steps):
+    sample()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        sample()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    print('  {:<28} {:>10.3f} ms/step'.format(
+        name, 1000 * elapsed / num_steps))
+
+
+def main(args):
+    ptu.set_gpu_mode(torch.cuda.is_available())
+    for num_operators in args.num_operators:
+        print('{} operators'.format(num_operators))
+        replay_buffers = make_buffers(num_operators, args)
+        sampler = MultiOperatorBatchSampler(replay_buffers)
+
+        def per_operator():
+            return {
+                operator: np_to_pytorch_batch(
+                    replay_buffer.random_batch(args.batch_size))
+                for operator, replay_buffer in replay_buffers.items()
+            }
+
+        def single_pass():
+            return sampler.random_batches(args.batch_size)
+
+        benchmark('per-operator random_batch', per_operator, args.num_steps)
+        benchmark('MultiOperatorBatchSampler', single_pass, args.num_steps)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-operators', type=int, nargs='+',
+                        default=[2, 10, 50])
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--obs-dim', type=int, default=30)
+    parser.add_argument('--action-dim', type=int, default=6)
+    parser.add_argument('--buffer-size', type=int, default=int(1e4))
+    parser.add_argument('--num-steps', type=int, default=200)
+    args = parser.parse_args()
+
+    main(args)
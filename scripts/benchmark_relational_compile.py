@@ -0,0 +1,262 @@
+"""
+Benchmark torch.compile'd relational networks against eager ones.
+
+Builds the ValueReNN of the taxi graph examples and the QValueReNN and
+PolicyReNN of the fetch block construction examples, and reports the time
+of a training step (forward, backward and Adam step on a batch) and of a
+rollout step (one observation through eval_np or get_action) for:
+  - eager, with the debug checks of relational_util on (the old behavior),
+  - eager,
+  - compiled with compile_relational_network.
+The warm-up time, which includes compiling, is reported separately and the maximum difference between
+the eager and compiled outputs is printed.
+"""
+import argparse
+import copy
+import time
+
+import numpy as np
+import torch
+
+import rlkit.torch.pytorch_util as ptu
+from rlkit.torch.core import eval_np
+from rlkit.torch.data_management.normalizer import CompositeNormalizer
+from rlkit.torch.relational import relational_util
+from rlkit.torch.relational.InputModules import (
+    FetchInputPreprocessing,
+    VecToGraphInputPreprocessing,
+)
+from rlkit.torch.relational.modules import (
+    AttentiveGraphPooling,
+    GraphPropagation,
+)
+from rlkit.torch.relational.networks import (
+    PolicyReNN,
+    QValueReNN,
+    ValueReNN,
+    compile_relational_network,
+)
+from rlkit.torch.sac.policies import FlattenTanhGaussianPolicy
+
+SHARED_DIM = 10
+OBJECT_DIM = 15
+GOAL_DIM = 3
+LOP_STATE_DIM = 3
+
+
+def graph_propagation(args):
+    return GraphPropagation(
+        graph_module_kwargs=dict(
+            num_heads=args.num_heads,
+            embedding_dim=args.embedding_dim,
+        ),
+        layer_norm=True,
+        num_relational_blocks=args.num_relational_blocks,
+    )
+
+
+def make_value(args):
+    obs_dim = args.grid_dim + args.num_objects * args.object_dim
+    network = ValueReNN(
+        graph_propagation=graph_propagation(args),
+        readout=AttentiveGraphPooling(
+            embedding_dim=args.embedding_dim,
+            mlp_kwargs=dict(
+                hidden_sizes=args.hidden_sizes,
+                output_size=args.action_dim,
+                input_size=args.embedding_dim,
+            ),
+        ),
+        input_module=VecToGraphInputPreprocessing,
+        input_module_kwargs=dict(
+            normalizer=None,
+            shared_dim=args.grid_dim,
+            object_dim=args.object_dim,
+            embedding_dim=args.embedding_dim,
+        ),
+        mask=args.num_objects,
+    )
+    observations = np.random.randint(
+        0, 2, (args.batch_size, obs_dim)).astype(np.float32)
+
+    def loss(network, obs):
+        return (network(obs) ** 2).mean()
+
+    def rollout(network, obs):
+        return eval_np(network, obs)
+    return network, observations, loss, rollout
+
+
+def fetch_normalizer(args):
+    return CompositeNormalizer(
+        SHARED_DIM + OBJECT_DIM + GOAL_DIM,
+        args.action_dim,
+        default_clip_range=5,
+        reshape_blocks=True,
+        fetch_kwargs=dict(
+            lop_state_dim=LOP_STATE_DIM,
+            object_dim=OBJECT_DIM,
+            goal_dim=GOAL_DIM,
+        ),
+    )
+
+
+def fetch_observations(args):
+    obs_dim = SHARED_DIM + args.num_objects * (OBJECT_DIM + GOAL_DIM) \
+        + LOP_STATE_DIM
+    return np.random.randn(args.batch_size, obs_dim).astype(np.float32)
+
+
+def make_qf(args):
+    normalizer = fetch_normalizer(args)
+    network = QValueReNN(
+        graph_propagation=graph_propagation(args),
+        readout=AttentiveGraphPooling(
+            embedding_dim=args.embedding_dim,
+            mlp_kwargs=dict(
+                hidden_sizes=args.hidden_sizes,
+                output_size=1,
+                input_size=args.embedding_dim,
+            ),
+        ),
+        input_module=FetchInputPreprocessing,
+        input_module_kwargs=dict(
+            normalizer=normalizer,
+            object_total_dim=SHARED_DIM + OBJECT_DIM + GOAL_DIM
+            + args.action_dim,
+            embedding_dim=args.embedding_dim,
+        ),
+        mask=args.num_objects,
+        composite_normalizer=normalizer,
+    )
+    observations = fetch_observations(args)
+    actions = np.random.uniform(
+        -1, 1, (args.batch_size, args.action_dim)).astype(np.float32)
+
+    def loss(network, obs):
+        return (network(obs, ptu.from_numpy(actions[:len(obs)])) ** 2).mean()
+
+    def rollout(network, obs):
+        return eval_np(network, obs, actions[:1])
+    return network, observations, loss, rollout
+
+
+def make_policy(args):
+    normalizer = fetch_normalizer(args)
+    network = PolicyReNN(
+        graph_propagation=graph_propagation(args),
+        readout=AttentiveGraphPooling(embedding_dim=args.embedding_dim),
+        input_module=FetchInputPreprocessing,
+        input_module_kwargs=dict(
+            normalizer=normalizer,
+            object_total_dim=SHARED_DIM + OBJECT_DIM + GOAL_DIM,
+            embedding_dim=args.embedding_dim,
+        ),
+        mlp_class=FlattenTanhGaussianPolicy,
+        mlp_kwargs=dict(
+            hidden_sizes=args.hidden_sizes,
+            obs_dim=args.embedding_dim,
+            action_dim=args.action_dim,
+        ),
+        mask=args.num_objects,
+        composite_normalizer=normalizer,
+    )
+    observations = fetch_observations(args)
+
+    def loss(network, obs):
+        dist = network(obs)
+        actions, log_pi = dist.rsample_and_logprob()
+        return (log_pi + (actions ** 2).sum(dim=1)).mean()
+
+    def rollout(network, obs):
+        return network.get_action(obs[0])[0]
+    return network, observations, loss, rollout
+
+
+NETWORKS = dict(
+    value_renn=make_value,
+    qvalue_renn=make_qf,
+    policy_renn=make_policy,
+)
+
+
+def time_steps(fn, num_steps):
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        fn()
+    return 1000 * (time.perf_counter() - start) / num_steps
+
+
+def benchmark(name, args):
+    torch.manual_seed(args.seed)
+    np.random.seed(args.seed)
+    network, observations, loss, rollout = NETWORKS[name](args)
+    obs = ptu.from_numpy(observations)
+    eager_output = None
+    for mode in ['eager+checks', 'eager', 'compiled']:
+        relational_util.set_debug_checks(mode == 'eager+checks')
+        model = copy.deepcopy(network)
+        optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+
+        def train_step():
+            optimizer.zero_grad()
+            loss(model, obs).backward()
+            optimizer.step()
+
+        def rollout_step():
+            rollout(model, observations[:1])
+
+        if mode == 'compiled':
+            compile_relational_network(model)
+        # The first calls compile the graphs of the compiled network.
+        start = time.perf_counter()
+        if name == 'policy_renn':
+            output = model(obs).mean.detach()
+        else:
+            output = loss(model, obs).detach()
+        if eager_output is None:
+            eager_output = output
+        for _ in range(2):
+            train_step()
+            rollout_step()
+        warmup_ms = 1000 * (time.perf_counter() - start)
+        train_ms = time_steps(train_step, args.num_steps)
+        rollout_ms = time_steps(rollout_step, args.num_steps)
+        print('  {:<12} {:<13} train {:>8.3f} ms/step, rollout {:>7.3f} '
+              'ms/step, warm-up {:>8.0f} ms, output difference {:.2e}'.format(
+                  name,
+                  mode,
+                  train_ms,
+                  rollout_ms,
+                  warmup_ms,
+                  (output - eager_output).abs().max().item(),
+              ))
+    relational_util.set_debug_checks(False)
+
+
+def main(args):
+    ptu.set_gpu_mode(args.gpu)
+    for name in args.networks:
+        benchmark(name, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--networks', nargs='+', default=list(NETWORKS),
+                        choices=list(NETWORKS))
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--num-objects', type=int, default=3)
+    parser.add_argument('--grid-dim', type=int, default=25)
+    parser.add_argument('--object-dim', type=int, default=8)
+    parser.add_argument('--action-dim', type=int, default=4)
+    parser.add_argument('--embedding-dim', type=int, default=64)
+    parser.add_argument('--num-heads', type=int, default=1)
+    parser.add_argument('--num-relational-blocks', type=int, default=3)
+    parser.add_argument('--hidden-sizes', type=int, nargs='+',
+                        default=[256, 256])
+    parser.add_argument('--num-steps', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--gpu', action='store_true', default=False)
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,88 @@
+"""
+Benchmark how many transitions per second the replay buffers can insert.
+
+Compares the generic per-step ReplayBuffer.add_path loop against the
+vectorized SimpleReplayBuffer.add_path / add_paths, using paths shaped like
+the per-operator taxi paths that RePReLAlgorithm adds every train loop.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from rlkit.data_management.replay_buffer import ReplayBuffer
+from rlkit.data_management.simple_replay_buffer import \
+    SimpleReplayBufferDiscreteAction
+
+
+def make_paths(num_paths, path_length, obs_dim, action_dim):
+    paths = []
+    for _ in range(num_paths):
+        obs = np.random.randint(0, 2, (path_length + 1, obs_dim))
+        paths.append(dict(
+            observations=obs[:-1],
+            actions=np.random.randint(0, action_dim, (path_length, 1)),
+            rewards=np.random.randn(path_length, 1),
+            next_observations=obs[1:],
+            terminals=np.zeros((path_length, 1), dtype=bool),
+            agent_infos=[{}] * path_length,
+            env_infos=[{}] * path_length,
+        ))
+    return paths
+
+
+def benchmark(name, insert, paths, buffer_kwargs, num_repeats):
+    num_steps = sum(len(path['rewards']) for path in paths)
+    best = np.inf
+    for _ in range(num_repeats):
+        buffer = SimpleReplayBufferDiscreteAction(**buffer_kwargs)
+        start = time.perf_counter()
+        insert(buffer, paths)
+        best = min(best, time.perf_counter() - start)
+    print('{:<28} {:>14,.0f} insertions/s'.format(name, num_steps / best))
+
+
+def main(args):
+    paths = make_paths(args.num_paths, args.path_length, args.obs_dim,
+                       args.action_dim)
+    buffer_kwargs = dict(
+        max_replay_buffer_size=args.buffer_size,
+        observation_dim=args.obs_dim,
+        action_dim=args.action_dim,
+        env_info_sizes={},
+        pack_observations=args.pack_observations,
+        dedup_observations=args.dedup_observations,
+    )
+
+    def per_step(buffer, paths):
+        for path in paths:
+            ReplayBuffer.add_path(buffer, path)
+
+    def add_path(buffer, paths):
+        for path in paths:
+            buffer.add_path(path)
+
+    def add_paths(buffer, paths):
+        buffer.add_paths(paths)
+
+    benchmark('per-step add_sample', per_step, paths, buffer_kwargs,
+              args.num_repeats)
+    benchmark('vectorized add_path', add_path, paths, buffer_kwargs,
+              args.num_repeats)
+    benchmark('vectorized add_paths', add_paths, paths, buffer_kwargs,
+              args.num_repeats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-paths', type=int, default=100)
+    parser.add_argument('--path-length', type=int, default=20)
+    parser.add_argument('--obs-dim', type=int, default=30)
+    parser.add_argument('--action-dim', type=int, default=6)
+    parser.add_argument('--buffer-size', type=int, default=int(1e5))
+    parser.add_argument('--num-repeats', type=int, default=5)
+    parser.add_argument('--pack-observations', action='store_true')
+    parser.add_argument('--dedup-observations', action='store_true')
+    args = parser.parse_args()
+
+    main(args)
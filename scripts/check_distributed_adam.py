@@ -0,0 +1,125 @@
+"""
+Check DistributedAdam with gradient accumulation against a single process.
+
+Starts `--num-processes` local processes with a gloo process group, see
+rlkit.torch.distributed.launch_data_parallel. Every process accumulates the
+gradients of several backward passes before each step, and the processes
+differ in which networks get gradients in which pass, so that buckets that
+were already reduced during the first backward pass get more gradients on
+some processes but not on others. The first process then repeats the same
+updates with torch.optim.Adam on the gradients averaged over all processes
+by hand, and reports the largest difference of the parameters, which should
+be 0 up to rounding.
+"""
+import argparse
+
+import torch
+import torch.distributed as dist
+
+from rlkit.torch import distributed
+from rlkit.torch.optim.distributed_adam import DistributedAdam
+
+
+def make_networks(args):
+    torch.manual_seed(args.seed)
+    return [
+        torch.nn.Linear(args.dim, args.dim)
+        for _ in range(args.num_networks)
+    ]
+
+
+def backward_passes(networks, inputs, rank, step):
+    """
+    :return: The losses of the backward passes of a step on process `rank`,
+    with gradients for a different set of networks on every process.
+    """
+    losses = []
+    for i, x in enumerate(inputs):
+        loss = 0
+        for j, network in enumerate(networks):
+            if i == 0 and j <= rank:
+                loss = loss + network(x).pow(2).mean()
+            elif i > 0 and (j + i + step) % (rank + 2) == 0:
+                loss = loss + network(x).pow(2).mean()
+        if torch.is_tensor(loss):
+            losses.append(loss)
+    return losses
+
+
+def random_inputs(args):
+    return [
+        [
+            torch.randn(args.batch_size, args.dim)
+            for _ in range(args.num_backward_passes)
+        ]
+        for _ in range(args.num_steps)
+    ]
+
+
+def run(args):
+    rank = distributed.get_rank()
+    world_size = distributed.get_world_size()
+    networks = make_networks(args)
+    params = [param for network in networks for param in network.parameters()]
+    optimizer = DistributedAdam(params, lr=args.lr, bucket_cap_mb=1e-5)
+    torch.manual_seed(args.seed + 1 + rank)
+    inputs = random_inputs(args)
+    for step, step_inputs in enumerate(inputs):
+        optimizer.zero_grad()
+        for loss in backward_passes(networks, step_inputs, rank, step):
+            loss.backward()
+        optimizer.step()
+
+    all_inputs = [None] * world_size
+    dist.all_gather_object(all_inputs, inputs)
+    if rank != 0:
+        return
+    reference_networks = make_networks(args)
+    reference_params = [
+        param for network in reference_networks
+        for param in network.parameters()
+    ]
+    reference_optimizer = torch.optim.Adam(reference_params, lr=args.lr)
+    for step in range(args.num_steps):
+        gradients = [torch.zeros_like(param) for param in reference_params]
+        has_grad = [False] * len(reference_params)
+        for process in range(world_size):
+            reference_optimizer.zero_grad()
+            for loss in backward_passes(
+                    reference_networks, all_inputs[process][step], process,
+                    step):
+                loss.backward()
+            for i, param in enumerate(reference_params):
+                if param.grad is not None:
+                    gradients[i] += param.grad / world_size
+                    has_grad[i] = True
+        for param, gradient, param_has_grad in zip(
+                reference_params, gradients, has_grad):
+            param.grad = gradient if param_has_grad else None
+        reference_optimizer.step()
+    difference = max(
+        (param - reference_param).abs().max().item()
+        for param, reference_param in zip(params, reference_params)
+    )
+    print('{} processes, {} steps: largest parameter difference to a single '
+          'process {:.3e}'.format(world_size, args.num_steps, difference))
+    assert difference < 1e-5
+
+
+def main(args):
+    distributed.launch_data_parallel(run, args.num_processes, args=(args,))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-processes', type=int, default=2)
+    parser.add_argument('--num-networks', type=int, default=4)
+    parser.add_argument('--num-backward-passes', type=int, default=3)
+    parser.add_argument('--num-steps', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--dim', type=int, default=16)
+    parser.add_argument('--lr', type=float, default=1e-2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    main(args)